@@ -0,0 +1,268 @@
+"""
+Offline throughput benchmark for the ingestion pipelines.
+
+Drives the static pipeline (static_analysis_pipeline/ingest.py) with mock
+tweets and reviews from data_generators/twitter_gen.py and yelp_gen.py, and
+the live pipeline (live_pipeline/pipeline.py) with a sweep over the planned
+jobs, all against the fake clients in live_pipeline/clients.py and a
+throwaway SQLite DB. Every pipeline runs once per concurrency level: that many
+validator requests in flight and, for the live pipeline, scraper sessions.
+
+Each run records end-to-end items/s, the DB write rate and, per stage, items,
+busy time, a batch latency histogram and input queue depth. Results are
+written as JSON; --compare against an earlier file reports runs whose items/s
+dropped by more than --tolerance and exits non-zero.
+
+Run (from backend/):
+  python -m benchmarks.pipeline_bench --items 2000 --concurrency 1 4 16
+  python -m benchmarks.pipeline_bench --pipelines live --latency-ms 200
+  python -m benchmarks.pipeline_bench --compare benchmarks/results/base.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from db import migrations
+from db.run_state import RunState
+from db.storage import open_storage
+from db.url_dedupe import SeenStore
+from live_pipeline.clients import FakeAnthropic, FakeAsyncPerplexity, FakePerplexity, FakeProfile, FakeStagehand
+from live_pipeline.criticality_agent import CriticalityAgent
+from live_pipeline.observer_agent import ObserverAgent
+from live_pipeline.pipeline import run_sweep
+from live_pipeline.scraper_pool import ScraperPool
+from live_pipeline.validator_agent import ValidatorAgent
+from static_analysis_pipeline.data_generators import twitter_gen, yelp_gen
+from static_analysis_pipeline.data_source_twitter import TwitterAdapter
+from static_analysis_pipeline.data_source_yelp import YelpAdapter
+from static_analysis_pipeline.ingest import ingest
+from utils import StageStats, TokenBucket
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Rate limits are lifted so only concurrency and latency set the pace
+UNLIMITED_RATE = 1e9
+
+# Articles a fake search returns on average (FakeStagehand: 50-100% of max_items)
+ARTICLES_PER_JOB = 3.75
+
+STATIC_SOURCES = {
+    "twitter": (TwitterAdapter, twitter_gen),
+    "yelp": (YelpAdapter, yelp_gen),
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _open_db(tmp: Path):
+    path = tmp / "app.db"
+    conn = migrations.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    return open_storage(f"sqlite:///{path}")
+
+
+def _agents(profile: FakeProfile, concurrency: int):
+    validator = ValidatorAgent(
+        client=FakePerplexity(profile),
+        async_client=FakeAsyncPerplexity(profile),
+        concurrency=concurrency,
+        rate_per_sec=UNLIMITED_RATE,
+    )
+    # no classification cache: every item pays for a model call
+    crit = CriticalityAgent(use_cache=False, client=FakeAnthropic(profile))
+    return validator, crit
+
+
+def _result(pipeline: str, concurrency: int, items: int, wall_s: float,
+            db_rows: int, stages: Dict[str, StageStats], clients: Dict[str, Any]) -> Dict[str, Any]:
+    write = stages["write"]
+    return {
+        "pipeline": pipeline,
+        "concurrency": concurrency,
+        "items": items,
+        "wall_s": round(wall_s, 3),
+        "items_per_s": round(items / wall_s, 1) if wall_s > 0 else None,
+        "db_rows": db_rows,
+        "db_rows_per_s": round(db_rows / wall_s, 1) if wall_s > 0 else None,
+        "db_rows_per_write_s": round(db_rows / write.busy_s, 1) if write.busy_s > 0 else None,
+        "stages": {name: s.as_dict() for name, s in stages.items()},
+        "clients": clients,
+    }
+
+
+async def bench_static(source: str, concurrency: int, args, tmp: Path) -> Dict[str, Any]:
+    adapter_cls, gen = STATIC_SOURCES[source]
+    random.seed(args.seed)
+    records = gen.generate_batch(args.items)
+    for i, r in enumerate(records):
+        r["id"] = i   # generator ids are random and may collide
+
+    path = tmp / f"{source}.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+    profile = FakeProfile(latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed)
+    validator, crit = _agents(profile, concurrency)
+    db = _open_db(tmp)
+    run = RunState(source, input_id=str(path), resume=False, path=str(tmp / "run_state.db"))
+
+    timings: Dict[str, StageStats] = {}
+
+    t0 = time.monotonic()
+    out = await ingest(
+        str(path), adapter_cls(), validator=validator, observer=ObserverAgent(),
+        crit=crit, db=db, run=run, batch_size=args.batch_size, timings=timings,
+    )
+    wall_s = time.monotonic() - t0
+
+    return _result(
+        source, concurrency, len(records), wall_s, out["truth"] + out["posts"], timings,
+        {"perplexity": validator.async_client.stats(), "anthropic": crit.client.stats()},
+    )
+
+
+def _live_jobs(n_items: int) -> List[Dict[str, Any]]:
+    # numbered copies of the planned jobs, so every search finds fresh articles
+    planned = ObserverAgent().plan_all_queries()
+    n_jobs = max(1, math.ceil(n_items / ARTICLES_PER_JOB))
+    return [
+        dict(planned[i % len(planned)], query=f"{planned[i % len(planned)]['query']} #{i // len(planned)}")
+        for i in range(n_jobs)
+    ]
+
+
+async def bench_live(concurrency: int, args, tmp: Path) -> Dict[str, Any]:
+    profile = FakeProfile(latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed)
+    validator, crit = _agents(profile, concurrency)
+    browser = FakeStagehand(profile)
+    pool = ScraperPool(size=concurrency, client_factory=lambda: browser)
+    db = _open_db(tmp)
+    seen = SeenStore(path=str(tmp / "seen.db"))
+    run = RunState("live_news", input_id="bench", resume=False, path=str(tmp / "run_state.db"))
+    limiter = TokenBucket(rate_per_sec=UNLIMITED_RATE, capacity=concurrency)
+    timings: Dict[str, StageStats] = {}
+
+    await pool.start()
+    try:
+        # the fake's navigate latency stands in for page settling
+        pool.set_params(max_items=5, dom_settle_seconds=0)
+        t0 = time.monotonic()
+        stats = await run_sweep(
+            _live_jobs(args.items), limiter=limiter, pool=pool, observer=ObserverAgent(),
+            validator=validator, crit=crit, db=db, seen=seen, run=run, timings=timings,
+        )
+        wall_s = time.monotonic() - t0
+    finally:
+        await pool.end()
+
+    return _result(
+        "live", concurrency, stats["scraped"], wall_s, stats["truth"] + stats["posts"], timings,
+        {"stagehand": browser.stats(), "perplexity": validator.async_client.stats(), "anthropic": crit.client.stats()},
+    )
+
+
+async def run_all(args) -> List[Dict[str, Any]]:
+    results = []
+    for pipeline in args.pipelines:
+        for level in args.concurrency:
+            with tempfile.TemporaryDirectory(prefix="streetsense-bench-") as d:
+                log = io.StringIO()
+                # the pipelines print per item; keep the report readable
+                with contextlib.redirect_stdout(sys.stderr if args.verbose else log):
+                    if pipeline == "live":
+                        r = await bench_live(level, args, Path(d))
+                    else:
+                        r = await bench_static(pipeline, level, args, Path(d))
+            results.append(r)
+            slowest = max(r["stages"].items(), key=lambda kv: kv[1]["busy_s"])[0]
+            print(f"{pipeline:8} c={level:<3} {r['items']:6} items  {r['wall_s']:8.2f}s  "
+                  f"{r['items_per_s'] or 0:8.1f} items/s  {r['db_rows_per_s'] or 0:8.1f} rows/s  "
+                  f"busiest stage: {slowest}")
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Runs whose items/s fell more than `tolerance` (fraction) below the
+    baseline run with the same pipeline and concurrency.
+    """
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    before = {(r["pipeline"], r["concurrency"]): r for r in baseline["runs"]}
+
+    regressions = []
+    for r in results:
+        b = before.get((r["pipeline"], r["concurrency"]))
+        if b is None or not b.get("items_per_s") or r["items_per_s"] is None:
+            continue
+        change = r["items_per_s"] / b["items_per_s"] - 1
+        line = f"{r['pipeline']} c={r['concurrency']}: {b['items_per_s']} -> {r['items_per_s']} items/s ({change:+.0%})"
+        print(line)
+        if change < -tolerance:
+            regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipelines offline on fake clients")
+    parser.add_argument("--pipelines", nargs="+", default=["twitter", "yelp", "live"],
+                        choices=["twitter", "yelp", "live"])
+    parser.add_argument("--items", type=int, default=1000, help="input items per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-size", type=int, default=100, help="static pipeline batch size")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="median fake client latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="results file (default benchmarks/results/<utc time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed items/s drop vs --compare")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline output (on stderr)")
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    results = asyncio.run(run_all(args))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{started:%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "meta": {
+            "started_at": started.isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "verbose")},
+        },
+        "runs": results,
+    }, indent=2), encoding="utf-8")
+    print("Results:", out)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
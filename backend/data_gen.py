@@ -20,7 +20,7 @@ import math
 import random
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
-from db.db_writer import DBWriter
+from db.storage import open_storage
 
 # -------------------------
 # Config (London-ish bounds)
@@ -32,7 +32,7 @@ BOUNDS = {
     "max_lng": 0.45,
 }
 
-db = DBWriter()
+db = open_storage()
 
 
 CATEGORIES = [
@@ -151,39 +151,6 @@ def blend_truth(lat: float, lng: float, anchors: List[Anchor], sigma_m: float) -
     return out
 
 
-# -------------------------
-# DB hook (EDIT THIS)
-# -------------------------
-import sqlite3
-from pathlib import Path
-import time
-
-def upsert_truth(lat: float, lng: float, truth: Dict[str, float]) -> None:
-    # IMPORTANT: your DB uses column name "long" not "lng"
-    conn = sqlite3.connect(db.path)
-    cur = conn.cursor()
-
-    # Ensure row exists
-    cur.execute("INSERT OR IGNORE INTO truth (lat, long) VALUES (?, ?)", (lat, lng))
-
-    # Update all category columns
-    cols = ", ".join([f"{c} = ?" for c in CATEGORIES] + ["updated_at = CURRENT_TIMESTAMP"])
-    values = [float(truth[c]) for c in CATEGORIES] + [lat, lng]
-
-    cur.execute(
-        f"""
-        UPDATE truth
-        SET {cols}
-        WHERE lat = ? AND long = ?
-        """,
-        values,
-    )
-
-    conn.commit()
-    conn.close()
-
-
-
 # -------------------------
 # Main seeding logic
 # -------------------------
@@ -235,24 +202,26 @@ def main():
     print(f"Seeding {len(pts)} grid points with {len(anchors)} anchors...")
     print(f"Bounds: {BOUNDS}, step={GRID_STEP_M}m, sigma={SIGMA_M}m")
 
-    # If you want to bulk insert, collect and batch here
-    # For now we just compute and call upsert_truth
     every = max(1, len(pts) // 20)
 
-    for i, (lat, lng) in enumerate(pts):
-        truth = blend_truth(lat, lng, anchors, SIGMA_M)
+    def rows():
+        for i, (lat, lng) in enumerate(pts):
+            truth = blend_truth(lat, lng, anchors, SIGMA_M)
 
-        # Optional: add tiny local noise so it doesn't look too "perfect"
-        # (still consistent because it's small)
-        for c in CATEGORIES:
-            truth[c] = clamp01(truth[c] + rng.uniform(-0.02, 0.02))
+            # Optional: add tiny local noise so it doesn't look too "perfect"
+            # (still consistent because it's small)
+            for c in CATEGORIES:
+                truth[c] = clamp01(truth[c] + rng.uniform(-0.02, 0.02))
+
+            if i % every == 0:
+                top_cat = max(truth.items(), key=lambda kv: kv[1])[0]
+                print(f"[{i}/{len(pts)}] lat={lat:.5f}, lng={lng:.5f}, top={top_cat}")
 
-        # Upsert into your truth table
-        upsert_truth(lat, lng, truth)
+            yield lat, lng, truth
 
-        if i % every == 0:
-            top_cat = max(truth.items(), key=lambda kv: kv[1])[0]
-            print(f"[{i}/{len(pts)}] lat={lat:.5f}, lng={lng:.5f}, top={top_cat}")
+    # One transaction, chunked executemany (rows snap to truth cells)
+    n = db.bulk_upsert_truth(rows(), source="seed")
+    print(f"Upserted {n} truth rows.")
 
     print("Done.")
 
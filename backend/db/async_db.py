@@ -0,0 +1,66 @@
+"""
+Async counterpart of the storage backend (DBWriter/PostGISWriter) for FastAPI
+handlers.
+
+Storage calls block, so async endpoints hand them to a dedicated, bounded
+thread pool instead of FastAPI's shared default threadpool. Map and feed
+traffic then can't starve each other of threads, and the DB worker count is
+set independently of the web server.
+
+Config:
+  STREETSENSE_DB_WORKERS  max threads running DB calls at once (default 8)
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from db.storage import Storage, open_storage
+from db.truth_snapshot import TruthSnapshot, get_snapshot
+
+DB_MAX_WORKERS = int(os.getenv("STREETSENSE_DB_WORKERS", "8"))
+
+
+class AsyncDBWriter:
+    def __init__(self, db: Storage | None = None, max_workers: int = DB_MAX_WORKERS):
+        self.db = db or open_storage()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs any blocking DB call on the DB pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def get_feed(self, **kwargs) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_feed, **kwargs)
+
+    async def get_truth_rollup(self, **kwargs) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_truth_rollup, **kwargs)
+
+    async def insert_post(self, **kwargs) -> Dict[str, Any]:
+        return await self.run(self.db.insert_post, **kwargs)
+
+    async def snapshot(self) -> TruthSnapshot:
+        # Usually instant, but may rebuild from the DB when truth changed
+        return await self.run(get_snapshot)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_async_db: Optional[AsyncDBWriter] = None
+
+
+def get_async_db() -> AsyncDBWriter:
+    """
+    Process-wide instance, so every route shares one bounded pool.
+    """
+    global _async_db
+    if _async_db is None:
+        _async_db = AsyncDBWriter()
+    return _async_db
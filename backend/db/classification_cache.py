@@ -0,0 +1,201 @@
+"""
+Persistent cache of CriticalityAgent results.
+
+Entries are keyed by sha256(namespace, model id, normalized text), where
+normalization is NFKC + casefold + collapsed whitespace, so mock tweets,
+repeated police summaries and reposted reports are only classified once per
+model. Results are stored as the agent's pydantic output JSON.
+
+Optionally (near_dup=True) a miss falls back to a near-duplicate lookup: each
+entry also stores a 64-bit SimHash of its character 3-grams, split into four
+16-bit bands that are indexed separately. Any two hashes within Hamming
+distance 3 share at least one band, so candidates come from four index
+lookups and are then checked exactly.
+
+The cache lives in its own SQLite file so it works whichever storage backend
+the app uses.
+
+Config:
+  STREETSENSE_CLASSIFY_CACHE_PATH      cache file (default backend/classify_cache.db)
+  STREETSENSE_CLASSIFY_CACHE_NEAR_DUP  "1" enables the SimHash lookup (default off)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+DEFAULT_CACHE_PATH = Path(os.getenv(
+    "STREETSENSE_CLASSIFY_CACHE_PATH",
+    str(Path(__file__).resolve().parents[1] / "classify_cache.db"),
+))
+NEAR_DUP_DEFAULT = os.getenv("STREETSENSE_CLASSIFY_CACHE_NEAR_DUP", "0") == "1"
+
+# Max Hamming distance between SimHashes treated as the same content
+NEAR_DUP_MAX_DISTANCE = 3
+
+# Print the hit rate every this many lookups
+REPORT_EVERY = 100
+
+DDL = """
+CREATE TABLE IF NOT EXISTS classification_cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    simhash INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL,
+    output TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cc_band0 ON classification_cache(namespace, model, band0);
+CREATE INDEX IF NOT EXISTS idx_cc_band1 ON classification_cache(namespace, model, band1);
+CREATE INDEX IF NOT EXISTS idx_cc_band2 ON classification_cache(namespace, model, band2);
+CREATE INDEX IF NOT EXISTS idx_cc_band3 ON classification_cache(namespace, model, band3);
+"""
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def simhash(normalized: str) -> int:
+    """
+    64-bit SimHash over character 3-grams of the words (punctuation dropped),
+    which stays stable under small edits even for tweet-length text.
+    """
+    s = " ".join(re.findall(r"\w+", normalized))
+    feats = [s[i:i + 3] for i in range(max(len(s) - 2, 1))]
+
+    weights = [0] * 64
+    for f in feats:
+        h = int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _bands(h: int):
+    return [(h >> (16 * i)) & 0xFFFF for i in range(4)]
+
+
+def _signed(h: int) -> int:
+    # SQLite INTEGER is signed 64-bit
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+class ClassificationCache:
+    def __init__(
+        self,
+        namespace: str,
+        path: Optional[str] = None,
+        near_dup: bool = NEAR_DUP_DEFAULT,
+    ):
+        self.namespace = namespace
+        self.path = str(path or DEFAULT_CACHE_PATH)
+        self.near_dup = near_dup
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+        conn = self._connect()
+        conn.executescript(DDL)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _key(self, model: str, normalized: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{model}\0{normalized}".encode()).hexdigest()
+
+    def get(self, model: str, text: str, output_type: Type[T]) -> Optional[T]:
+        norm = normalize(text)
+        key = self._key(model, norm)
+
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT output FROM classification_cache WHERE key = ?", (key,)).fetchone()
+            kind = "hit" if row else "miss"
+
+            if row is None and self.near_dup:
+                h = simhash(norm)
+                b = _bands(h)
+                for cand_key, cand_hash, output in conn.execute(
+                    """
+                    SELECT key, simhash, output FROM classification_cache
+                    WHERE namespace = ? AND model = ?
+                      AND (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)
+                    """,
+                    (self.namespace, model, *b),
+                ):
+                    if bin((cand_hash & 0xFFFFFFFFFFFFFFFF) ^ h).count("1") <= NEAR_DUP_MAX_DISTANCE:
+                        key, row, kind = cand_key, (output,), "near"
+                        break
+
+            if row is not None:
+                with conn:
+                    conn.execute("UPDATE classification_cache SET hits = hits + 1 WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+        self._count(kind)
+        return output_type.model_validate_json(row[0]) if row is not None else None
+
+    def put(self, model: str, text: str, output: BaseModel) -> None:
+        norm = normalize(text)
+        h = simhash(norm)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO classification_cache
+                    (key, namespace, model, simhash, band0, band1, band2, band3, output)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET output = excluded.output
+                """,
+                (self._key(model, norm), self.namespace, model, _signed(h), *_bands(h),
+                 output.model_dump_json()),
+            )
+        conn.close()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            if kind == "hit":
+                self.hits += 1
+            elif kind == "near":
+                self.near_hits += 1
+            else:
+                self.misses += 1
+            total = self.hits + self.near_hits + self.misses
+        if total % REPORT_EVERY == 0:
+            s = self.stats()
+            print(f"[classify-cache:{self.namespace}] hit rate {s['hit_rate']:.1%} "
+                  f"(exact {s['hits']}, near {s['near_hits']}, miss {s['misses']})")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.near_hits + self.misses
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "lookups": total,
+                "hit_rate": (self.hits + self.near_hits) / total if total else 0.0,
+            }
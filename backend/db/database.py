@@ -1,49 +1,32 @@
-import sqlite3
+import argparse
 from pathlib import Path
 
+from db import migrations
+
 # Force DB to live at backend/app.db
 DB_PATH = Path(__file__).resolve().parents[1] / "app.db"
 
-DDL = """
-CREATE TABLE IF NOT EXISTS posts (
-    id TEXT PRIMARY KEY,
-    lat REAL NOT NULL,
-    long REAL NOT NULL,
-    severity REAL NOT NULL,
-    category TEXT NOT NULL,
-    human INTEGER NOT NULL,
-    content TEXT NOT NULL,
-    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE IF NOT EXISTS truth (
-    lat REAL NOT NULL,
-    long REAL NOT NULL,
-    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-
-    crime REAL NOT NULL DEFAULT 0.0,
-    public_safety REAL NOT NULL DEFAULT 0.0,
-    transport REAL NOT NULL DEFAULT 0.0,
-    infrastructure REAL NOT NULL DEFAULT 0.0,
-    policy REAL NOT NULL DEFAULT 0.0,
-    protest REAL NOT NULL DEFAULT 0.0,
-    weather REAL NOT NULL DEFAULT 0.0,
-    other REAL NOT NULL DEFAULT 0.0,
-
-    PRIMARY KEY (lat, long)
-);
-
-CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at);
-CREATE INDEX IF NOT EXISTS idx_posts_human_created_at ON posts(human, created_at);
-"""
+# The schema itself lives in db/migrations.py
 
 def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade app.db")
+    parser.add_argument("--target", type=int, default=None, help="migrate up to this schema version")
+    parser.add_argument("--status", action="store_true", help="show the schema version and pending migrations")
+    args = parser.parse_args()
+
     print("Initializing DB at:", DB_PATH)
-    conn = sqlite3.connect(DB_PATH)
-    conn.executescript(DDL)
-    conn.commit()
+    conn = migrations.connect(DB_PATH)
+
+    if args.status:
+        print("Schema version:", migrations.current_version(conn))
+        for m in migrations.pending(conn, args.target):
+            print(f"  pending {m.version:03d}: {m.name}")
+        conn.close()
+        return
+
+    version = migrations.migrate(conn, args.target)
     conn.close()
-    print("✅ Initialized app.db with posts + truth tables")
+    print(f"✅ Initialized app.db with posts + truth tables (schema version {version})")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,13 @@
 import sqlite3
 import math
+import time
 from uuid import uuid4
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from db import geohash
+from db.storage import Storage
 
 CATEGORIES = [
     "crime", "public_safety", "transport", "infrastructure",
@@ -11,6 +16,9 @@ CATEGORIES = [
 
 DEFAULT_DB_PATH = Path(__file__).resolve().parents[1] / "app.db"
 
+# Rows per executemany call in the bulk_* methods
+BULK_CHUNK_SIZE = 5000
+
 def haversine(lat1, lng1, lat2, lng2):
     R = 6371000
     phi1 = math.radians(lat1)
@@ -24,11 +32,94 @@ def haversine(lat1, lng1, lat2, lng2):
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+def _ema_upsert_sql(col: str) -> str:
+    """
+    One-statement EMA update for a truth column. Parameters:
+    (lat, long, geohash, alpha * severity, alpha). A new row starts from 0,
+    so it is inserted with alpha * severity directly.
+    """
+    return f"""
+        INSERT INTO truth (lat, long, geohash, {col})
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(lat, long) DO UPDATE SET
+            {col} = (1 - ?) * {col} + excluded.{col},
+            updated_at = CURRENT_TIMESTAMP
+    """
+
+
+_LOG_EVENT_SQL = """
+    INSERT INTO truth_events (lat, long, geohash, category, severity, alpha, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Replaces a cell's snapshot; events up to after_event are superseded by it
+_SNAPSHOT_SQL = f"""
+    INSERT INTO truth_snapshots (geohash, lat, long, {", ".join(CATEGORIES)}, source, after_event, updated_at)
+    VALUES (?, ?, ?, {", ".join("?" * len(CATEGORIES))}, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(geohash) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in CATEGORIES)},
+        source = excluded.source,
+        after_event = excluded.after_event,
+        updated_at = excluded.updated_at,
+        created_at = CURRENT_TIMESTAMP
+"""
+
+
+def _bump_truth_version(conn: sqlite3.Connection) -> None:
+    """
+    Call inside every transaction that writes truth; in-process snapshots
+    (db/truth_snapshot.py) reload when this counter moves.
+    """
+    conn.execute(
+        """
+        INSERT INTO meta (key, value) VALUES ('truth_version', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+        """
+    )
+
+
+def _claim_write(conn: sqlite3.Connection, key: Optional[str]) -> bool:
+    """
+    Records an idempotency key inside the caller's transaction. False if the
+    key was applied before (the write should be skipped); True for key=None.
+    """
+    if key is None:
+        return True
+    cur = conn.execute("INSERT INTO applied_writes (key) VALUES (?) ON CONFLICT(key) DO NOTHING", (key,))
+    return cur.rowcount == 1
+
+
+def _with_keys(rows: Iterable[Any], keys: Optional[Sequence[str]]) -> Iterable[Tuple[Any, Optional[str]]]:
+    if keys is None:
+        return ((r, None) for r in rows)
+    rows = list(rows)
+    if len(rows) != len(keys):
+        raise ValueError(f"got {len(keys)} idempotency keys for {len(rows)} rows")
+    return zip(rows, keys)
+
+
+def _chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class DBWriter(Storage):
+    """
+    SQLite storage backend (backend/app.db by default).
+    """
 
-class DBWriter:
     def __init__(self, path: str | None = None):
         self.path = str(Path(path).resolve()) if path else str(DEFAULT_DB_PATH)
-        
+
+    def _connect(self, path: str | None = None) -> sqlite3.Connection:
+        conn = sqlite3.connect(path or self.path)
+        conn.create_function("haversine", 4, haversine, deterministic=True)
+        return conn
+
     def insert_post(
         self,
         *,
@@ -42,19 +133,134 @@ class DBWriter:
         post_id = str(uuid4())
         category = category if category in CATEGORIES else "other"
 
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         cur = conn.cursor()
         cur.execute(
             """
-            INSERT INTO posts (id, lat, long, severity, category, human, content)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO posts (id, lat, long, geohash, severity, category, human, content)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (post_id, lat, long, float(severity), category, 1 if human else 0, content),
+            (
+                post_id, lat, long, geohash.encode(lat, long),
+                float(severity), category, 1 if human else 0, content,
+            ),
         )
         conn.commit()
         conn.close()
         return {"id": post_id}
 
+    def enqueue_post(
+        self,
+        *,
+        lat: float,
+        long: float,
+        content: str,
+    ) -> Dict[str, Any]:
+        """
+        Stores a post as 'pending' and queues it for classification, in one
+        transaction so a post is never left unqueued. Its severity stays 0
+        until the classifier sets it.
+        """
+        post_id = str(uuid4())
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO posts (id, lat, long, geohash, severity, category, human, content, status)
+                VALUES (?, ?, ?, ?, 0.0, 'other', 1, ?, 'pending')
+                """,
+                (post_id, lat, long, geohash.encode(lat, long), content),
+            )
+            conn.execute(
+                "INSERT INTO post_queue (post_id, next_attempt_at) VALUES (?, ?)",
+                (post_id, time.time()),
+            )
+        conn.close()
+        return {"id": post_id}
+
+    def claim_post_jobs(self, *, limit: int, lease_s: float) -> List[Dict[str, Any]]:
+        """
+        Leases up to `limit` due jobs for lease_s seconds, oldest first.
+        Returns dicts with id, content and attempts (before this one).
+        """
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            rows = conn.execute(
+                """
+                UPDATE post_queue SET locked_until = ?
+                WHERE post_id IN (
+                    SELECT post_id FROM post_queue
+                    WHERE next_attempt_at <= ?
+                      AND (locked_until IS NULL OR locked_until < ?)
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING post_id, attempts
+                """,
+                (now + lease_s, now, now, limit),
+            ).fetchall()
+            attempts = dict(rows)
+            content = {}
+            if attempts:
+                marks = ", ".join("?" * len(attempts))
+                content = dict(conn.execute(
+                    f"SELECT id, content FROM posts WHERE id IN ({marks})", list(attempts)
+                ).fetchall())
+        conn.close()
+
+        return [
+            {"id": pid, "content": content[pid], "attempts": attempts[pid]}
+            for pid in attempts if pid in content
+        ]
+
+    def complete_post_jobs(self, results: Iterable[Tuple[str, float, str]]) -> int:
+        """
+        results: (post_id, severity, category). Marks the posts classified
+        and removes their jobs, all in one transaction.
+        """
+        rows = [
+            (float(sev), cat if cat in CATEGORIES else "other", pid)
+            for pid, sev, cat in results
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE posts SET severity = ?, category = ?, status = 'classified' WHERE id = ?",
+                rows,
+            )
+            conn.executemany("DELETE FROM post_queue WHERE post_id = ?", [(r[2],) for r in rows])
+        conn.close()
+        return len(rows)
+
+    def retry_post_job(self, post_id: str, *, error: str, delay_s: float | None) -> None:
+        """
+        Releases a failed job to run again after delay_s, or, with
+        delay_s=None, gives up and marks the post 'failed'.
+        """
+        conn = self._connect()
+        with conn:
+            if delay_s is None:
+                conn.execute("UPDATE posts SET status = 'failed' WHERE id = ?", (post_id,))
+                conn.execute("DELETE FROM post_queue WHERE post_id = ?", (post_id,))
+            else:
+                conn.execute(
+                    """
+                    UPDATE post_queue
+                    SET attempts = attempts + 1, next_attempt_at = ?,
+                        locked_until = NULL, last_error = ?
+                    WHERE post_id = ?
+                    """,
+                    (time.time() + delay_s, error[:500], post_id),
+                )
+        conn.close()
+
+    def count_post_queue(self) -> int:
+        conn = self._connect()
+        (n,) = conn.execute("SELECT COUNT(*) FROM post_queue").fetchone()
+        conn.close()
+        return int(n)
+
     def update_truth(
         self,
         *,
@@ -63,33 +269,160 @@ class DBWriter:
         category: str,
         severity: float,
         alpha: float = 0.25,
+        source: str = "unknown",
+        key: Optional[str] = None,
     ) -> None:
-        category = category if category in CATEGORIES else "other"
-        col = category
+        """
+        Single-statement EMA upsert, logged to truth_events. For many updates
+        use bulk_update_truth_ema, which takes (lat, long, category, severity,
+        alpha) tuples. A no-op if `key` was already applied.
+        """
+        col = category if category in CATEGORIES else "other"
+        lat, long, cell = geohash.snap(lat, long)
 
-        conn = sqlite3.connect(self.path)
-        cur = conn.cursor()
+        conn = self._connect()
+        if not _claim_write(conn, key):
+            conn.close()
+            return
+        conn.execute(_ema_upsert_sql(col), (lat, long, cell, alpha * float(severity), alpha))
+        conn.execute(_LOG_EVENT_SQL, (lat, long, cell, col, float(severity), alpha, source))
+        _bump_truth_version(conn)
+        conn.commit()
+        conn.close()
 
-        cur.execute(
-            "INSERT OR IGNORE INTO truth (lat, long) VALUES (?, ?)",
-            (lat, long),
-        )
+    # --- bulk writes: one transaction per call, executemany per chunk ---
 
-        cur.execute(
-            f"""
-            UPDATE truth
-            SET {col} = (1 - ?) * {col} + ? * ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE lat = ? AND long = ?
-            """,
-            (alpha, alpha, float(severity), lat, long),
-        )
+    def bulk_insert_posts(
+        self,
+        posts: Iterable[Dict[str, Any]],
+        *,
+        keys: Optional[Sequence[str]] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[str]:
+        """
+        posts: dicts with lat, long, severity, category, content, human.
+        Returns the new post ids in input order; posts skipped because their
+        idempotency key (`keys`, one per post) was already applied get none.
+        """
+        ids: List[str] = []
+        conn = self._connect()
+        try:
+            with conn:
+                for chunk in _chunks(_with_keys(posts, keys), chunk_size):
+                    rows = []
+                    for p, key in chunk:
+                        if not _claim_write(conn, key):
+                            continue
+                        post_id = str(uuid4())
+                        ids.append(post_id)
+                        category = p["category"] if p["category"] in CATEGORIES else "other"
+                        rows.append((
+                            post_id, p["lat"], p["long"], geohash.encode(p["lat"], p["long"]),
+                            float(p["severity"]), category, 1 if p["human"] else 0, p["content"],
+                        ))
+                    conn.executemany(
+                        """
+                        INSERT INTO posts (id, lat, long, geohash, severity, category, human, content)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        rows,
+                    )
+        finally:
+            conn.close()
+        return ids
 
-        conn.commit()
-        conn.close()
+    def bulk_upsert_truth(
+        self,
+        rows: Iterable[Tuple[float, float, Dict[str, float]]],
+        *,
+        source: str | None = "upsert",
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        rows: (lat, long, {category: value}) overwriting the stored values.
+        Missing categories are written as 0.0. Returns the number of rows.
+
+        Each row is recorded as one truth_snapshots row under `source`
+        (rather than an overwrite event per category); pass source=None to
+        skip that, e.g. when rebuilding truth from the log.
+        """
+        cols = ", ".join(CATEGORIES)
+        sql = f"""
+            INSERT INTO truth (lat, long, geohash, updated_at, {cols})
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP, {", ".join("?" * len(CATEGORIES))})
+            ON CONFLICT(lat, long) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                {", ".join(f"{c} = excluded.{c}" for c in CATEGORIES)}
+        """
+
+        n = 0
+        conn = self._connect()
+        try:
+            with conn:
+                (after_event,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM truth_events").fetchone()
+                for chunk in _chunks(rows, chunk_size):
+                    params = []
+                    snapshots = []
+                    for lat, long, values in chunk:
+                        lat, long, cell = geohash.snap(lat, long)
+                        vals = [float(values.get(c, 0.0)) for c in CATEGORIES]
+                        params.append((lat, long, cell, *vals))
+                        if source is not None:
+                            snapshots.append((cell, lat, long, *vals, source, after_event))
+                    conn.executemany(sql, params)
+                    conn.executemany(_SNAPSHOT_SQL, snapshots)
+                    n += len(params)
+                _bump_truth_version(conn)
+        finally:
+            conn.close()
+        return n
+
+    def bulk_update_truth_ema(
+        self,
+        updates: Iterable[Tuple[float, float, str, float, float]],
+        *,
+        source: str = "unknown",
+        keys: Optional[Sequence[str]] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        updates: (lat, long, category, severity, alpha) applied as
+        col = (1 - alpha) * col + alpha * severity, same as update_truth,
+        and logged to truth_events under `source`.
+        Updates to the same cell and category are applied in input order.
+        Updates whose idempotency key (`keys`, one per update) was already
+        applied are skipped. Returns the number of updates applied.
+        """
+        n = 0
+        conn = self._connect()
+        try:
+            with conn:
+                for chunk in _chunks(_with_keys(updates, keys), chunk_size):
+                    # One statement per column; order within a column is kept
+                    by_col: Dict[str, List[Tuple[Any, ...]]] = {}
+                    events = []
+                    for (lat, long, category, severity, alpha), key in chunk:
+                        if not _claim_write(conn, key):
+                            continue
+                        col = category if category in CATEGORIES else "other"
+                        lat, long, cell = geohash.snap(lat, long)
+                        by_col.setdefault(col, []).append(
+                            (lat, long, cell, alpha * float(severity), alpha)
+                        )
+                        events.append((lat, long, cell, col, float(severity), alpha, source))
+
+                    for col, params in by_col.items():
+                        conn.executemany(_ema_upsert_sql(col), params)
+                    conn.executemany(_LOG_EVENT_SQL, events)
+                    n += len(events)
+                _bump_truth_version(conn)
+        finally:
+            conn.close()
+        return n
 
     def get_truth(self, *, lat: float, long: float) -> Dict[str, Any] | None:
-        conn = sqlite3.connect(self.path)
+        lat, long, _ = geohash.snap(lat, long)
+        conn = self._connect()
         cur = conn.cursor()
         cur.execute(
             """
@@ -116,60 +449,129 @@ class DBWriter:
         lng: float,
         radius: float = 500,
         limit: int = 500,
+        before: Optional[str] = None,
+        before_id: Optional[str] = None,
         path: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        db_path = str(Path(path).resolve()) if path else str(DEFAULT_DB_PATH)
+        """
+        Posts within `radius` metres, newest first.
+
+        The radius filter runs in SQL: the circle is covered by a handful of
+        geohash cells, so only posts in those cells are read (via
+        idx_posts_geohash) and then refined by exact haversine distance.
+
+        Only the hot `posts` partition is read; older posts live in monthly
+        partitions and archives (db/post_retention.py).
+
+        Pagination is keyset on (created_at, id): pass the last item's
+        `timestamp` as `before` and its `id` as `before_id` to get the next page.
+        """
+        db_path = str(Path(path).resolve()) if path else None
 
-        conn = sqlite3.connect(db_path)
+        cells = geohash.cover_radius(lat, lng, radius)
+        cell_sql = " OR ".join(["(geohash >= ? AND geohash < ?)"] * len(cells))
+        params: List[Any] = [lat, lng]
+        for c in cells:
+            params.extend(geohash.prefix_range(c))
+        params.extend([lat, lng, radius])
+
+        cursor_sql = ""
+        if before is not None:
+            if before_id is not None:
+                cursor_sql = "AND (created_at < ? OR (created_at = ? AND id < ?))"
+                params.extend([before, before, before_id])
+            else:
+                cursor_sql = "AND created_at < ?"
+                params.append(before)
+        params.append(limit)
+
+        conn = self._connect(db_path)
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
-
-        # Pull recent posts; we'll do distance filtering in Python (simple + reliable)
-        # Adjust created_at -> timestamp depending on your schema
         cur.execute(
-            """
-            SELECT id, lat, long, severity, category, human, content, created_at
+            f"""
+            SELECT id, lat, long, severity, category, human, content, status, created_at,
+                   haversine(?, ?, lat, long) AS distance
             FROM posts
-            ORDER BY created_at DESC
+            WHERE ({cell_sql})
+              AND haversine(?, ?, lat, long) <= ?
+              {cursor_sql}
+            ORDER BY created_at DESC, id DESC
             LIMIT ?
             """,
-            (limit,),
+            params,
         )
         rows = cur.fetchall()
         conn.close()
 
-        nearby: List[Dict[str, Any]] = []
-        for r in rows:
-            distance = haversine(lat, lng, r["lat"], r["long"])
-            if distance <= radius:
-                nearby.append(
-                    {
-                        "id": r["id"],
-                        "lat": r["lat"],
-                        "lng": r["long"],
-                        "content": r["content"],
-                        "severity": float(r["severity"]),
-                        "category": r["category"],
-                        "human": bool(r["human"]),
-                        "distance": distance,
-                        "timestamp": r["created_at"],  # keep API field name the same
-                    }
-                )
+        return [
+            {
+                "id": r["id"],
+                "lat": r["lat"],
+                "lng": r["long"],
+                "content": r["content"],
+                "severity": float(r["severity"]),
+                "category": r["category"],
+                "human": bool(r["human"]),
+                "status": r["status"],
+                "distance": r["distance"],
+                "timestamp": r["created_at"],  # keep API field name the same
+            }
+            for r in rows
+        ]
 
-        # Already sorted by created_at DESC, but keep this in case of ties / schema differences
-        nearby.sort(key=lambda x: x["timestamp"], reverse=True)
-        return nearby
-    
     def count_truth_rows(self) -> int:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM truth")
         (n,) = cur.fetchone()
         conn.close()
         return int(n)
 
+    def get_truth_in_bbox(
+        self,
+        *,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        limit: int = 50000,
+    ) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            f"""
+            SELECT lat, long, updated_at, {", ".join(CATEGORIES)}
+            FROM truth
+            WHERE lat BETWEEN ? AND ?
+              AND long BETWEEN ? AND ?
+            LIMIT ?
+            """,
+            (south, north, west, east, limit),
+        ).fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+
+    def get_truth_version(self) -> int:
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'truth_version'").fetchone()
+        conn.close()
+        return int(row[0]) if row else 0
+
+    def fetch_truth_columns(self) -> List[Tuple[Any, ...]]:
+        """
+        Every truth row as (lat, long, updated_at, *CATEGORIES), for building
+        the in-memory snapshot.
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT lat, long, updated_at, {', '.join(CATEGORIES)} FROM truth"
+        ).fetchall()
+        conn.close()
+        return rows
+
     def get_truth_nearest(self, *, lat: float, lng: float) -> Dict[str, Any] | None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         cur = conn.cursor()
         cur.execute(
             f"""
@@ -187,3 +589,43 @@ class DBWriter:
 
         keys = ["lat", "long", "updated_at"] + CATEGORIES
         return dict(zip(keys, row))
+
+    def get_truth_rollup(
+        self,
+        *,
+        level: int,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+    ) -> List[Dict[str, Any]]:
+        """
+        Pre-aggregated truth cells at a rollup level intersecting the bbox.
+        Category values are means over the truth rows in each cell and
+        lat/long is the cell centre.
+        """
+        # a few prefix ranges on the (level, geohash) key, never one lookup per cell
+        prefixes = geohash.cover_prefixes(south, west, north, east, level)
+        ranges = [r for p in prefixes for r in geohash.prefix_range(p)]
+
+        conn = self._connect()
+        rows = conn.execute(
+            f"""
+            SELECT geohash, n, updated_at, {", ".join(CATEGORIES)}
+            FROM truth_rollup
+            WHERE level = ? AND n > 0
+              AND ({" OR ".join(["(geohash >= ? AND geohash < ?)"] * len(prefixes))})
+            """,
+            (level, *ranges),
+        ).fetchall()
+        conn.close()
+
+        out: List[Dict[str, Any]] = []
+        for cell, n, updated_at, *sums in rows:
+            if not geohash.intersects(cell, south, west, north, east):
+                continue
+            clat, clng = geohash.decode(cell)
+            d = {"geohash": cell, "lat": clat, "long": clng, "n": n, "updated_at": updated_at}
+            d.update({c: v / n for c, v in zip(CATEGORIES, sums)})
+            out.append(d)
+        return out
@@ -0,0 +1,190 @@
+"""
+Minimal geohash helpers used to key posts (and truth) by spatial cell.
+
+A geohash is hierarchical: every prefix of a hash is the enclosing cell at a
+coarser precision, so one indexed TEXT column supports lookups at any level
+through simple prefix ranges.
+"""
+
+import math
+from typing import List, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+
+# Precision stored on every post; prefixes give the coarser levels.
+STORE_PRECISION = 9
+
+# Truth rows are snapped to the centre of a cell at this precision
+# (7 ~= 153m x 153m in London), so nearby writes land on the same row.
+TRUTH_PRECISION = 7
+
+# Coarser levels pre-aggregated into truth_rollup (~39km, ~4.9km, ~1.2km cells)
+ROLLUP_LEVELS = (4, 5, 6)
+
+
+def encode(lat: float, lng: float, precision: int = STORE_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    out = []
+    bits = 0
+    ch = 0
+    even = True  # even bits are longitude
+
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(BASE32[ch])
+            bits = 0
+            ch = 0
+
+    return "".join(out)
+
+
+def bounds(gh: str) -> Tuple[float, float, float, float]:
+    """
+    Returns (south, west, north, east) of the cell.
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in gh:
+        v = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def decode(gh: str) -> Tuple[float, float]:
+    """
+    Returns the (lat, lng) centre of the cell.
+    """
+    s, w, n, e = bounds(gh)
+    return (s + n) / 2, (w + e) / 2
+
+
+def snap(lat: float, lng: float, precision: int = TRUTH_PRECISION) -> Tuple[float, float, str]:
+    """
+    Returns (lat, lng, cell) with the point moved to its cell centre.
+    """
+    cell = encode(lat, lng, precision)
+    clat, clng = decode(cell)
+    return clat, clng, cell
+
+
+def cell_size_deg(precision: int) -> Tuple[float, float]:
+    """
+    Returns (dlat, dlng) of a cell at this precision.
+    """
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """
+    [lo, hi) string range matching every stored hash that starts with prefix.
+    """
+    return prefix, prefix + "~"
+
+
+def cover_bbox(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    precision: int,
+) -> List[str]:
+    """
+    All cells at `precision` that intersect the bbox (sorted, unique).
+    """
+    dlat, dlng = cell_size_deg(precision)
+    cells = set()
+
+    # Walk cell by cell, snapping to cell origins so we never skip a column.
+    lat = math.floor((south + 90.0) / dlat) * dlat - 90.0
+    while lat <= north:
+        lng = math.floor((west + 180.0) / dlng) * dlng - 180.0
+        while lng <= east:
+            cells.add(encode(lat + dlat / 2, lng + dlng / 2, precision))
+            lng += dlng
+        lat += dlat
+
+    return sorted(cells)
+
+
+def cover_prefixes(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    max_precision: int,
+    max_cells: int = 32,
+) -> List[str]:
+    """
+    Covers the bbox with the finest cells (at most max_precision) that keep
+    the cover under max_cells, estimated before listing any. Query stored
+    hashes with prefix_range() on each; callers drop the rows outside the
+    bbox, since a coarse cover overshoots.
+    """
+    for precision in range(max_precision, 0, -1):
+        clat, clng = cell_size_deg(precision)
+        est = (math.ceil((north - south) / clat) + 1) * (math.ceil((east - west) / clng) + 1)
+        if est <= max_cells:
+            return cover_bbox(south, west, north, east, precision)
+
+    return cover_bbox(south, west, north, east, 1)
+
+
+def intersects(gh: str, south: float, west: float, north: float, east: float) -> bool:
+    s, w, n, e = bounds(gh)
+    return s <= north and n >= south and w <= east and e >= west
+
+
+def cover_radius(lat: float, lng: float, radius_m: float, max_cells: int = 16) -> List[str]:
+    """
+    Covers a circle with the finest cells that keep the cover under max_cells.
+    """
+    dlat = radius_m / 111_320.0
+    dlng = radius_m / (111_320.0 * max(math.cos(math.radians(lat)), 1e-6))
+    s, n = lat - dlat, lat + dlat
+    w, e = lng - dlng, lng + dlng
+
+    for precision in range(STORE_PRECISION, 0, -1):
+        clat, clng = cell_size_deg(precision)
+        est = (math.ceil((n - s) / clat) + 1) * (math.ceil((e - w) / clng) + 1)
+        if est <= max_cells:
+            return cover_bbox(s, w, n, e, precision)
+
+    return cover_bbox(s, w, n, e, 1)
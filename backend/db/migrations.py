@@ -0,0 +1,602 @@
+"""
+Versioned, forward-only schema migrations for the SQLite backend.
+
+Each migration has an increasing version number and is recorded in
+schema_version once applied, so `python -m db.database` on any existing
+app.db only runs what that file is missing. All migrations are written to be
+idempotent, which lets databases created before schema_version existed adopt
+it by simply running them all.
+
+Ordinary migrations run in a single transaction. "Online" ones (backfills and
+index builds on big tables) commit in chunks of BACKFILL_CHUNK_SIZE rows
+instead, so API readers (WAL) and pipeline writers only ever wait for one
+short chunk; they are resumable because each chunk only touches rows that
+still need it. Index builds run in their own transaction after the backfill.
+
+To change the schema, append a Migration to MIGRATIONS. Never edit one that
+has shipped.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db import geohash
+
+# Rows per transaction in online backfills
+BACKFILL_CHUNK_SIZE = 5000
+
+CATEGORIES = [
+    "crime", "public_safety", "transport", "infrastructure",
+    "policy", "protest", "weather", "other"
+]
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+    # Online migrations manage their own (chunked) transactions
+    online: bool = False
+
+
+def _execute_script(conn: sqlite3.Connection, sql: str) -> None:
+    """
+    Like executescript() but without its implicit COMMIT, so the statements
+    stay inside the migration's transaction.
+    """
+    stmt = ""
+    for line in sql.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            conn.execute(stmt)
+            stmt = ""
+    if stmt.strip():
+        conn.execute(stmt)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    """
+    One short write transaction inside an online migration.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _backfill_in_chunks(
+    conn: sqlite3.Connection,
+    select_sql: str,
+    update_sql: str,
+    to_params: Callable[[tuple], tuple],
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+) -> int:
+    """
+    Repeatedly reads up to chunk_size rows with select_sql (which must only
+    return rows still needing the backfill) and writes them back with
+    update_sql, one transaction per chunk.
+    """
+    done = 0
+    while True:
+        rows = conn.execute(select_sql, (chunk_size,)).fetchall()
+        if not rows:
+            return done
+        with _transaction(conn):
+            conn.executemany(update_sql, [to_params(r) for r in rows])
+        done += len(rows)
+
+
+def _create_index_online(conn: sqlite3.Connection, ddl: str) -> None:
+    with _transaction(conn):
+        conn.execute(ddl)
+
+
+# --- migrations ---
+
+def m001_baseline(conn: sqlite3.Connection) -> None:
+    _execute_script(conn, """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    long REAL NOT NULL,
+    severity REAL NOT NULL,
+    category TEXT NOT NULL,
+    human INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS truth (
+    lat REAL NOT NULL,
+    long REAL NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    crime REAL NOT NULL DEFAULT 0.0,
+    public_safety REAL NOT NULL DEFAULT 0.0,
+    transport REAL NOT NULL DEFAULT 0.0,
+    infrastructure REAL NOT NULL DEFAULT 0.0,
+    policy REAL NOT NULL DEFAULT 0.0,
+    protest REAL NOT NULL DEFAULT 0.0,
+    weather REAL NOT NULL DEFAULT 0.0,
+    other REAL NOT NULL DEFAULT 0.0,
+
+    PRIMARY KEY (lat, long)
+);
+
+CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_human_created_at ON posts(human, created_at);
+""")
+
+
+def m002_posts_geohash(conn: sqlite3.Connection) -> None:
+    """
+    posts.geohash (online): the column add is instant, the backfill is chunked
+    and the index is built once the backfill is done.
+    """
+    if "geohash" not in _columns(conn, "posts"):
+        conn.execute("ALTER TABLE posts ADD COLUMN geohash TEXT")
+
+    n = _backfill_in_chunks(
+        conn,
+        "SELECT rowid, lat, long FROM posts WHERE geohash IS NULL LIMIT ?",
+        "UPDATE posts SET geohash = ? WHERE rowid = ?",
+        lambda r: (geohash.encode(r[1], r[2]), r[0]),
+    )
+    if n:
+        print(f"  backfilled geohash for {n} posts")
+    _create_index_online(conn, "CREATE INDEX IF NOT EXISTS idx_posts_geohash ON posts(geohash)")
+
+
+def rollup_trigger_ddl() -> str:
+    """
+    Triggers that keep truth_rollup in step with every insert/update/delete
+    on truth, one statement per rollup level.
+    """
+    cols = ", ".join(CATEGORIES)
+    ins, upd, dele = [], [], []
+    for lvl in geohash.ROLLUP_LEVELS:
+        ins.append(f"""
+    INSERT INTO truth_rollup (level, geohash, n, updated_at, {cols})
+    VALUES ({lvl}, substr(NEW.geohash, 1, {lvl}), 1, NEW.updated_at,
+            {", ".join(f"NEW.{c}" for c in CATEGORIES)})
+    ON CONFLICT(level, geohash) DO UPDATE SET
+        n = n + 1,
+        updated_at = excluded.updated_at,
+        {", ".join(f"{c} = {c} + excluded.{c}" for c in CATEGORIES)};""")
+        upd.append(f"""
+    UPDATE truth_rollup SET
+        updated_at = NEW.updated_at,
+        {", ".join(f"{c} = {c} + NEW.{c} - OLD.{c}" for c in CATEGORIES)}
+    WHERE level = {lvl} AND geohash = substr(NEW.geohash, 1, {lvl});""")
+        dele.append(f"""
+    UPDATE truth_rollup SET
+        n = n - 1,
+        {", ".join(f"{c} = {c} - OLD.{c}" for c in CATEGORIES)}
+    WHERE level = {lvl} AND geohash = substr(OLD.geohash, 1, {lvl});""")
+
+    return f"""
+CREATE TRIGGER IF NOT EXISTS trg_truth_rollup_insert AFTER INSERT ON truth BEGIN{"".join(ins)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_truth_rollup_update AFTER UPDATE ON truth BEGIN{"".join(upd)}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_truth_rollup_delete AFTER DELETE ON truth BEGIN{"".join(dele)}
+END;
+"""
+
+
+def m003_truth_cells(conn: sqlite3.Connection) -> None:
+    """
+    Keys truth by geohash cell and adds the truth_rollup table + triggers
+    (online). Existing truth rows are snapped to their cell centre in chunks,
+    merging near-duplicates by averaging; the triggers keep the rollup in
+    step as each chunk writes its cells. Cells keyed before the rollup
+    existed are added to it in chunks of finest-level prefixes first.
+
+    Progress lives in two scratch tables dropped at the end: m003_cell_rows
+    (rows merged into each cell so far, for the running average) and
+    m003_rollup_todo (prefixes still missing from the rollup).
+    """
+    cols = ", ".join(CATEGORIES)
+    fine = max(geohash.ROLLUP_LEVELS)
+
+    with _transaction(conn):
+        new_rollup = conn.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'truth_rollup')"
+        ).fetchone()[0]
+        _execute_script(conn, """
+-- Category columns hold SUMS over the truth cells inside each rollup cell;
+-- divide by n for the mean. Kept in sync by the trg_truth_rollup_* triggers.
+CREATE TABLE IF NOT EXISTS truth_rollup (
+    level INTEGER NOT NULL,
+    geohash TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+
+    crime REAL NOT NULL DEFAULT 0.0,
+    public_safety REAL NOT NULL DEFAULT 0.0,
+    transport REAL NOT NULL DEFAULT 0.0,
+    infrastructure REAL NOT NULL DEFAULT 0.0,
+    policy REAL NOT NULL DEFAULT 0.0,
+    protest REAL NOT NULL DEFAULT 0.0,
+    weather REAL NOT NULL DEFAULT 0.0,
+    other REAL NOT NULL DEFAULT 0.0,
+
+    PRIMARY KEY (level, geohash)
+);
+
+CREATE TABLE IF NOT EXISTS m003_cell_rows (
+    geohash TEXT PRIMARY KEY,
+    n INTEGER NOT NULL
+);
+""")
+        _execute_script(conn, rollup_trigger_ddl())
+
+        if "geohash" not in _columns(conn, "truth"):
+            conn.execute("ALTER TABLE truth ADD COLUMN geohash TEXT")
+        elif new_rollup:
+            conn.execute("CREATE TABLE m003_rollup_todo (prefix TEXT PRIMARY KEY)")
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO m003_rollup_todo (prefix)
+                SELECT substr(geohash, 1, {fine}) FROM truth WHERE geohash IS NOT NULL
+                """
+            )
+
+    # Rollup for cells that were already keyed, a sorted run of prefixes at a
+    # time so each chunk reads one geohash range
+    while conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'm003_rollup_todo'").fetchone():
+        prefixes = [p for (p,) in conn.execute("SELECT prefix FROM m003_rollup_todo ORDER BY prefix LIMIT ?",
+                                               (BACKFILL_CHUNK_SIZE,))]
+        with _transaction(conn):
+            if not prefixes:
+                conn.execute("DROP TABLE m003_rollup_todo")
+                continue
+            for lvl in geohash.ROLLUP_LEVELS:
+                conn.execute(
+                    f"""
+                    INSERT INTO truth_rollup (level, geohash, n, updated_at, {cols})
+                    SELECT {lvl}, substr(geohash, 1, {lvl}), COUNT(*), MAX(updated_at),
+                           {", ".join(f"SUM({c})" for c in CATEGORIES)}
+                    FROM truth WHERE geohash >= ? AND geohash < ?
+                    GROUP BY substr(geohash, 1, {lvl})
+                    ON CONFLICT(level, geohash) DO UPDATE SET
+                        n = n + excluded.n,
+                        updated_at = max(updated_at, excluded.updated_at),
+                        {", ".join(f"{c} = {c} + excluded.{c}" for c in CATEGORIES)}
+                    """,
+                    (prefixes[0], prefixes[-1] + "~"),   # "~" sorts after every base32 digit
+                )
+            conn.execute("DELETE FROM m003_rollup_todo WHERE prefix <= ?", (prefixes[-1],))
+
+    # Snap unkeyed rows: each chunk deletes its rows and folds them into the
+    # cell's row, inserting it when the cell is new
+    select_sql = f"SELECT rowid, lat, long, updated_at, {cols} FROM truth WHERE geohash IS NULL"
+    done = 0
+    while True:
+        rows = conn.execute(select_sql + " LIMIT ?", (BACKFILL_CHUNK_SIZE,)).fetchall()
+        if not rows:
+            break
+        with _transaction(conn):
+            merged: Dict[str, list] = {}
+            for row in rows:
+                lat, lng, cell = geohash.snap(row[1], row[2])
+                merged.setdefault(cell, [lat, lng, []])[2].append(row)
+            # an unkeyed row already at a centre would collide with the cell's new row
+            seen = {r[0] for r in rows}
+            for cell, (lat, lng, group) in merged.items():
+                for row in conn.execute(select_sql + " AND lat = ? AND long = ?", (lat, lng)):
+                    if row[0] not in seen:
+                        seen.add(row[0])
+                        group.append(row)
+
+            conn.executemany("DELETE FROM truth WHERE rowid = ?", [(rowid,) for rowid in seen])
+            for cell, (lat, lng, group) in merged.items():
+                updated_at = max(r[3] for r in group)
+                sums = [sum(float(r[4 + i]) for r in group) for i in range(len(CATEGORIES))]
+                cur = conn.execute(f"SELECT rowid, updated_at, {cols} FROM truth WHERE geohash = ?",
+                                   (cell,)).fetchone()
+                if cur is None:
+                    conn.execute(
+                        f"""
+                        INSERT INTO truth (lat, long, geohash, updated_at, {cols})
+                        VALUES (?, ?, ?, ?, {", ".join("?" * len(CATEGORIES))})
+                        """,
+                        (lat, lng, cell, updated_at, *[v / len(group) for v in sums]),
+                    )
+                    n = len(group)
+                else:
+                    (prev,) = conn.execute("SELECT n FROM m003_cell_rows WHERE geohash = ?",
+                                           (cell,)).fetchone() or (1,)
+                    n = prev + len(group)
+                    conn.execute(
+                        f"""
+                        UPDATE truth SET updated_at = ?, {", ".join(f"{c} = ?" for c in CATEGORIES)}
+                        WHERE rowid = ?
+                        """,
+                        (max(cur[1], updated_at), *[(float(v) * prev + s) / n for v, s in zip(cur[2:], sums)],
+                         cur[0]),
+                    )
+                conn.execute("INSERT OR REPLACE INTO m003_cell_rows (geohash, n) VALUES (?, ?)", (cell, n))
+        done += len(seen)
+    if done:
+        print(f"  snapped {done} truth rows to cells")
+
+    _create_index_online(conn, "CREATE UNIQUE INDEX IF NOT EXISTS idx_truth_geohash ON truth(geohash)")
+    with _transaction(conn):
+        conn.execute("DROP TABLE IF EXISTS m003_cell_rows")
+
+
+def m004_meta(conn: sqlite3.Connection) -> None:
+    _execute_script(conn, """
+-- Small key/value counters, e.g. truth_version (bumped on every truth write)
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+""")
+
+
+def m005_truth_events(conn: sqlite3.Connection) -> None:
+    _execute_script(conn, """
+-- Append-only log of every truth write (EMA updates and overwrites with
+-- alpha = 1). Old days are folded into truth_events_daily by
+-- db/truth_history.py compact.
+CREATE TABLE IF NOT EXISTS truth_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lat REAL NOT NULL,
+    long REAL NOT NULL,
+    geohash TEXT NOT NULL,
+    category TEXT NOT NULL,
+    severity REAL NOT NULL,
+    alpha REAL NOT NULL,
+    source TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per (day, truth cell, category). keep/ema_add fold the day's EMA
+-- updates so that value_after = keep * value_before + ema_add, which lets a
+-- rebuild replay compacted days exactly.
+CREATE TABLE IF NOT EXISTS truth_events_daily (
+    day TEXT NOT NULL,
+    geohash TEXT NOT NULL,
+    category TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    severity_sum REAL NOT NULL,
+    severity_max REAL NOT NULL,
+    keep REAL NOT NULL,
+    ema_add REAL NOT NULL,
+    PRIMARY KEY (day, geohash, category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_truth_events_created_at ON truth_events(created_at);
+""")
+
+
+def m006_post_partitions(conn: sqlite3.Connection) -> None:
+    _execute_script(conn, """
+-- `posts` is the hot partition: only the last STREETSENSE_POSTS_HOT_DAYS of
+-- posts. db/post_retention.py moves older rows into monthly posts_YYYY_MM
+-- tables and later archives those to compressed files.
+CREATE TABLE IF NOT EXISTS post_partitions (
+    name TEXT PRIMARY KEY,
+    month TEXT NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    archived_path TEXT,
+    archived_at TEXT
+);
+
+-- Every post still in the DB (hot + monthly partitions); recreated by
+-- db/post_retention.py whenever the partition set changes
+CREATE VIEW IF NOT EXISTS posts_all AS
+    SELECT id, lat, long, geohash, severity, category, human, content, created_at FROM posts;
+""")
+
+
+def m007_post_queue(conn: sqlite3.Connection) -> None:
+    """
+    posts.status plus the durable classification queue behind POST /post.
+    """
+    if "status" not in _columns(conn, "posts"):
+        conn.execute("ALTER TABLE posts ADD COLUMN status TEXT NOT NULL DEFAULT 'classified'")
+
+    _execute_script(conn, """
+-- One row per post still waiting for classification (see post_worker.py).
+-- Times are unix seconds; a claimed job is leased until locked_until, so a
+-- crashed worker's jobs are picked up again once the lease runs out.
+CREATE TABLE IF NOT EXISTS post_queue (
+    post_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    enqueued_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_post_queue_next ON post_queue(next_attempt_at);
+""")
+
+
+def m008_applied_writes(conn: sqlite3.Connection) -> None:
+    _execute_script(conn, """
+-- Idempotency keys of truth/post writes that carried one (see db/run_state.py).
+-- A write whose key is already here is skipped, so a resumed run can't apply
+-- the same EMA update twice.
+CREATE TABLE IF NOT EXISTS applied_writes (
+    key TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_applied_writes_created_at ON applied_writes(created_at);
+""")
+
+
+def m009_truth_snapshots(conn: sqlite3.Connection) -> None:
+    """
+    truth_snapshots, backfilled so that the log explains every truth row.
+
+    Truth written before m005 (and the part of a row's value that predates the
+    log) had no events, so a rebuild from the log dropped it. Each existing
+    row gets a snapshot dated before the whole log, holding the value that the
+    logged updates turn into today's row: base = (value - add) / keep per
+    category, with (keep, add) the row's folded log. Categories the log
+    overwrites anyway get 0.
+    """
+    cols = "\n".join(f"    {c} REAL NOT NULL DEFAULT 0.0," for c in CATEGORIES)
+    _execute_script(conn, f"""
+-- Latest overwrite (bulk_upsert_truth) of each truth cell as one row, instead
+-- of an alpha = 1 event per category. A rebuild starts the cell from here and
+-- applies only the events after it: truth_events with id > after_event and
+-- truth_events_daily days from the snapshot's day on.
+CREATE TABLE IF NOT EXISTS truth_snapshots (
+    geohash TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    long REAL NOT NULL,
+{cols}
+    source TEXT NOT NULL,
+    after_event INTEGER NOT NULL,
+    updated_at TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+""")
+
+    # (cell, category) -> (add, keep) of the whole log, oldest first, so
+    # value = keep * base + add. Compacted days always precede raw events.
+    # Frozen copy of what db.truth_history.fold_log did when this shipped.
+    folded: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    for cell, cat, k, a in list(conn.execute(
+        "SELECT geohash, category, keep, ema_add FROM truth_events_daily ORDER BY day"
+    )) + list(conn.execute(
+        "SELECT geohash, category, 1.0 - alpha, alpha * severity FROM truth_events ORDER BY id"
+    )):
+        add, keep = folded.get((cell, cat), (0.0, 1.0))
+        folded[(cell, cat)] = (k * add + a, k * keep)
+
+    params = []
+    for cell, lat, lng, updated_at, *vals in conn.execute(
+        f"SELECT geohash, lat, long, updated_at, {', '.join(CATEGORIES)} FROM truth WHERE geohash IS NOT NULL"
+    ):
+        base = []
+        for c, v in zip(CATEGORIES, vals):
+            add, keep = folded.get((cell, c), (0.0, 1.0))
+            base.append(min(max((v - add) / keep, 0.0), 1.0) if keep > 1e-12 else 0.0)
+        params.append((cell, lat, lng, *base, updated_at))
+
+    conn.executemany(
+        f"""
+        INSERT OR IGNORE INTO truth_snapshots
+            (geohash, lat, long, {", ".join(CATEGORIES)}, source, after_event, updated_at, created_at)
+        VALUES (?, ?, ?, {", ".join("?" * len(CATEGORIES))}, 'baseline', 0, ?, '0000-00-00 00:00:00')
+        """,
+        params,
+    )
+
+
+
+def m010_partition_status(conn: sqlite3.Connection) -> None:
+    """
+    posts.status (m007) in the monthly partitions and posts_all too. Only
+    classified or failed posts are ever rolled out of `posts`, so existing
+    partition rows default to 'classified'.
+    """
+    names = [
+        n for (n,) in conn.execute(
+            "SELECT name FROM post_partitions WHERE archived_path IS NULL ORDER BY month"
+        )
+    ]
+    for name in names:
+        if "status" not in _columns(conn, name):
+            conn.execute(f"ALTER TABLE {name} ADD COLUMN status TEXT NOT NULL DEFAULT 'classified'")
+
+    cols = "id, lat, long, geohash, severity, category, human, content, status, created_at"
+    parts = [f"SELECT {cols} FROM posts"] + [f"SELECT {cols} FROM {n}" for n in names]
+    conn.execute("DROP VIEW IF EXISTS posts_all")
+    conn.execute("CREATE VIEW posts_all AS " + "\nUNION ALL ".join(parts))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline posts + truth", m001_baseline),
+    Migration(2, "posts.geohash + index", m002_posts_geohash, online=True),
+    Migration(3, "truth geohash cells + rollup", m003_truth_cells, online=True),
+    Migration(4, "meta counters", m004_meta),
+    Migration(5, "truth_events log", m005_truth_events),
+    Migration(6, "post partitions", m006_post_partitions),
+    Migration(7, "post classification queue", m007_post_queue),
+    Migration(8, "write idempotency keys", m008_applied_writes),
+    Migration(9, "truth snapshots", m009_truth_snapshots),
+    Migration(10, "post partition status", m010_partition_status),
+]
+
+
+# --- runner ---
+
+def connect(path) -> sqlite3.Connection:
+    """
+    Connection in autocommit mode: the runner issues BEGIN/COMMIT itself so
+    DDL is transactional too.
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    ensure_version_table(conn)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def pending(conn: sqlite3.Connection, target: Optional[int] = None) -> List[Migration]:
+    version = current_version(conn)
+    return [
+        m for m in MIGRATIONS
+        if m.version > version and (target is None or m.version <= target)
+    ]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """
+    Applies pending migrations in order, up to `target` (default: latest).
+    Returns the resulting schema version.
+    """
+    for m in pending(conn, target):
+        print(f"→ migration {m.version:03d}: {m.name}{' (online)' if m.online else ''}")
+        if m.online:
+            m.apply(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (m.version, m.name))
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            m.apply(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (m.version, m.name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return current_version(conn)
@@ -0,0 +1,118 @@
+"""
+On-disk cache of raw Police API street-crime responses.
+
+A month's street-level data doesn't change once published, so responses are
+kept for good, keyed by (lat, lng, month) with coordinates rounded to 1e-5
+degrees (~1 m). Re-running a sweep, or backfilling a past month that was
+fetched before, then never touches the network.
+
+Responses are stored as zlib-compressed JSON (the crime records are very
+repetitive, so this shrinks them several-fold) in their own SQLite file, so
+the cache works whichever storage backend the app uses.
+
+Config:
+  STREETSENSE_POLICE_CACHE_PATH  cache file (default backend/police_cache.db)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_POLICE_CACHE_PATH = Path(os.getenv(
+    "STREETSENSE_POLICE_CACHE_PATH",
+    str(Path(__file__).resolve().parents[1] / "police_cache.db"),
+))
+
+# zlib level (1 = fastest .. 9 = smallest)
+COMPRESS_LEVEL = 6
+
+DDL = """
+CREATE TABLE IF NOT EXISTS police_responses (
+    lat_e5 INTEGER NOT NULL,      -- round(lat * 1e5)
+    lng_e5 INTEGER NOT NULL,
+    month TEXT NOT NULL,          -- YYYY-MM
+    n_crimes INTEGER NOT NULL,
+    body BLOB NOT NULL,           -- zlib(JSON response)
+    fetched_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (month, lat_e5, lng_e5)
+);
+"""
+
+
+def _key(lat: float, lng: float, month: str) -> Tuple[str, int, int]:
+    return month, round(lat * 1e5), round(lng * 1e5)
+
+
+class PoliceCache:
+    def __init__(self, path: Optional[str] = None):
+        self.path = str(path or DEFAULT_POLICE_CACHE_PATH)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._connect()
+        conn.executescript(DDL)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, lat: float, lng: float, month: str) -> Optional[List[Dict[str, Any]]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT body FROM police_responses WHERE month = ? AND lat_e5 = ? AND lng_e5 = ?",
+                _key(lat, lng, month),
+            ).fetchone()
+        finally:
+            conn.close()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, lat: float, lng: float, month: str, crimes: List[Dict[str, Any]]) -> None:
+        body = zlib.compress(json.dumps(crimes, separators=(",", ":")).encode(), COMPRESS_LEVEL)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO police_responses (month, lat_e5, lng_e5, n_crimes, body) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(month, lat_e5, lng_e5) DO UPDATE SET
+                        n_crimes = excluded.n_crimes,
+                        body = excluded.body,
+                        fetched_at = CURRENT_TIMESTAMP
+                    """,
+                    (*_key(lat, lng, month), len(crimes), body),
+                )
+        finally:
+            conn.close()
+
+    def months(self) -> Dict[str, int]:
+        """
+        month -> number of cached query points.
+        """
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT month, COUNT(*) FROM police_responses GROUP BY month ORDER BY month"))
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "lookups": lookups,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
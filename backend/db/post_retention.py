@@ -0,0 +1,320 @@
+"""
+Time-based partitioning and retention for posts (SQLite backend).
+
+  posts            hot partition: the last HOT_DAYS of posts. Every write and
+                   every /feed query goes here, so its size (and feed latency)
+                   stays flat however much history piles up.
+  posts_YYYY_MM    warm monthly partitions holding older posts.
+  posts_all        view over posts + all warm partitions, for history queries.
+  archive files    warm partitions older than ARCHIVE_AFTER_MONTHS are written
+                   to ARCHIVE_DIR as posts_YYYY_MM.jsonl.gz (or .parquet) and
+                   dropped from the DB. post_partitions records where each went.
+
+Run once with `python -m db.post_retention` (e.g. from cron, with the API's
+interval set to 0), or let main.py run it in the background every
+RETENTION_INTERVAL_S. Either way a pass first takes a lease in `meta`, so
+however many API workers and cron jobs share the DB, one pass runs at a time
+and at most one per interval.
+
+Config:
+  STREETSENSE_POSTS_HOT_DAYS             days kept in `posts` (default 30)
+  STREETSENSE_POSTS_ARCHIVE_MONTHS       months kept in warm partitions (default 6)
+  STREETSENSE_POSTS_ARCHIVE_DIR          archive directory (default backend/archive)
+  STREETSENSE_POSTS_ARCHIVE_FORMAT       "jsonl" (gzip) or "parquet" (needs pyarrow)
+  STREETSENSE_POSTS_RETENTION_INTERVAL_S background interval, <= 0 disables (default 3600)
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from db.db_writer import BULK_CHUNK_SIZE, DBWriter
+from db.storage import open_storage
+
+HOT_DAYS = int(os.getenv("STREETSENSE_POSTS_HOT_DAYS", "30"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("STREETSENSE_POSTS_ARCHIVE_MONTHS", "6"))
+ARCHIVE_DIR = Path(os.getenv(
+    "STREETSENSE_POSTS_ARCHIVE_DIR",
+    str(Path(__file__).resolve().parents[1] / "archive"),
+))
+ARCHIVE_FORMAT = os.getenv("STREETSENSE_POSTS_ARCHIVE_FORMAT", "jsonl")
+RETENTION_INTERVAL_S = float(os.getenv("STREETSENSE_POSTS_RETENTION_INTERVAL_S", "3600"))
+
+# meta key holding the unix ms until which the retention lease is held
+RETENTION_LEASE_KEY = "retention_lease_until_ms"
+
+# A pass that hasn't finished after this long is presumed dead
+RETENTION_MAX_PASS_S = 6 * 3600
+
+POST_COLUMNS = ["id", "lat", "long", "geohash", "severity", "category", "human", "content", "status", "created_at"]
+_COLS = ", ".join(POST_COLUMNS)
+
+
+def partition_name(month: str) -> str:
+    """
+    "2024-05" -> "posts_2024_05"
+    """
+    return "posts_" + month.replace("-", "_")
+
+
+def _create_partition(conn: sqlite3.Connection, name: str, month: str) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id TEXT PRIMARY KEY,
+            lat REAL NOT NULL,
+            long REAL NOT NULL,
+            geohash TEXT,
+            severity REAL NOT NULL,
+            category TEXT NOT NULL,
+            human INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'classified',
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_geohash ON {name}(geohash)")
+    conn.execute(
+        "INSERT INTO post_partitions (name, month) VALUES (?, ?) ON CONFLICT(name) DO NOTHING",
+        (name, month),
+    )
+
+
+def refresh_posts_view(conn: sqlite3.Connection) -> None:
+    """
+    Recreates posts_all over the hot table and every warm partition.
+    """
+    names = [
+        n for (n,) in conn.execute(
+            "SELECT name FROM post_partitions WHERE archived_path IS NULL ORDER BY month"
+        )
+    ]
+    parts = [f"SELECT {_COLS} FROM posts"] + [f"SELECT {_COLS} FROM {n}" for n in names]
+    conn.execute("DROP VIEW IF EXISTS posts_all")
+    conn.execute("CREATE VIEW posts_all AS " + "\nUNION ALL ".join(parts))
+
+
+def roll_cold_posts(db: DBWriter, *, hot_days: int = HOT_DAYS, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Moves posts older than hot_days from `posts` into their monthly partition,
+    chunk_size rows per transaction so writers are never blocked for long.
+    Posts still waiting for classification stay in the hot table.
+    Returns the number of rows moved.
+    """
+    conn = db._connect()
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f"-{int(hot_days)} days",)).fetchone()[0]
+    months = [
+        m for (m,) in conn.execute(
+            """
+            SELECT DISTINCT substr(created_at, 1, 7) FROM posts
+            WHERE created_at < ? AND status != 'pending'
+            ORDER BY 1
+            """,
+            (cutoff,),
+        )
+    ]
+
+    moved = 0
+    for month in months:
+        name = partition_name(month)
+        with conn:
+            _create_partition(conn, name, month)
+            refresh_posts_view(conn)
+
+        select = f"""
+            SELECT rowid FROM posts
+            WHERE created_at >= ? AND created_at < date(?, '+1 month') AND created_at < ?
+              AND status != 'pending'
+            LIMIT ?
+        """
+        args = (month + "-01", month + "-01", cutoff, chunk_size)
+        while True:
+            with conn:
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {name} ({_COLS}) SELECT {_COLS} FROM posts WHERE rowid IN ({select})",
+                    args,
+                )
+                n = conn.execute(f"DELETE FROM posts WHERE rowid IN ({select})", args).rowcount
+                conn.execute(
+                    "UPDATE post_partitions SET row_count = row_count + ? WHERE name = ?",
+                    (n, name),
+                )
+            moved += n
+            if n < chunk_size:
+                break
+        print(f"[retention] {month}: moved rows to {name}")
+
+    conn.close()
+    return moved
+
+
+def _write_jsonl_gz(path: Path, cur: sqlite3.Cursor) -> None:
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for row in cur:
+            f.write(json.dumps(dict(zip(POST_COLUMNS, row)), ensure_ascii=False))
+            f.write("\n")
+
+
+def _write_parquet(path: Path, cur: sqlite3.Cursor) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        while True:
+            rows = cur.fetchmany(BULK_CHUNK_SIZE)
+            if not rows:
+                break
+            table = pa.Table.from_pylist([dict(zip(POST_COLUMNS, r)) for r in rows])
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def archive_partitions(
+    db: DBWriter,
+    *,
+    older_than_months: int = ARCHIVE_AFTER_MONTHS,
+    archive_dir: Path = ARCHIVE_DIR,
+    fmt: str = ARCHIVE_FORMAT,
+) -> List[str]:
+    """
+    Writes each warm partition older than the cutoff to a compressed file,
+    then drops it. The file is complete on disk before the table goes.
+    Returns the archive paths written.
+    """
+    if fmt not in ("jsonl", "parquet"):
+        raise ValueError(f"unknown archive format {fmt!r}")
+
+    conn = db._connect()
+    cutoff = conn.execute(
+        "SELECT strftime('%Y-%m', 'now', 'start of month', ?)", (f"-{int(older_than_months)} months",)
+    ).fetchone()[0]
+    parts = conn.execute(
+        "SELECT name, month FROM post_partitions WHERE archived_path IS NULL AND month < ? ORDER BY month",
+        (cutoff,),
+    ).fetchall()
+
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for name, month in parts:
+        path = archive_dir / (name + (".jsonl.gz" if fmt == "jsonl" else ".parquet"))
+        tmp = path.with_name(path.name + ".tmp")
+
+        cur = conn.execute(f"SELECT {_COLS} FROM {name} ORDER BY created_at, id")
+        (_write_jsonl_gz if fmt == "jsonl" else _write_parquet)(tmp, cur)
+        os.replace(tmp, path)
+
+        with conn:
+            conn.execute(
+                "UPDATE post_partitions SET archived_path = ?, archived_at = CURRENT_TIMESTAMP WHERE name = ?",
+                (str(path), name),
+            )
+            refresh_posts_view(conn)
+            conn.execute(f"DROP TABLE {name}")
+        written.append(str(path))
+        print(f"[retention] archived {name} -> {path}")
+
+    conn.close()
+    return written
+
+
+def run_retention(db: Optional[DBWriter] = None) -> Dict[str, Any]:
+    db = db or DBWriter()
+    moved = roll_cold_posts(db)
+    archived = archive_partitions(db)
+    return {"moved": moved, "archived": archived}
+
+
+def _claim_lease(db: DBWriter, hold_s: float) -> Optional[int]:
+    """
+    Takes the retention lease if it has expired. Returns the lease token
+    (its expiry in unix ms) or None if another process holds it.
+    """
+    now = int(time.time() * 1000)
+    until = now + int(hold_s * 1000)
+    conn = db._connect()
+    try:
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)", (RETENTION_LEASE_KEY,))
+            n = conn.execute(
+                "UPDATE meta SET value = ? WHERE key = ? AND value <= ?",
+                (until, RETENTION_LEASE_KEY, now),
+            ).rowcount
+    finally:
+        conn.close()
+    return until if n == 1 else None
+
+
+def _hold_lease(db: DBWriter, token: int, hold_s: float) -> None:
+    # keeps the lease (if still ours) for hold_s more, so nobody else runs before then
+    conn = db._connect()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE meta SET value = ? WHERE key = ? AND value = ?",
+                (int(time.time() * 1000) + int(hold_s * 1000), RETENTION_LEASE_KEY, token),
+            )
+    finally:
+        conn.close()
+
+
+def run_retention_exclusive(db: Optional[DBWriter] = None, interval_s: float = 0.0) -> Optional[Dict[str, Any]]:
+    """
+    run_retention() under the lease; returns None without doing anything if
+    another process is mid-pass or ran one less than interval_s ago.
+    """
+    db = db or DBWriter()
+    token = _claim_lease(db, max(interval_s, RETENTION_MAX_PASS_S))
+    if token is None:
+        return None
+    try:
+        return run_retention(db)
+    finally:
+        _hold_lease(db, token, interval_s)
+
+
+def _retention_loop(db: DBWriter, interval_s: float) -> None:
+    while True:
+        try:
+            result = run_retention_exclusive(db, interval_s)
+            if result and (result["moved"] or result["archived"]):
+                print(f"[retention] moved {result['moved']} posts, archived {len(result['archived'])} partitions")
+        except Exception as e:
+            print(f"[retention] failed: {e}")
+        time.sleep(interval_s)
+
+
+def start_retention_worker(interval_s: float = RETENTION_INTERVAL_S) -> Optional[threading.Thread]:
+    """
+    Starts the background retention job on a daemon thread. Every API
+    process may start one; the lease lets only one of them run each pass.
+    Only the SQLite backend is partitioned this way; returns None otherwise
+    or when disabled.
+    """
+    if interval_s <= 0:
+        return None
+    db = open_storage()
+    if not isinstance(db, DBWriter):
+        return None
+
+    t = threading.Thread(target=_retention_loop, args=(db, interval_s), name="post-retention", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    result = run_retention_exclusive()
+    if result is None:
+        print("Another retention pass is running; nothing done")
+    else:
+        print(f"✅ Moved {result['moved']} posts, archived {len(result['archived'])} partitions")
@@ -0,0 +1,559 @@
+"""
+Postgres/PostGIS storage backend.
+
+Same interface and row shapes as DBWriter, for deployments that outgrow one
+SQLite file. Points are stored as generated geography columns with GiST
+indexes, so radius, bbox and nearest queries are index scans, and
+connections come from a psycopg_pool pool shared by all threads.
+
+Select it with STREETSENSE_DB_URL=postgresql://... (see db/storage.py) and
+create the schema once with:
+
+  python -m db.postgis_writer postgresql://...
+"""
+
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import ConnectionPool
+
+from db import geohash
+from db.db_writer import BULK_CHUNK_SIZE, CATEGORIES, _chunks, _with_keys
+from db.storage import Storage
+
+PG_POOL_MAX = int(os.getenv("STREETSENSE_PG_POOL_MAX", "10"))
+
+# Timestamps leave the DB in the same text form SQLite's CURRENT_TIMESTAMP uses
+_TS = "to_char({col} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+_NOW = "date_trunc('second', now())"
+_POINT = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography"
+
+_CAT_COLS = "\n".join(f"    {c} DOUBLE PRECISION NOT NULL DEFAULT 0.0," for c in CATEGORIES)
+_GEOM = "geom geography(Point, 4326) GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(long, lat), 4326)::geography) STORED"
+
+SCHEMA = f"""
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,
+    long DOUBLE PRECISION NOT NULL,
+    geohash TEXT,
+    {_GEOM},
+    severity DOUBLE PRECISION NOT NULL,
+    category TEXT NOT NULL,
+    human BOOLEAN NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS truth (
+    lat DOUBLE PRECISION NOT NULL,
+    long DOUBLE PRECISION NOT NULL,
+    geohash TEXT UNIQUE,
+    {_GEOM},
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW},
+{_CAT_COLS}
+    PRIMARY KEY (lat, long)
+);
+
+CREATE TABLE IF NOT EXISTS truth_rollup (
+    level INTEGER NOT NULL,
+    geohash TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ,
+{_CAT_COLS}
+    PRIMARY KEY (level, geohash)
+);
+
+CREATE TABLE IF NOT EXISTS truth_events (
+    id BIGSERIAL PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,
+    long DOUBLE PRECISION NOT NULL,
+    geohash TEXT NOT NULL,
+    category TEXT NOT NULL,
+    severity DOUBLE PRECISION NOT NULL,
+    alpha DOUBLE PRECISION NOT NULL,
+    source TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW}
+);
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'classified';
+
+CREATE TABLE IF NOT EXISTS post_queue (
+    post_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    locked_until DOUBLE PRECISION,
+    last_error TEXT,
+    enqueued_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW}
+);
+
+-- Latest bulk overwrite of each truth cell; supersedes its events up to after_event
+CREATE TABLE IF NOT EXISTS truth_snapshots (
+    geohash TEXT PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,
+    long DOUBLE PRECISION NOT NULL,
+{_CAT_COLS}
+    source TEXT NOT NULL,
+    after_event BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS applied_writes (
+    key TEXT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT {_NOW}
+);
+
+CREATE INDEX IF NOT EXISTS idx_posts_geom ON posts USING GIST (geom);
+CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_truth_geom ON truth USING GIST (geom);
+CREATE INDEX IF NOT EXISTS idx_truth_events_created_at ON truth_events (created_at);
+CREATE INDEX IF NOT EXISTS idx_post_queue_next ON post_queue (next_attempt_at);
+
+CREATE OR REPLACE FUNCTION truth_rollup_sync() RETURNS trigger AS $$
+DECLARE lvl int;
+BEGIN
+    FOREACH lvl IN ARRAY ARRAY[{", ".join(str(l) for l in geohash.ROLLUP_LEVELS)}] LOOP
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE truth_rollup SET
+                n = n - 1,
+                {", ".join(f"{c} = {c} - OLD.{c}" for c in CATEGORIES)}
+            WHERE level = lvl AND geohash = left(OLD.geohash, lvl);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO truth_rollup (level, geohash, n, updated_at, {", ".join(CATEGORIES)})
+            VALUES (lvl, left(NEW.geohash, lvl), 1, NEW.updated_at,
+                    {", ".join(f"NEW.{c}" for c in CATEGORIES)})
+            ON CONFLICT (level, geohash) DO UPDATE SET
+                n = truth_rollup.n + 1,
+                updated_at = excluded.updated_at,
+                {", ".join(f"{c} = truth_rollup.{c} + excluded.{c}" for c in CATEGORIES)};
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_truth_rollup ON truth;
+CREATE TRIGGER trg_truth_rollup AFTER INSERT OR UPDATE OR DELETE ON truth
+    FOR EACH ROW EXECUTE FUNCTION truth_rollup_sync();
+"""
+
+_BUMP_VERSION = """
+    INSERT INTO meta (key, value) VALUES ('truth_version', 1)
+    ON CONFLICT (key) DO UPDATE SET value = meta.value + 1
+"""
+
+_CLAIM_WRITE_SQL = "INSERT INTO applied_writes (key) VALUES (%s) ON CONFLICT (key) DO NOTHING"
+
+
+def _claim_write(cur, key: Optional[str]) -> bool:
+    if key is None:
+        return True
+    cur.execute(_CLAIM_WRITE_SQL, (key,))
+    return cur.rowcount == 1
+
+
+_LOG_EVENT_SQL = """
+    INSERT INTO truth_events (lat, long, geohash, category, severity, alpha, source)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+_SNAPSHOT_SQL = f"""
+    INSERT INTO truth_snapshots (geohash, lat, long, {", ".join(CATEGORIES)}, source, after_event, updated_at)
+    VALUES (%s, %s, %s, {", ".join(["%s"] * len(CATEGORIES))}, %s, %s, {_NOW})
+    ON CONFLICT (geohash) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in CATEGORIES)},
+        source = excluded.source,
+        after_event = excluded.after_event,
+        updated_at = excluded.updated_at,
+        created_at = {_NOW}
+"""
+
+_TRUTH_SELECT = f"lat, long, {_TS.format(col='updated_at')} AS updated_at, {', '.join(CATEGORIES)}"
+
+
+def _ema_upsert_sql(col: str) -> str:
+    # Parameters: (lat, long, geohash, alpha * severity, alpha)
+    return f"""
+        INSERT INTO truth (lat, long, geohash, {col})
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (lat, long) DO UPDATE SET
+            {col} = (1 - %s) * truth.{col} + excluded.{col},
+            updated_at = {_NOW}
+    """
+
+
+class PostGISWriter(Storage):
+    def __init__(self, url: str, max_size: int = PG_POOL_MAX):
+        self.url = url
+        self.pool = ConnectionPool(url, min_size=1, max_size=max_size, kwargs={"row_factory": dict_row})
+
+    def init_schema(self) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(SCHEMA)
+
+    def close(self) -> None:
+        self.pool.close()
+
+    # --- posts ---
+
+    def insert_post(
+        self,
+        *,
+        lat: float,
+        long: float,
+        severity: float,
+        category: str,
+        content: str,
+        human: bool,
+    ) -> Dict[str, Any]:
+        (post_id,) = self.bulk_insert_posts([{
+            "lat": lat, "long": long, "severity": severity,
+            "category": category, "content": content, "human": human,
+        }])
+        return {"id": post_id}
+
+    def bulk_insert_posts(
+        self,
+        posts: Iterable[Dict[str, Any]],
+        *,
+        keys: Optional[Sequence[str]] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[str]:
+        ids: List[str] = []
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            for chunk in _chunks(_with_keys(posts, keys), chunk_size):
+                rows = []
+                for p, key in chunk:
+                    if not _claim_write(cur, key):
+                        continue
+                    post_id = str(uuid4())
+                    ids.append(post_id)
+                    category = p["category"] if p["category"] in CATEGORIES else "other"
+                    rows.append((
+                        post_id, p["lat"], p["long"], geohash.encode(p["lat"], p["long"]),
+                        float(p["severity"]), category, bool(p["human"]), p["content"],
+                    ))
+                cur.executemany(
+                    """
+                    INSERT INTO posts (id, lat, long, geohash, severity, category, human, content)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    rows,
+                )
+        return ids
+
+    def get_feed(
+        self,
+        *,
+        lat: float,
+        lng: float,
+        radius: float = 500,
+        limit: int = 500,
+        before: Optional[str] = None,
+        before_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        params: List[Any] = [lng, lat, radius]
+
+        cursor_sql = ""
+        if before is not None:
+            if before_id is not None:
+                cursor_sql = "AND (p.created_at, p.id) < ((%s::timestamp AT TIME ZONE 'UTC'), %s)"
+                params.extend([before, before_id])
+            else:
+                cursor_sql = "AND p.created_at < (%s::timestamp AT TIME ZONE 'UTC')"
+                params.append(before)
+        params.append(limit)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT p.id, p.lat, p.long, p.severity, p.category, p.human, p.content, p.status,
+                       {_TS.format(col='p.created_at')} AS ts,
+                       ST_Distance(p.geom, q.pt) AS distance
+                FROM posts p, (SELECT {_POINT} AS pt) q
+                WHERE ST_DWithin(p.geom, q.pt, %s)
+                  {cursor_sql}
+                ORDER BY p.created_at DESC, p.id DESC
+                LIMIT %s
+                """,
+                params,
+            ).fetchall()
+
+        return [
+            {
+                "id": r["id"],
+                "lat": r["lat"],
+                "lng": r["long"],
+                "content": r["content"],
+                "severity": float(r["severity"]),
+                "category": r["category"],
+                "human": bool(r["human"]),
+                "status": r["status"],
+                "distance": float(r["distance"]),
+                "timestamp": r["ts"],
+            }
+            for r in rows
+        ]
+
+    # --- post classification queue ---
+
+    def enqueue_post(
+        self,
+        *,
+        lat: float,
+        long: float,
+        content: str,
+    ) -> Dict[str, Any]:
+        post_id = str(uuid4())
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO posts (id, lat, long, geohash, severity, category, human, content, status)
+                VALUES (%s, %s, %s, %s, 0.0, 'other', true, %s, 'pending')
+                """,
+                (post_id, lat, long, geohash.encode(lat, long), content),
+            )
+            conn.execute(
+                "INSERT INTO post_queue (post_id, next_attempt_at) VALUES (%s, %s)",
+                (post_id, time.time()),
+            )
+        return {"id": post_id}
+
+    def claim_post_jobs(self, *, limit: int, lease_s: float) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                """
+                UPDATE post_queue q SET locked_until = %s
+                FROM posts p
+                WHERE p.id = q.post_id AND q.post_id IN (
+                    SELECT post_id FROM post_queue
+                    WHERE next_attempt_at <= %s
+                      AND (locked_until IS NULL OR locked_until < %s)
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING q.post_id, q.attempts, p.content
+                """,
+                (now + lease_s, now, now, limit),
+            ).fetchall()
+        return [{"id": r["post_id"], "content": r["content"], "attempts": r["attempts"]} for r in rows]
+
+    def complete_post_jobs(self, results: Iterable[Tuple[str, float, str]]) -> int:
+        rows = [
+            (float(sev), cat if cat in CATEGORIES else "other", pid)
+            for pid, sev, cat in results
+        ]
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                "UPDATE posts SET severity = %s, category = %s, status = 'classified' WHERE id = %s",
+                rows,
+            )
+            cur.executemany("DELETE FROM post_queue WHERE post_id = %s", [(r[2],) for r in rows])
+        return len(rows)
+
+    def retry_post_job(self, post_id: str, *, error: str, delay_s: float | None) -> None:
+        with self.pool.connection() as conn:
+            if delay_s is None:
+                conn.execute("UPDATE posts SET status = 'failed' WHERE id = %s", (post_id,))
+                conn.execute("DELETE FROM post_queue WHERE post_id = %s", (post_id,))
+            else:
+                conn.execute(
+                    """
+                    UPDATE post_queue
+                    SET attempts = attempts + 1, next_attempt_at = %s,
+                        locked_until = NULL, last_error = %s
+                    WHERE post_id = %s
+                    """,
+                    (time.time() + delay_s, error[:500], post_id),
+                )
+
+    def count_post_queue(self) -> int:
+        with self.pool.connection() as conn:
+            return int(conn.execute("SELECT COUNT(*) AS n FROM post_queue").fetchone()["n"])
+
+    # --- truth writes ---
+
+    def update_truth(
+        self,
+        *,
+        lat: float,
+        long: float,
+        category: str,
+        severity: float,
+        alpha: float = 0.25,
+        source: str = "unknown",
+        key: Optional[str] = None,
+    ) -> None:
+        self.bulk_update_truth_ema(
+            [(lat, long, category, severity, alpha)], source=source,
+            keys=None if key is None else [key],
+        )
+
+    def bulk_upsert_truth(
+        self,
+        rows: Iterable[Tuple[float, float, Dict[str, float]]],
+        *,
+        source: str | None = "upsert",
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        cols = ", ".join(CATEGORIES)
+        sql = f"""
+            INSERT INTO truth (lat, long, geohash, updated_at, {cols})
+            VALUES (%s, %s, %s, {_NOW}, {", ".join(["%s"] * len(CATEGORIES))})
+            ON CONFLICT (lat, long) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                {", ".join(f"{c} = excluded.{c}" for c in CATEGORIES)}
+        """
+
+        n = 0
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(id), 0) AS n FROM truth_events")
+            after_event = cur.fetchone()["n"]
+            for chunk in _chunks(rows, chunk_size):
+                params = []
+                snapshots = []
+                for lat, long, values in chunk:
+                    lat, long, cell = geohash.snap(lat, long)
+                    vals = [float(values.get(c, 0.0)) for c in CATEGORIES]
+                    params.append((lat, long, cell, *vals))
+                    if source is not None:
+                        snapshots.append((cell, lat, long, *vals, source, after_event))
+                cur.executemany(sql, params)
+                if snapshots:
+                    cur.executemany(_SNAPSHOT_SQL, snapshots)
+                n += len(params)
+            cur.execute(_BUMP_VERSION)
+        return n
+
+    def bulk_update_truth_ema(
+        self,
+        updates: Iterable[Tuple[float, float, str, float, float]],
+        *,
+        source: str = "unknown",
+        keys: Optional[Sequence[str]] = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        n = 0
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            for chunk in _chunks(_with_keys(updates, keys), chunk_size):
+                by_col: Dict[str, List[Tuple[Any, ...]]] = {}
+                events = []
+                for (lat, long, category, severity, alpha), key in chunk:
+                    if not _claim_write(cur, key):
+                        continue
+                    col = category if category in CATEGORIES else "other"
+                    lat, long, cell = geohash.snap(lat, long)
+                    by_col.setdefault(col, []).append(
+                        (lat, long, cell, alpha * float(severity), alpha)
+                    )
+                    events.append((lat, long, cell, col, float(severity), alpha, source))
+                for col, params in by_col.items():
+                    cur.executemany(_ema_upsert_sql(col), params)
+                cur.executemany(_LOG_EVENT_SQL, events)
+                n += len(events)
+            cur.execute(_BUMP_VERSION)
+        return n
+
+    # --- truth reads ---
+
+    def get_truth(self, *, lat: float, long: float) -> Dict[str, Any] | None:
+        lat, long, _ = geohash.snap(lat, long)
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f"SELECT {_TRUTH_SELECT} FROM truth WHERE lat = %s AND long = %s",
+                (lat, long),
+            ).fetchone()
+
+    def get_truth_nearest(self, *, lat: float, lng: float) -> Dict[str, Any] | None:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f"SELECT {_TRUTH_SELECT} FROM truth ORDER BY geom <-> {_POINT} LIMIT 1",
+                (lng, lat),
+            ).fetchone()
+
+    def get_truth_in_bbox(
+        self,
+        *,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        limit: int = 50000,
+    ) -> List[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f"""
+                SELECT {_TRUTH_SELECT} FROM truth
+                WHERE geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)::geography
+                LIMIT %s
+                """,
+                (west, south, east, north, limit),
+            ).fetchall()
+
+    def get_truth_rollup(
+        self,
+        *,
+        level: int,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+    ) -> List[Dict[str, Any]]:
+        # a few coarse prefixes instead of every cell; all share one length.
+        # left() rather than string ranges, which depend on the collation
+        prefixes = geohash.cover_prefixes(south, west, north, east, level)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT geohash, n, {_TS.format(col='updated_at')} AS updated_at, {", ".join(CATEGORIES)}
+                FROM truth_rollup
+                WHERE level = %s AND n > 0 AND left(geohash, %s) = ANY(%s)
+                """,
+                (level, len(prefixes[0]), prefixes),
+            ).fetchall()
+
+        out: List[Dict[str, Any]] = []
+        for r in rows:
+            if not geohash.intersects(r["geohash"], south, west, north, east):
+                continue
+            clat, clng = geohash.decode(r["geohash"])
+            d = {"geohash": r["geohash"], "lat": clat, "long": clng, "n": r["n"], "updated_at": r["updated_at"]}
+            d.update({c: r[c] / r["n"] for c in CATEGORIES})
+            out.append(d)
+        return out
+
+    def count_truth_rows(self) -> int:
+        with self.pool.connection() as conn:
+            return int(conn.execute("SELECT COUNT(*) AS n FROM truth").fetchone()["n"])
+
+    def get_truth_version(self) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'truth_version'").fetchone()
+        return int(row["value"]) if row else 0
+
+    def fetch_truth_columns(self) -> List[Tuple[Any, ...]]:
+        with self.pool.connection() as conn, conn.cursor(row_factory=tuple_row) as cur:
+            cur.execute(f"SELECT {_TRUTH_SELECT} FROM truth")
+            return cur.fetchall()
+
+
+if __name__ == "__main__":
+    w = PostGISWriter(sys.argv[1] if len(sys.argv) > 1 else os.environ["STREETSENSE_DB_URL"])
+    w.init_schema()
+    print("✅ Initialized PostGIS schema")
+    w.close()
@@ -0,0 +1,283 @@
+"""
+Checkpoints for pipeline runs, so a crashed or killed run resumes instead of
+starting over.
+
+A run is one pass of a pipeline over one input (a mock data file, a live
+sweep). Every item the run touches gets a row holding the last stage it
+completed, in STAGES order, plus an optional JSON payload with what the next
+stage needs (e.g. the validation result). Items dropped by a gate are marked
+SKIPPED. Opening a pipeline again resumes its latest unfinished run, so
+items that already reached a stage aren't sent to the model again.
+
+Writes to the app DB pass idempotency_key(item, what) as their key (see
+db/storage.py). If a run dies after a write committed but before the item was
+marked "written", the resumed run repeats the write and the DB skips it.
+
+The state lives in its own SQLite file so it works whichever storage backend
+the app uses.
+
+Config:
+  STREETSENSE_RUN_STATE_PATH  state file (default backend/run_state.db)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+DEFAULT_RUN_STATE_PATH = Path(os.getenv(
+    "STREETSENSE_RUN_STATE_PATH",
+    str(Path(__file__).resolve().parents[1] / "run_state.db"),
+))
+
+STAGES = ["scraped", "validated", "classified", "written"]
+SKIPPED = "skipped"
+
+DDL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    input TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',   -- 'running' | 'done'
+    attempt INTEGER NOT NULL DEFAULT 1,       -- bumped on every resume
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS run_items (
+    run_id TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT,
+    attempt INTEGER NOT NULL DEFAULT 1,       -- attempt that last touched the item
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, item_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_runs_pipeline ON runs(pipeline, input, status);
+CREATE INDEX IF NOT EXISTS idx_run_items_stage ON run_items(run_id, stage);
+"""
+
+
+class RunState:
+    def __init__(
+        self,
+        pipeline: str,
+        input_id: str = "",
+        *,
+        resume: bool = True,
+        keep_done: bool = True,
+        path: Optional[str] = None,
+    ):
+        """
+        keep_done=False drops items once written or skipped instead of
+        keeping them, for open-ended runs whose input isn't re-read on resume.
+        """
+        self.pipeline = pipeline
+        self.input_id = input_id
+        self.keep_done = keep_done
+        self.path = str(path or DEFAULT_RUN_STATE_PATH)
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.executescript(DDL)
+        # state files from before attempts were tracked
+        for table in ("runs", "run_items"):
+            if "attempt" not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN attempt INTEGER NOT NULL DEFAULT 1")
+
+        row = None
+        if resume:
+            row = conn.execute(
+                """
+                SELECT run_id, attempt FROM runs
+                WHERE pipeline = ? AND input = ? AND status = 'running'
+                ORDER BY created_at DESC LIMIT 1
+                """,
+                (pipeline, input_id),
+            ).fetchone()
+
+        self.resumed = row is not None
+        if row is not None:
+            self.run_id = row[0]
+            self.attempt = row[1] + 1
+            with conn:
+                conn.execute("UPDATE runs SET attempt = ? WHERE run_id = ?", (self.attempt, self.run_id))
+        else:
+            self.run_id = str(uuid4())
+            self.attempt = 1
+            with conn:
+                conn.execute(
+                    "INSERT INTO runs (run_id, pipeline, input) VALUES (?, ?, ?)",
+                    (self.run_id, pipeline, input_id),
+                )
+        conn.close()
+
+        if self.resumed:
+            print(f"[run-state] resuming {pipeline} run {self.run_id}: {self.counts()}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def idempotency_key(self, item_key: str, what: str) -> str:
+        return f"{self.pipeline}:{self.run_id}:{item_key}:{what}"
+
+    def stages(self) -> Dict[str, str]:
+        """
+        item_key -> last completed stage, for every item of this run.
+        """
+        conn = self._connect()
+        try:
+            return dict(conn.execute(
+                "SELECT item_key, stage FROM run_items WHERE run_id = ?", (self.run_id,)
+            ))
+        finally:
+            conn.close()
+
+    def at_stage(self, stage: str) -> List[Tuple[str, Any]]:
+        """
+        (item_key, payload) of the items whose last completed stage is `stage`.
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT item_key, payload FROM run_items WHERE run_id = ? AND stage = ?",
+                (self.run_id, stage),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(k, json.loads(p) if p is not None else None) for k, p in rows]
+
+    def mark(self, entries: Iterable[Tuple[str, str, Any]]) -> None:
+        """
+        entries: (item_key, stage, payload) with a JSON-serializable payload
+        (None keeps the previous one). One transaction for all of them.
+        """
+        rows = []
+        done = []
+        for key, stage, payload in entries:
+            if not self.keep_done and stage in ("written", SKIPPED):
+                done.append((self.run_id, key))
+            else:
+                rows.append((self.run_id, key, stage, json.dumps(payload) if payload is not None else None,
+                             self.attempt))
+        if not rows and not done:
+            return
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        """
+                        INSERT INTO run_items (run_id, item_key, stage, payload, attempt) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(run_id, item_key) DO UPDATE SET
+                            stage = excluded.stage,
+                            payload = coalesce(excluded.payload, payload),
+                            attempt = excluded.attempt,
+                            updated_at = CURRENT_TIMESTAMP
+                        """,
+                        rows,
+                    )
+                    conn.executemany("DELETE FROM run_items WHERE run_id = ? AND item_key = ?", done)
+                    conn.execute(
+                        "UPDATE runs SET updated_at = CURRENT_TIMESTAMP WHERE run_id = ?", (self.run_id,)
+                    )
+            finally:
+                conn.close()
+
+    def claim(self, keys: List[str]) -> Dict[str, Tuple[str, Any]]:
+        """
+        For streaming inputs, where the run can't hold every item's state in
+        memory: looks up only `keys`, records the new ones as "scraped", and
+        returns key -> (stage, payload) for the keys this attempt should work
+        on. Leaves out written/skipped items and keys this attempt already
+        claimed (duplicates in the input).
+        """
+        out: Dict[str, Tuple[str, Any]] = {}
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    known = {}
+                    for start in range(0, len(keys), 500):
+                        part = keys[start:start + 500]
+                        marks = ",".join("?" * len(part))
+                        for k, stage, payload, attempt in conn.execute(
+                            f"""
+                            SELECT item_key, stage, payload, attempt FROM run_items
+                            WHERE run_id = ? AND item_key IN ({marks})
+                            """,
+                            (self.run_id, *part),
+                        ):
+                            known[k] = (stage, payload, attempt)
+
+                    new = []
+                    for k in keys:
+                        if k in out:
+                            continue
+                        if k not in known:
+                            new.append((self.run_id, k, "scraped", self.attempt))
+                            out[k] = ("scraped", None)
+                            continue
+                        stage, payload, attempt = known[k]
+                        if attempt == self.attempt or stage in ("written", SKIPPED):
+                            continue
+                        out[k] = (stage, json.loads(payload) if payload is not None else None)
+
+                    conn.executemany(
+                        "INSERT INTO run_items (run_id, item_key, stage, attempt) VALUES (?, ?, ?, ?)", new
+                    )
+                    conn.executemany(
+                        "UPDATE run_items SET attempt = ? WHERE run_id = ? AND item_key = ?",
+                        [(self.attempt, self.run_id, k) for k in out if k in known],
+                    )
+            finally:
+                conn.close()
+        return out
+
+    def counts(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            return dict(conn.execute(
+                "SELECT stage, COUNT(*) FROM run_items WHERE run_id = ? GROUP BY stage", (self.run_id,)
+            ))
+        finally:
+            conn.close()
+
+    def complete(self, max_attempts: Optional[int] = None) -> bool:
+        """
+        finish() if every item is written or skipped; otherwise the run stays
+        open so the next one retries the rest. With max_attempts, a run on
+        its max_attempts-th attempt finishes anyway and gives up on what's
+        left, so items that always fail can't hold it open forever. Returns
+        whether it finished.
+        """
+        left = {s: n for s, n in self.counts().items() if s not in ("written", SKIPPED)}
+        if left:
+            if max_attempts is None or self.attempt < max_attempts:
+                print(f"[run-state] {self.pipeline} run {self.run_id} left unfinished: {left}")
+                return False
+            print(f"[run-state] {self.pipeline} run {self.run_id} giving up after {self.attempt} attempts: {left}")
+        self.finish()
+        return True
+
+    def finish(self) -> None:
+        """
+        Marks the run done and drops its item rows; the next open starts fresh.
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "UPDATE runs SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE run_id = ?",
+                        (self.run_id,),
+                    )
+                    conn.execute("DELETE FROM run_items WHERE run_id = ?", (self.run_id,))
+            finally:
+                conn.close()
@@ -0,0 +1,162 @@
+"""
+Storage interface behind every query the app makes.
+
+DBWriter (db/db_writer.py) is the SQLite implementation and PostGISWriter
+(db/postgis_writer.py) the Postgres/PostGIS one. Code that doesn't care which
+it talks to should get an instance from open_storage().
+
+Truth and post writes optionally take idempotency keys (`key` / `keys`, one
+per row): a row whose key was already applied is skipped, so retried or
+resumed pipeline runs never fold the same update into the EMA twice.
+
+Config:
+  STREETSENSE_DB_URL  "postgresql://..." for PostGIS; a file path or
+                      "sqlite:///path" for SQLite (default: backend/app.db)
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class Storage(ABC):
+    # --- posts ---
+
+    @abstractmethod
+    def insert_post(
+        self,
+        *,
+        lat: float,
+        long: float,
+        severity: float,
+        category: str,
+        content: str,
+        human: bool,
+    ) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    def bulk_insert_posts(
+        self,
+        posts: Iterable[Dict[str, Any]],
+        *,
+        keys: Optional[Sequence[str]] = None,
+    ) -> List[str]: ...
+
+    @abstractmethod
+    def get_feed(
+        self,
+        *,
+        lat: float,
+        lng: float,
+        radius: float = 500,
+        limit: int = 500,
+        before: Optional[str] = None,
+        before_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]: ...
+
+    # --- post classification queue (see post_worker.py) ---
+
+    @abstractmethod
+    def enqueue_post(
+        self,
+        *,
+        lat: float,
+        long: float,
+        content: str,
+    ) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    def claim_post_jobs(self, *, limit: int, lease_s: float) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def complete_post_jobs(self, results: Iterable[Tuple[str, float, str]]) -> int: ...
+
+    @abstractmethod
+    def retry_post_job(self, post_id: str, *, error: str, delay_s: float | None) -> None: ...
+
+    @abstractmethod
+    def count_post_queue(self) -> int: ...
+
+    # --- truth writes ---
+
+    @abstractmethod
+    def update_truth(
+        self,
+        *,
+        lat: float,
+        long: float,
+        category: str,
+        severity: float,
+        alpha: float = 0.25,
+        source: str = "unknown",
+        key: Optional[str] = None,
+    ) -> None: ...
+
+    @abstractmethod
+    def bulk_upsert_truth(
+        self,
+        rows: Iterable[Tuple[float, float, Dict[str, float]]],
+        *,
+        source: str | None = "upsert",
+    ) -> int: ...
+
+    @abstractmethod
+    def bulk_update_truth_ema(
+        self,
+        updates: Iterable[Tuple[float, float, str, float, float]],
+        *,
+        source: str = "unknown",
+        keys: Optional[Sequence[str]] = None,
+    ) -> int: ...
+
+    # --- truth reads ---
+
+    @abstractmethod
+    def get_truth(self, *, lat: float, long: float) -> Dict[str, Any] | None: ...
+
+    @abstractmethod
+    def get_truth_nearest(self, *, lat: float, lng: float) -> Dict[str, Any] | None: ...
+
+    @abstractmethod
+    def get_truth_in_bbox(
+        self,
+        *,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        limit: int = 50000,
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def get_truth_rollup(
+        self,
+        *,
+        level: int,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def count_truth_rows(self) -> int: ...
+
+    @abstractmethod
+    def get_truth_version(self) -> int: ...
+
+    @abstractmethod
+    def fetch_truth_columns(self) -> List[Tuple[Any, ...]]: ...
+
+
+def open_storage(url: str | None = None) -> Storage:
+    url = url or os.getenv("STREETSENSE_DB_URL", "")
+
+    if url.startswith(("postgres://", "postgresql://")):
+        from db.postgis_writer import PostGISWriter
+        return PostGISWriter(url)
+
+    from db.db_writer import DBWriter
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return DBWriter(url or None)
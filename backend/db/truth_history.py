@@ -0,0 +1,283 @@
+"""
+Maintenance jobs for the append-only truth_events log (SQLite backend).
+
+  python -m db.truth_history compact --days 30
+      Folds events older than N days into truth_events_daily, one row per
+      (day, truth cell, category), and deletes the raw events.
+
+  python -m db.truth_history rebuild [--force]
+      Recomputes the whole truth table from truth_snapshots, truth_events_daily
+      and truth_events in one vectorized pass. Refuses if truth has rows the
+      log can't explain (e.g. written by hand) unless --force.
+
+Both rely on the EMA being a linear recurrence. Each event i turns a value v
+into keep_i * v + add_i, with keep = 1 - alpha and add = alpha * severity.
+A run of events therefore folds into one (keep, add) pair, and the value
+after a sequence is sum_i add_i * prod_{j > i} keep_j. A cell with a snapshot
+(its latest bulk overwrite) starts from the snapshot instead of 0, and only
+the events after the snapshot count.
+"""
+
+import argparse
+import sqlite3
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from db import geohash
+from db.db_writer import CATEGORIES, DBWriter, _bump_truth_version
+
+
+def fold_ema(codes: np.ndarray, keep: np.ndarray, add: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    codes must be sorted so each group is contiguous, with its events in time
+    order. Returns (group start indices, folded add, folded keep) per group.
+    Overwrites (keep == 0) are handled exactly.
+    """
+    n = len(codes)
+    if n == 0:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.intp), empty, empty
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n]
+    gid = np.repeat(np.arange(len(starts)), ends - starts)
+    last = ends - 1
+
+    zero = keep <= 0.0
+    cs = np.cumsum(np.log(np.where(zero, 1.0, keep)))
+    zc = np.cumsum(zero)
+
+    # log of prod_{j > i} keep_j within the group, and overwrites after i
+    log_after = cs[last][gid] - cs
+    zeros_after = zc[last][gid] - zc
+    weight = np.where(zeros_after == 0, np.exp(log_after), 0.0)
+    value = np.bincount(gid, weights=add * weight, minlength=len(starts))
+
+    cs_before = np.r_[0.0, cs][starts]
+    zc_before = np.r_[0, zc][starts]
+    total_keep = np.where(zc[last] > zc_before, 0.0, np.exp(cs[last] - cs_before))
+    return starts, value, total_keep
+
+
+def _group_codes(cells: np.ndarray, cats: np.ndarray) -> np.ndarray:
+    keys = np.char.add(np.char.add(cells.astype(str), "|"), cats.astype(str))
+    _, codes = np.unique(keys, return_inverse=True)
+    return codes
+
+
+def compact(db: DBWriter, *, older_than_days: int = 30) -> int:
+    """
+    Folds every full day older than the cutoff into truth_events_daily, one
+    transaction per day, and drops idempotency keys older than the cutoff.
+    Returns the number of events folded.
+    """
+    conn = db._connect()
+    days = [
+        d for (d,) in conn.execute(
+            """
+            SELECT DISTINCT substr(created_at, 1, 10) FROM truth_events
+            WHERE created_at < date('now', ?)
+            ORDER BY 1
+            """,
+            (f"-{int(older_than_days)} days",),
+        )
+    ]
+
+    folded = 0
+    for day in days:
+        # events a later snapshot overwrote are dropped rather than folded
+        rows = conn.execute(
+            """
+            SELECT e.geohash, e.category, e.severity, e.alpha
+            FROM truth_events e LEFT JOIN truth_snapshots s ON s.geohash = e.geohash
+            WHERE e.created_at >= ? AND e.created_at < date(?, '+1 day')
+              AND (s.geohash IS NULL OR e.id > s.after_event)
+            ORDER BY e.id
+            """,
+            (day, day),
+        ).fetchall()
+        if not rows:
+            with conn:
+                conn.execute(
+                    "DELETE FROM truth_events WHERE created_at >= ? AND created_at < date(?, '+1 day')",
+                    (day, day),
+                )
+            continue
+
+        cells = np.array([r[0] for r in rows])
+        cats = np.array([r[1] for r in rows])
+        sev = np.array([r[2] for r in rows], dtype=np.float64)
+        alpha = np.array([r[3] for r in rows], dtype=np.float64)
+
+        codes = _group_codes(cells, cats)
+        order = np.argsort(codes, kind="stable")
+        codes, cells, cats, sev, alpha = codes[order], cells[order], cats[order], sev[order], alpha[order]
+
+        starts, add, keep = fold_ema(codes, 1.0 - alpha, alpha * sev)
+        ends = np.r_[starts[1:], len(codes)]
+        counts = ends - starts
+        sev_sum = np.add.reduceat(sev, starts)
+        sev_max = np.maximum.reduceat(sev, starts)
+
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO truth_events_daily
+                    (day, geohash, category, n, severity_sum, severity_max, keep, ema_add)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(day, geohash, category) DO UPDATE SET
+                    n = n + excluded.n,
+                    severity_sum = severity_sum + excluded.severity_sum,
+                    severity_max = max(severity_max, excluded.severity_max),
+                    ema_add = ema_add * excluded.keep + excluded.ema_add,
+                    keep = keep * excluded.keep
+                """,
+                [
+                    (day, str(cells[s]), str(cats[s]), int(c), float(ss), float(sm), float(k), float(a))
+                    for s, c, ss, sm, k, a in zip(starts, counts, sev_sum, sev_max, keep, add)
+                ],
+            )
+            conn.execute(
+                "DELETE FROM truth_events WHERE created_at >= ? AND created_at < date(?, '+1 day')",
+                (day, day),
+            )
+        folded += len(rows)
+        print(f"[compact] {day}: {len(rows)} events -> {len(starts)} daily rows")
+
+    # Idempotency keys only matter while a run can still be resumed
+    with conn:
+        conn.execute(
+            "DELETE FROM applied_writes WHERE created_at < date('now', ?)",
+            (f"-{int(older_than_days)} days",),
+        )
+
+    conn.close()
+    return folded
+
+
+def fold_log(conn: sqlite3.Connection) -> Dict[Tuple[str, str], Tuple[float, float, str]]:
+    """
+    (cell, category) -> (add, keep, last update time) of everything logged
+    after the cell's snapshot, so value = keep * snapshot_value + add.
+    """
+    daily = conn.execute(
+        """
+        SELECT d.geohash, d.category, d.keep, d.ema_add, d.day || ' 00:00:00'
+        FROM truth_events_daily d LEFT JOIN truth_snapshots s ON s.geohash = d.geohash
+        WHERE s.geohash IS NULL OR d.day >= substr(s.created_at, 1, 10)
+        ORDER BY d.day
+        """
+    ).fetchall()
+    events = conn.execute(
+        """
+        SELECT e.geohash, e.category, 1.0 - e.alpha, e.alpha * e.severity, e.created_at
+        FROM truth_events e LEFT JOIN truth_snapshots s ON s.geohash = e.geohash
+        WHERE s.geohash IS NULL OR e.id > s.after_event
+        ORDER BY e.id
+        """
+    ).fetchall()
+    rows = daily + events  # compacted days always precede the raw events
+    if not rows:
+        return {}
+
+    cells = np.array([r[0] for r in rows])
+    cats = np.array([r[1] for r in rows])
+    keep = np.array([r[2] for r in rows], dtype=np.float64)
+    add = np.array([r[3] for r in rows], dtype=np.float64)
+    ts = np.array([r[4] for r in rows])
+
+    codes = _group_codes(cells, cats)
+    order = np.argsort(codes, kind="stable")
+    codes, cells, cats, keep, add, ts = (
+        codes[order], cells[order], cats[order], keep[order], add[order], ts[order]
+    )
+    starts, value, total_keep = fold_ema(codes, keep, add)
+    last = np.r_[starts[1:], len(codes)] - 1
+
+    return {
+        (str(cells[s]), str(cats[s])): (v, k, str(ts[l]))
+        for s, l, v, k in zip(starts.tolist(), last.tolist(), value.tolist(), total_keep.tolist())
+    }
+
+
+def rebuild(db: DBWriter, *, force: bool = False) -> int:
+    """
+    Replaces the truth table with the state implied by the snapshots and the
+    log. Returns the number of truth rows written.
+
+    Raises RuntimeError if some truth row has neither a snapshot nor any
+    logged update (it would be dropped), unless force=True.
+    """
+    conn = db._connect()
+
+    (orphans,) = conn.execute(
+        """
+        SELECT COUNT(*) FROM truth t
+        WHERE NOT EXISTS (SELECT 1 FROM truth_snapshots s WHERE s.geohash = t.geohash)
+          AND NOT EXISTS (SELECT 1 FROM truth_events e WHERE e.geohash = t.geohash)
+          AND NOT EXISTS (SELECT 1 FROM truth_events_daily d WHERE d.geohash = t.geohash)
+        """
+    ).fetchone()
+    if orphans and not force:
+        conn.close()
+        raise RuntimeError(
+            f"{orphans} truth rows have no snapshot or logged update and would be lost; "
+            "run the migrations (m009 snapshots existing truth) or pass force=True"
+        )
+
+    # Pivot snapshots, then (cell, category) folds on top of them, into truth rows
+    truth: Dict[str, List] = {}
+    for cell, updated_at, *vals in conn.execute(
+        f"SELECT geohash, updated_at, {', '.join(CATEGORIES)} FROM truth_snapshots"
+    ):
+        truth[cell] = [dict(zip(CATEGORIES, vals)), updated_at or ""]
+
+    folded = fold_log(conn)
+    for (cell, cat), (add, keep, ts) in folded.items():
+        row = truth.setdefault(cell, [{c: 0.0 for c in CATEGORIES}, ""])
+        row[0][cat] = min(max(keep * row[0].get(cat, 0.0) + add, 0.0), 1.0)
+        row[1] = max(row[1], ts)
+
+    cols = ", ".join(CATEGORIES)
+    params = []
+    for cell, (vals, updated_at) in truth.items():
+        lat, lng = geohash.decode(cell)
+        params.append((lat, lng, cell, updated_at, *[vals[c] for c in CATEGORIES]))
+
+    with conn:
+        conn.execute("DELETE FROM truth")
+        conn.executemany(
+            f"""
+            INSERT INTO truth (lat, long, geohash, updated_at, {cols})
+            VALUES (?, ?, ?, ?, {", ".join("?" * len(CATEGORIES))})
+            """,
+            params,
+        )
+        _bump_truth_version(conn)
+    conn.close()
+
+    print(f"[rebuild] {len(folded)} logged cell categories -> {len(params)} truth rows")
+    return len(params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="truth_events maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_compact = sub.add_parser("compact", help="fold old events into daily aggregates")
+    p_compact.add_argument("--days", type=int, default=30, help="keep raw events for this many days")
+    p_rebuild = sub.add_parser("rebuild", help="recompute truth from the log")
+    p_rebuild.add_argument("--force", action="store_true", help="rebuild even if truth rows would be lost")
+    args = parser.parse_args()
+
+    db = DBWriter()
+    if args.cmd == "compact":
+        n = compact(db, older_than_days=args.days)
+        print(f"✅ Compacted {n} events")
+    else:
+        n = rebuild(db, force=args.force)
+        print(f"✅ Rebuilt {n} truth rows")
+
+
+if __name__ == "__main__":
+    main()
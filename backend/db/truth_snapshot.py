@@ -0,0 +1,178 @@
+"""
+Process-local, columnar snapshot of the truth table.
+
+/tiles, /route and /location-summary read truth far more often than the
+pipelines write it, so instead of going through the DB row by row they share
+one immutable snapshot: contiguous float32 columns plus a KD-tree for nearest
+and radius queries. The snapshot is rebuilt when meta.truth_version moves and
+swapped in with a single reference assignment, so readers never see a
+half-built one.
+
+Truth values are also decayed at read time by the age of their updated_at:
+score = value * 0.5 ** (age / half_life). Ages are measured at the start of
+the current time bucket, so the decayed columns are computed once per bucket
+per snapshot and cached; a new bucket simply computes a fresh set.
+
+Config:
+  STREETSENSE_TRUTH_HALF_LIFE_DAYS  decay half-life, <= 0 disables (default 14)
+  STREETSENSE_TRUTH_DECAY_BUCKET_S  bucket length in seconds (default 3600)
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from db.db_writer import CATEGORIES
+from db.storage import open_storage
+
+# How often (seconds) readers may poll truth_version
+VERSION_CHECK_INTERVAL_S = 2.0
+
+TRUTH_HALF_LIFE_S = float(os.getenv("STREETSENSE_TRUTH_HALF_LIFE_DAYS", "14")) * 86400.0
+TRUTH_DECAY_BUCKET_S = int(os.getenv("STREETSENSE_TRUTH_DECAY_BUCKET_S", "3600"))
+
+M_PER_DEG_LAT = 110_574.0
+M_PER_DEG_LNG_EQ = 111_320.0
+
+
+def current_bucket(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // TRUTH_DECAY_BUCKET_S)
+
+
+def decay_factors(updated_at_s: np.ndarray, bucket: int) -> np.ndarray:
+    """
+    float32 multipliers in (0, 1] for rows last updated at updated_at_s
+    (unix seconds), evaluated at the start of `bucket`.
+    """
+    if TRUTH_HALF_LIFE_S <= 0:
+        return np.ones(len(updated_at_s), dtype=np.float32)
+    age = np.maximum(bucket * TRUTH_DECAY_BUCKET_S - updated_at_s, 0).astype(np.float64)
+    return np.exp2(-age / TRUTH_HALF_LIFE_S).astype(np.float32)
+
+
+class DecayedScores:
+    """
+    Decayed view of a snapshot for one time bucket; row order matches it.
+    """
+
+    def __init__(self, snap: "TruthSnapshot", bucket: int):
+        self.bucket = bucket
+        f = decay_factors(snap.updated_at, bucket)
+        self.values = snap.values * f[:, None]
+        self.max_risk = snap.max_risk * f
+
+
+class TruthSnapshot:
+    def __init__(self, rows, version: int):
+        self.version = version
+
+        n = len(rows)
+        if n:
+            arr = np.array([r[:2] + r[3:] for r in rows], dtype=np.float64)
+            updated = np.array([r[2] for r in rows], dtype="datetime64[s]").astype(np.int64)
+        else:
+            arr = np.zeros((0, 2 + len(CATEGORIES)), dtype=np.float64)
+            updated = np.zeros(0, dtype=np.int64)
+
+        # Sort by latitude so bbox queries are a searchsorted + lng mask
+        order = np.argsort(arr[:, 0], kind="stable")
+        arr = arr[order]
+
+        self.lat = np.ascontiguousarray(arr[:, 0], dtype=np.float32)
+        self.lng = np.ascontiguousarray(arr[:, 1], dtype=np.float32)
+        self.values = np.ascontiguousarray(np.clip(arr[:, 2:], 0.0, 1.0), dtype=np.float32)
+        self.max_risk = (
+            self.values.max(axis=1) if n else np.zeros(0, dtype=np.float32)
+        )
+        self.updated_at = updated[order]  # unix seconds
+
+        # Local equirectangular metres around the data's mean latitude
+        self.ref_lat = float(self.lat.mean()) if n else 0.0
+        self._kx = M_PER_DEG_LNG_EQ * math.cos(math.radians(self.ref_lat))
+        xy = np.column_stack([self.lng.astype(np.float64) * self._kx,
+                              self.lat.astype(np.float64) * M_PER_DEG_LAT])
+        self._tree = cKDTree(xy) if n else None
+
+        self._scores: Optional[DecayedScores] = None
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def scores(self, bucket: Optional[int] = None) -> DecayedScores:
+        """
+        Decayed values/max_risk for the (current) time bucket, cached until
+        the bucket changes.
+        """
+        bucket = current_bucket() if bucket is None else bucket
+        scores = self._scores
+        if scores is None or scores.bucket != bucket:
+            scores = DecayedScores(self, bucket)
+            self._scores = scores
+        return scores
+
+    def _xy(self, lat: float, lng: float) -> Tuple[float, float]:
+        return lng * self._kx, lat * M_PER_DEG_LAT
+
+    def bbox(self, south: float, west: float, north: float, east: float, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Indices of rows inside the bbox.
+        """
+        i0 = np.searchsorted(self.lat, south, side="left")
+        i1 = np.searchsorted(self.lat, north, side="right")
+        lng = self.lng[i0:i1]
+        idx = np.nonzero((lng >= west) & (lng <= east))[0] + i0
+        return idx[:limit] if limit is not None else idx
+
+    def nearest(self, lat: float, lng: float, max_dist_m: float) -> Tuple[int, float]:
+        """
+        (index, distance_m) of the closest row within max_dist_m, or (-1, inf).
+        """
+        if self._tree is None:
+            return -1, math.inf
+        d, i = self._tree.query(self._xy(lat, lng), distance_upper_bound=max_dist_m)
+        if not np.isfinite(d):
+            return -1, math.inf
+        return int(i), float(d)
+
+    def within(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        """
+        Indices of rows within radius_m.
+        """
+        if self._tree is None:
+            return np.zeros(0, dtype=np.intp)
+        return np.asarray(self._tree.query_ball_point(self._xy(lat, lng), radius_m), dtype=np.intp)
+
+
+_db = open_storage()
+_current: Optional[TruthSnapshot] = None
+_checked_at = 0.0
+_reload_lock = threading.Lock()
+
+
+def get_snapshot() -> TruthSnapshot:
+    """
+    Current snapshot, rebuilt first if truth_version changed since the last
+    check. Only one thread rebuilds; the others keep using the old snapshot.
+    """
+    global _current, _checked_at
+
+    snap = _current
+    now = time.monotonic()
+    if snap is not None and now - _checked_at < VERSION_CHECK_INTERVAL_S:
+        return snap
+
+    if not _reload_lock.acquire(blocking=snap is None):
+        return snap
+    try:
+        _checked_at = now
+        version = _db.get_truth_version()
+        if _current is None or _current.version != version:
+            _current = TruthSnapshot(_db.fetch_truth_columns(), version)
+        return _current
+    finally:
+        _reload_lock.release()
@@ -0,0 +1,207 @@
+"""
+Persistent "already processed" index for scraped articles.
+
+An item counts as seen if either its normalized URL or its content
+fingerprint (title + snippet, normalized the same way as the classification
+cache) was recorded within the TTL. The fingerprint catches the same story
+syndicated under different URLs.
+
+Keys live in their own SQLite file, so restarts don't re-validate and
+re-classify articles and expired keys are purged instead of growing forever.
+An in-memory Bloom filter in front of SQLite answers "definitely new" for most
+fresh items without a query; only Bloom hits are checked against the table.
+
+Config:
+  STREETSENSE_SEEN_PATH      index file (default backend/seen_items.db)
+  STREETSENSE_SEEN_TTL_DAYS  how long a key counts as seen (default 14)
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from db.classification_cache import normalize
+
+DEFAULT_SEEN_PATH = Path(os.getenv(
+    "STREETSENSE_SEEN_PATH",
+    str(Path(__file__).resolve().parents[1] / "seen_items.db"),
+))
+TTL_DAYS = float(os.getenv("STREETSENSE_SEEN_TTL_DAYS", "14"))
+
+# Bloom filter sizing: expected keys and target false-positive rate
+BLOOM_CAPACITY = 1_000_000
+BLOOM_FP_RATE = 0.01
+
+# Query parameters that only track the click, not the article
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ocid", "cvid", "ei", "form", "ref", "smid"}
+
+DDL = """
+CREATE TABLE IF NOT EXISTS seen_items (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,          -- 'url' | 'content'
+    seen_at REAL NOT NULL        -- unix seconds
+);
+
+CREATE INDEX IF NOT EXISTS idx_seen_items_seen_at ON seen_items(seen_at);
+"""
+
+
+def normalize_url(url: str) -> str:
+    """
+    Lowercased scheme/host without "www.", default ports, fragment, tracking
+    parameters and trailing slash; remaining query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if scheme == "http" else scheme, host, path, urlencode(query), ""))
+
+
+def content_fingerprint(item: Dict[str, Any]) -> Optional[str]:
+    text = normalize(f"{item.get('title') or ''} {item.get('snippet') or ''}")
+    if not text:
+        return None
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def item_keys(item: Dict[str, Any]) -> List[str]:
+    keys = []
+    url = item.get("url")
+    if url:
+        keys.append("url:" + normalize_url(url))
+    fp = content_fingerprint(item)
+    if fp:
+        keys.append("content:" + fp)
+    return keys
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, using double hashing of one
+    blake2b digest for the k bit positions.
+    """
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, fp_rate: float = BLOOM_FP_RATE):
+        self.m = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "big")
+        h2 = int.from_bytes(d[8:], "big") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenStore:
+    def __init__(self, path: Optional[str] = None, ttl_days: float = TTL_DAYS):
+        self.path = str(path or DEFAULT_SEEN_PATH)
+        self.ttl_s = ttl_days * 86400
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        conn.executescript(DDL)
+        conn.close()
+
+        self.purge()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _load_bloom(self, conn: sqlite3.Connection) -> None:
+        (n,) = conn.execute("SELECT COUNT(*) FROM seen_items").fetchone()
+        bloom = BloomFilter(capacity=max(BLOOM_CAPACITY, 2 * n))
+        for (key,) in conn.execute("SELECT key FROM seen_items"):
+            bloom.add(key)
+        self.bloom = bloom
+
+    def purge(self) -> int:
+        """
+        Deletes keys older than the TTL and rebuilds the Bloom filter, which
+        can't drop keys on its own. Returns the number of keys removed.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute("DELETE FROM seen_items WHERE seen_at < ?", (time.time() - self.ttl_s,))
+            with self._lock:
+                self._load_bloom(conn)
+        finally:
+            conn.close()
+        if cur.rowcount:
+            print(f"[seen] purged {cur.rowcount} expired keys")
+        return cur.rowcount
+
+    def _known(self, conn: sqlite3.Connection, keys: Iterable[str], cutoff: float) -> set:
+        maybe = [k for k in keys if k in self.bloom]
+        if not maybe:
+            return set()
+        marks = ",".join("?" * len(maybe))
+        rows = conn.execute(
+            f"SELECT key FROM seen_items WHERE key IN ({marks}) AND seen_at >= ?",
+            (*maybe, cutoff),
+        ).fetchall()
+        return {r[0] for r in rows}
+
+    def filter_new(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Returns the items not seen within the TTL (also deduped within
+        `items`) and records their keys, so later calls skip them.
+        """
+        now = time.time()
+        per_item = [item_keys(it) for it in items]
+
+        conn = self._connect()
+        try:
+            with self._lock:
+                known = self._known(conn, {k for keys in per_item for k in keys}, now - self.ttl_s)
+
+                new_items = []
+                new_keys = []
+                for it, keys in zip(items, per_item):
+                    if not keys or any(k in known for k in keys):
+                        continue
+                    known.update(keys)
+                    new_items.append(it)
+                    new_keys.extend(keys)
+
+                if new_keys:
+                    with conn:
+                        conn.executemany(
+                            """
+                            INSERT INTO seen_items (key, kind, seen_at) VALUES (?, ?, ?)
+                            ON CONFLICT(key) DO UPDATE SET seen_at = excluded.seen_at
+                            """,
+                            [(k, k.split(":", 1)[0], now) for k in new_keys],
+                        )
+                    for k in new_keys:
+                        self.bloom.add(k)
+        finally:
+            conn.close()
+
+        return new_items
@@ -0,0 +1,463 @@
+"""
+Network clients for the agents, real or fake.
+
+CriticalityAgent, ValidatorAgent and ScraperAgent take their client as a
+constructor argument and only fall back to the factories below when none is
+given. The real SDKs are imported when a real client is built, so with
+STREETSENSE_FAKE_CLIENTS=1 every pipeline runs end to end on a machine with
+no network (or no SDKs).
+
+The fakes implement just the calls the agents make:
+  FakeAnthropic        messages.create with a forced tool call -> tool input
+                       matching the CriticalityOutput / batch schemas
+  FakePerplexity       chat.completions.create -> ValidationResult JSON
+  FakeAsyncPerplexity  the same, async
+  FakeStagehand        sessions.start -> session with navigate / extract /
+                       end, returning Bing-style article lists and article text
+
+Outputs are derived from the request (title, summary, query, ...), so the
+same input always gets the same answer. Each fake takes a FakeProfile:
+latency is log-normal around a median, a fraction of calls time out or fail
+with a server error, and a fraction return output that doesn't fit the schema.
+Those draws are seeded by the request and how often it was seen, so retries
+can succeed and repeated runs fail the same way.
+
+Config:
+  STREETSENSE_FAKE_CLIENTS     "1" = the factories return fakes
+  STREETSENSE_FAKE_LATENCY_MS  median fake call latency (default 200)
+  STREETSENSE_FAKE_ERROR_RATE  fraction of fake calls that fail (default 0)
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+FAKE_CLIENTS = os.getenv("STREETSENSE_FAKE_CLIENTS", "0") == "1"
+FAKE_LATENCY_MS = float(os.getenv("STREETSENSE_FAKE_LATENCY_MS", "200"))
+FAKE_ERROR_RATE = float(os.getenv("STREETSENSE_FAKE_ERROR_RATE", "0"))
+
+CATEGORIES = [
+    "crime",
+    "public_safety",
+    "transport",
+    "infrastructure",
+    "policy",
+    "protest",
+    "weather",
+    "other",
+]
+
+# Words that pick the fake category (first match in this order wins)
+CATEGORY_WORDS = {
+    "crime": ["stabbing", "shooting", "robbery", "theft", "burglary", "assault", "pickpocket", "mugging", "police"],
+    "public_safety": ["fire", "explosion", "evacuat", "fight", "unsafe", "suspicious", "emergency", "sketchy"],
+    "transport": ["traffic", "tube", "train", "bus", "road", "closure", "delay", "station", "crash"],
+    "infrastructure": ["power", "outage", "water", "gas", "collapse", "construction", "burst"],
+    "protest": ["protest", "march", "demonstration", "rally", "strike"],
+    "weather": ["flood", "storm", "snow", "heat", "rain", "wind"],
+    "policy": ["council", "policy", "government", "law", "mayor"],
+}
+
+# Words that push the fake severity up
+SEVERE_WORDS = ["stabbing", "shooting", "explosion", "fire", "collapse", "evacuat", "murder", "flood", "assault", "fight"]
+
+
+class FakeServerError(Exception):
+    """
+    Stand-in for a 5xx / overloaded response from a fake client.
+    """
+
+
+class FakeExtractError(Exception):
+    """
+    Fake Stagehand extract result that didn't fit the schema (the real SDK
+    raises UnprocessableEntityError).
+    """
+
+
+@dataclass
+class FakeProfile:
+    latency_ms: float = FAKE_LATENCY_MS   # median
+    latency_sigma: float = 0.5            # log-normal shape; 0 = fixed latency
+    error_rate: float = FAKE_ERROR_RATE   # calls that raise
+    timeout_share: float = 0.5            # of those, how many are timeouts
+    timeout_ms: float = 5000.0            # how long a timeout takes to fail
+    malformed_rate: float = 0.0           # successful calls with off-schema output
+    seed: int = 0
+
+
+def _unit(text: str) -> float:
+    # stable value in [0, 1) for a string
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big") / 2 ** 64
+
+
+def _category(text: str) -> str:
+    t = text.lower()
+    for cat, words in CATEGORY_WORDS.items():
+        if any(w in t for w in words):
+            return cat
+    return "other"
+
+
+def _severity(text: str) -> float:
+    t = text.lower()
+    hits = sum(1 for w in SEVERE_WORDS if w in t)
+    return round(min(1.0, 0.1 + 0.25 * hits + 0.3 * _unit(t)), 3)
+
+
+class _FakeClient:
+    """
+    Latency / failure draws and call counters shared by the fakes.
+    """
+
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        self.profile = profile or FakeProfile()
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.malformed = 0
+        self.busy_s = 0.0
+
+    def _draw(self, request: str) -> Tuple[float, str]:
+        """
+        (latency seconds, outcome) with outcome "ok" | "timeout" | "error" |
+        "malformed".
+        """
+        p = self.profile
+        with self._lock:
+            n = self._seen[request] = self._seen.get(request, 0) + 1
+            self.calls += 1
+        rng = random.Random(f"{p.seed}:{n}:{request}")
+
+        latency = p.latency_ms / 1000 * math.exp(p.latency_sigma * rng.gauss(0.0, 1.0))
+        u = rng.random()
+        if u < p.error_rate * p.timeout_share:
+            outcome, latency = "timeout", p.timeout_ms / 1000
+        elif u < p.error_rate:
+            outcome = "error"
+        elif u < p.error_rate + p.malformed_rate:
+            outcome = "malformed"
+        else:
+            outcome = "ok"
+
+        with self._lock:
+            self.busy_s += latency
+            if outcome in ("timeout", "error"):
+                self.failures += 1
+            elif outcome == "malformed":
+                self.malformed += 1
+        return latency, outcome
+
+    @staticmethod
+    def _raise(outcome: str) -> None:
+        if outcome == "timeout":
+            raise TimeoutError("fake client timed out")
+        if outcome == "error":
+            raise FakeServerError("fake client returned 503")
+
+    def _call(self, request: str) -> str:
+        latency, outcome = self._draw(request)
+        time.sleep(latency)
+        self._raise(outcome)
+        return outcome
+
+    async def _acall(self, request: str) -> str:
+        latency, outcome = self._draw(request)
+        await asyncio.sleep(latency)
+        self._raise(outcome)
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "malformed": self.malformed,
+            "mean_latency_ms": round(1000 * self.busy_s / self.calls, 1) if self.calls else None,
+        }
+
+
+# -----------------------------
+# Anthropic
+# -----------------------------
+
+def _criticality_for(block: str, with_tweet: bool) -> Dict[str, Any]:
+    """
+    Tool input for one prompt block: a validated story (Title / Summary /
+    Plausibility lines) or a raw report followed by the instructions.
+    """
+    def field(label: str) -> str:
+        m = re.search(rf"- {label}: (.*)", block)
+        v = m.group(1).strip() if m else ""
+        return "" if v == "None" else v
+
+    if "- Summary:" in block:
+        title, summary = field("Title"), field("Summary")
+        try:
+            plausibility = float(field(r"Plausibility \(0-1\)"))
+        except ValueError:
+            plausibility = 0.5
+    else:
+        title, plausibility = "", 0.5
+        summary = block.split("\n\nReturn", 1)[0].replace("Report:\n", "", 1).strip()
+
+    text = f"{title} {summary}".strip()
+    out: Dict[str, Any] = {"final_severity": _severity(text), "category": _category(text)}
+    if with_tweet:
+        headline = title or summary
+        tweet = f"Reports suggest: {headline}" if plausibility < 0.5 else headline
+        out["tweet"] = tweet[:280] or "Update"
+    return out
+
+
+class FakeAnthropic(_FakeClient):
+    """
+    Answers both CriticalityAgents' forced tool calls from the validated
+    stories or reports in the prompt. Malformed batch answers drop half the
+    results, malformed single answers leave out the category.
+    """
+
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        super().__init__(profile)
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, *, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], **_: Any):
+        user = messages[-1]["content"]
+        tool = tools[0]
+        outcome = self._call(user)
+
+        schema = tool["input_schema"]
+        if "results" in schema.get("properties", {}):
+            with_tweet = "tweet" in json.dumps(schema)
+            parts = re.split(r"^\[(\d+)\]$", user, flags=re.M)
+            results = [
+                {"index": int(idx), **_criticality_for(block, with_tweet)}
+                for idx, block in zip(parts[1::2], parts[2::2])
+            ]
+            if outcome == "malformed":
+                results = results[::2]
+            payload: Dict[str, Any] = {"results": results}
+        else:
+            payload = _criticality_for(user, "tweet" in schema.get("properties", {}))
+            if outcome == "malformed":
+                payload.pop("category")
+
+        block = SimpleNamespace(type="tool_use", name=tool["name"], input=payload)
+        return SimpleNamespace(content=[block], stop_reason="tool_use")
+
+
+# -----------------------------
+# Perplexity
+# -----------------------------
+
+def _validation_for(prompt: str) -> Dict[str, Any]:
+    def section(label: str) -> str:
+        m = re.search(rf"^{label}:\n(.*?)\n\n", prompt, flags=re.S | re.M)
+        v = m.group(1).strip() if m else ""
+        return "" if v == "None" else v
+
+    title, url, snippet = section("TITLE"), section("URL"), section("SNIPPET")
+    text = snippet or title
+    summary = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0][:300]
+
+    flags = []
+    if len(text) < 40:
+        flags.append("low_information")
+    if "!" in text or text.isupper():
+        flags.append("sensational_language")
+    if not url.startswith("http"):
+        flags.append("unverifiable")
+
+    return {
+        "title": title or text[:80],
+        "source_url": url,
+        "cleaned_content": text,
+        "summary": summary,
+        "plausibility": round(0.3 + 0.65 * _unit("plausibility:" + text) - 0.1 * len(flags), 3) if text else 0.0,
+        "severity_hint": _severity(text),
+        "flags": flags,
+        "evidence": [{"url": url, "quote": text[:120]}] if url.startswith("http") else [],
+    }
+
+
+def _completion(prompt: str, outcome: str):
+    payload = _validation_for(prompt)
+    payload["plausibility"] = max(0.0, payload["plausibility"])
+    if outcome == "malformed":
+        payload["plausibility"] = 1.5
+    message = SimpleNamespace(role="assistant", content=json.dumps(payload))
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)])
+
+
+class FakePerplexity(_FakeClient):
+    """
+    Answers ValidatorAgent's prompt with a ValidationResult built from the
+    item's title, URL and snippet. Malformed answers are out of range.
+    """
+
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        super().__init__(profile)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, *, messages: List[Dict[str, Any]], **_: Any):
+        prompt = messages[-1]["content"]
+        return _completion(prompt, self._call(prompt))
+
+
+class FakeAsyncPerplexity(_FakeClient):
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        super().__init__(profile)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, messages: List[Dict[str, Any]], **_: Any):
+        prompt = messages[-1]["content"]
+        return _completion(prompt, await self._acall(prompt))
+
+
+# -----------------------------
+# Stagehand
+# -----------------------------
+
+PUBLISHERS = ["Evening Standard", "BBC News", "MyLondon", "The Guardian", "Time Out"]
+
+HEADLINES = [
+    "{q}: police appeal for witnesses",
+    "{q} - residents report disruption",
+    "Emergency services called to {q}",
+    "Road closure and delays after {q}",
+    "Council responds to {q}",
+    "Update on {q} this afternoon",
+]
+
+
+class _FakeSession:
+    def __init__(self, client: "FakeStagehand", session_id: str):
+        self.client = client
+        self.id = session_id
+        self.url = ""
+
+    async def navigate(self, *, url: str, **_: Any):
+        await self.client._acall(f"navigate:{url}")
+        self.url = url
+        return SimpleNamespace(data=SimpleNamespace(result=None))
+
+    async def extract(self, *, instruction: str, schema: Dict[str, Any], **_: Any):
+        outcome = await self.client._acall(f"extract:{self.url}:{instruction}")
+        if outcome == "malformed":
+            raise FakeExtractError("extract result did not match the schema")
+
+        if "articles" in schema.get("properties", {}):
+            max_items = schema["properties"]["articles"].get("maxItems", 5)
+            result: Dict[str, Any] = {"articles": self.client.articles(self.url, max_items)}
+        else:
+            result = self.client.article_page(self.url)
+        return SimpleNamespace(data=SimpleNamespace(result=result))
+
+    async def end(self) -> None:
+        return None
+
+
+class FakeStagehand(_FakeClient):
+    """
+    Browser sessions that return made-up Bing News results for the searched
+    query. Every repeat of a query shifts its result window by one article,
+    so each sweep finds one new story per query and the rest are repeats.
+    Malformed extracts raise FakeExtractError.
+    """
+
+    def __init__(self, profile: Optional[FakeProfile] = None):
+        super().__init__(profile)
+        self.sessions = SimpleNamespace(start=self._start)
+        self._searches: Dict[str, int] = {}
+
+    async def __aenter__(self) -> "FakeStagehand":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+    async def _start(self, *, model_name: str = "", **_: Any) -> _FakeSession:
+        await self._acall("start")
+        return _FakeSession(self, f"fake-{id(self):x}-{self._seen['start']}")
+
+    def articles(self, url: str, max_items: int) -> List[Dict[str, Any]]:
+        query = (parse_qs(urlsplit(url).query).get("q") or [""])[0]
+        with self._lock:
+            first = self._searches[query] = self._searches.get(query, -1) + 1
+
+        count = max(1, round(max_items * (0.5 + 0.5 * _unit("count:" + query))))
+        slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")
+        out = []
+        for n in range(first, first + count):
+            h = hashlib.sha1(f"{query}:{n}".encode()).hexdigest()[:10]
+            title = HEADLINES[int(h, 16) % len(HEADLINES)].format(q=query)
+            out.append({
+                "title": title,
+                "url": f"https://news.example.com/{slug}-{h}",
+                "publisher": PUBLISHERS[int(h, 16) % len(PUBLISHERS)],
+                "published_at": f"{1 + int(h, 16) % 23} hours ago",
+                "snippet": f"{title}. Story {n} about {query}, with details from people nearby.",
+            })
+        return out
+
+    def article_page(self, url: str) -> Dict[str, Any]:
+        slug = urlsplit(url).path.strip("/").rsplit("-", 1)[0].replace("-", " ")
+        return {"title": slug.capitalize(), "text": f"{slug.capitalize()}. " * 20}
+
+
+# -----------------------------
+# Factories
+# -----------------------------
+
+def anthropic_client(profile: Optional[FakeProfile] = None):
+    if FAKE_CLIENTS or profile is not None:
+        return FakeAnthropic(profile)
+
+    api_key = ""
+    if not api_key:
+        raise RuntimeError("ANTHROPIC_API_KEY is not set")
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key)
+
+
+def perplexity_clients(profile: Optional[FakeProfile] = None):
+    """
+    (sync client, async client)
+    """
+    if FAKE_CLIENTS or profile is not None:
+        return FakePerplexity(profile), FakeAsyncPerplexity(profile)
+
+    from perplexity import AsyncPerplexity, Perplexity
+    return Perplexity(api_key=""), AsyncPerplexity(api_key="")
+
+
+def stagehand_client(profile: Optional[FakeProfile] = None):
+    if FAKE_CLIENTS or profile is not None:
+        return FakeStagehand(profile)
+
+    from stagehand import AsyncStagehand
+    return AsyncStagehand(
+        browserbase_api_key="",
+        browserbase_project_id="",
+        model_api_key="",
+    )
+
+
+def extract_errors(client) -> Tuple[type, ...]:
+    """
+    Exceptions `client` raises when an extract result doesn't fit the schema.
+    """
+    if isinstance(client, FakeStagehand):
+        return (FakeExtractError,)
+    from stagehand import UnprocessableEntityError
+    return (UnprocessableEntityError,)
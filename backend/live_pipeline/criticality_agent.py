@@ -1,9 +1,10 @@
 from __future__ import annotations
 import os
-from typing import Literal, List
-from pydantic import BaseModel, Field
+from typing import Any, Dict, Literal, List, Optional
+from pydantic import BaseModel, Field, ValidationError
 
-from anthropic import Anthropic
+from db.classification_cache import ClassificationCache
+from live_pipeline.clients import anthropic_client
 
 
 Category = Literal[
@@ -24,6 +25,54 @@ class CriticalityOutput(BaseModel):
     tweet: str = Field(max_length=280)
 
 
+class CriticalityBatchItem(CriticalityOutput):
+    index: int = Field(ge=0)
+
+
+class CriticalityBatchOutput(BaseModel):
+    results: List[CriticalityBatchItem]
+
+
+# Validated items per request in assess_batch
+DEFAULT_BATCH_SIZE = 8
+
+# System-level instruction keeps output consistent and avoids hallucinations
+SYSTEM = (
+    "You generate location-based public updates. "
+    "Never invent facts beyond the provided validated summary. "
+    "Severity is impact-if-true (not probability-weighted). "
+    "If plausibility < 0.5, the tweet MUST use uncertainty language."
+)
+
+TWEET_RULES = """
+Tweet rules:
+- If plausibility < 0.5, include "Unverified reports" or "Reports suggest".
+- No emojis.
+- Max 1 hashtag, only if truly useful.
+- No calls to action, no speculation.
+"""
+
+
+def _evidence_urls(validation_result) -> List[str]:
+    # Compact evidence URLs (optional)
+    evidence_urls: List[str] = []
+    try:
+        for e in (validation_result.evidence or [])[:3]:
+            url = getattr(e, "url", None)
+            if url:
+                evidence_urls.append(url)
+    except Exception:
+        pass
+    return evidence_urls
+
+
+def _validated_block(validation_result) -> str:
+    return f"""- Title: {validation_result.title}
+- Summary: {validation_result.summary}
+- Plausibility (0-1): {validation_result.plausibility}
+- Evidence URLs: {_evidence_urls(validation_result)}"""
+
+
 class CriticalityAgent:
     """
     THIS is the Anthropic layer.
@@ -31,12 +80,13 @@ class CriticalityAgent:
     Output: final severity + category + tweet-ready summary.
     """
 
-    def __init__(self, model: str = "claude-opus-4-6"):
-        api_key = ""
-        if not api_key:
-            raise RuntimeError("ANTHROPIC_API_KEY is not set")
-        self.client = Anthropic(api_key=api_key)
+    def __init__(self, model: str = "claude-opus-4-6", use_cache: bool = True, client=None):
+        # Anything with messages.create, e.g. clients.FakeAnthropic offline
+        self.client = client or anthropic_client()
         self.model = model
+        # Keyed on the single-item prompt, so the same validated story (title,
+        # summary, plausibility, evidence) is only sent to the model once
+        self.cache = ClassificationCache("validated_story") if use_cache else None
 
         # Define a tool whose input schema is exactly what we want back.
         self.tool_name = "emit_criticality"
@@ -46,47 +96,46 @@ class CriticalityAgent:
             "input_schema": CriticalityOutput.model_json_schema(),
         }
 
-    def assess(self, validation_result) -> CriticalityOutput:
-        # Compact evidence URLs (optional)
-        evidence_urls: List[str] = []
-        try:
-            for e in (validation_result.evidence or [])[:3]:
-                url = getattr(e, "url", None)
-                if url:
-                    evidence_urls.append(url)
-        except Exception:
-            pass
-
-        # System-level instruction keeps output consistent and avoids hallucinations
-        system = (
-            "You generate location-based public updates. "
-            "Never invent facts beyond the provided validated summary. "
-            "Severity is impact-if-true (not probability-weighted). "
-            "If plausibility < 0.5, the tweet MUST use uncertainty language."
-        )
+        # Same, as an array with one entry per numbered input
+        self.batch_tool_name = "emit_criticality_batch"
+        self.batch_tool_schema = {
+            "name": self.batch_tool_name,
+            "description": "Emit severity, category and tweet for each numbered validated input, keyed by its index.",
+            "input_schema": CriticalityBatchOutput.model_json_schema(),
+        }
 
-        user = f"""
+    def _user_prompt(self, validation_result) -> str:
+        return f"""
 Validated input:
-- Title: {validation_result.title}
-- Summary: {validation_result.summary}
-- Plausibility (0-1): {validation_result.plausibility}
-- Evidence URLs: {evidence_urls}
+{_validated_block(validation_result)}
 
 Return a tool call to {self.tool_name} with:
 - final_severity (0-1)
 - category (enum)
 - tweet (<= 280 chars, neutral, feed-ready)
+{TWEET_RULES}"""
 
-Tweet rules:
-- If plausibility < 0.5, include "Unverified reports" or "Reports suggest".
-- No emojis.
-- Max 1 hashtag, only if truly useful.
-- No calls to action, no speculation.
-"""
+    def _tool_input(self, resp, tool_name: str) -> Dict[str, Any]:
+        # Extract tool args
+        tool_calls = [c for c in resp.content if c.type == "tool_use" and c.name == tool_name]
+        if not tool_calls:
+            raise RuntimeError("Claude did not return the required tool output")
+        return tool_calls[0].input
 
+    def assess(self, validation_result) -> CriticalityOutput:
+        user = self._user_prompt(validation_result)
+
+        if self.cache is not None:
+            cached = self.cache.get(self.model, user, CriticalityOutput)
+            if cached is not None:
+                return cached
+
+        return self._assess_one(user)
+
+    def _assess_one(self, user: str) -> CriticalityOutput:
         resp = self.client.messages.create(
             model=self.model,
-            system=system,
+            system=SYSTEM,
             max_tokens=300,
             temperature=0.2,
             messages=[{"role": "user", "content": user}],
@@ -94,10 +143,90 @@ Tweet rules:
             tool_choice={"type": "tool", "name": self.tool_name},  # force structured tool output
         )
 
-        # Extract tool args
-        tool_calls = [c for c in resp.content if c.type == "tool_use" and c.name == self.tool_name]
-        if not tool_calls:
-            raise RuntimeError("Claude did not return the required tool output")
+        out = CriticalityOutput.model_validate(self._tool_input(resp, self.tool_name))
+        if self.cache is not None:
+            self.cache.put(self.model, user, out)
+        return out
+
+    def _assess_chunk(self, validation_results: List[Any]) -> List[Optional[CriticalityOutput]]:
+        """
+        One request for all of `validation_results`. Entries the model left
+        out or got wrong come back as None.
+        """
+        inputs = "\n\n".join(
+            f"[{i}]\n{_validated_block(v)}" for i, v in enumerate(validation_results)
+        )
+        user = f"""
+Validated inputs ({len(validation_results)}):
+
+{inputs}
+
+Return a tool call to {self.batch_tool_name} with one entry per input in `results`:
+- index (the input's number in brackets)
+- final_severity (0-1)
+- category (enum)
+- tweet (<= 280 chars, neutral, feed-ready)
+{TWEET_RULES}"""
+
+        resp = self.client.messages.create(
+            model=self.model,
+            system=SYSTEM,
+            max_tokens=100 + 250 * len(validation_results),
+            temperature=0.2,
+            messages=[{"role": "user", "content": user}],
+            tools=[self.batch_tool_schema],
+            tool_choice={"type": "tool", "name": self.batch_tool_name},
+        )
 
-        args = tool_calls[0].input
-        return CriticalityOutput.model_validate(args)
+        outs: List[Optional[CriticalityOutput]] = [None] * len(validation_results)
+        for r in self._tool_input(resp, self.batch_tool_name).get("results") or []:
+            try:
+                item = CriticalityBatchItem.model_validate(r)
+            except ValidationError:
+                continue
+            if item.index < len(outs) and outs[item.index] is None:
+                outs[item.index] = CriticalityOutput(
+                    final_severity=item.final_severity, category=item.category, tweet=item.tweet,
+                )
+        return outs
+
+    def assess_batch(
+        self, validation_results: List[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> List[Optional[CriticalityOutput]]:
+        """
+        Same results as [assess(v) for v in validation_results], in order,
+        but cache misses go batch_size at a time in one request each. Items a
+        batch fails to produce valid output for are retried one by one; those
+        that fail again come back as None instead of losing the whole call.
+        """
+        prompts = [self._user_prompt(v) for v in validation_results]
+        outs: List[Optional[CriticalityOutput]] = [None] * len(prompts)
+
+        todo = []
+        for i, user in enumerate(prompts):
+            cached = self.cache.get(self.model, user, CriticalityOutput) if self.cache is not None else None
+            if cached is not None:
+                outs[i] = cached
+            else:
+                todo.append(i)
+
+        for start in range(0, len(todo), batch_size):
+            idx = todo[start:start + batch_size]
+            try:
+                chunk = self._assess_chunk([validation_results[i] for i in idx])
+            except Exception as e:
+                print(f"[criticality] batch of {len(idx)} failed, falling back to single calls: {e}")
+                chunk = [None] * len(idx)
+
+            for i, out in zip(idx, chunk):
+                if out is None:
+                    try:
+                        outs[i] = self._assess_one(prompts[i])
+                    except Exception as e:
+                        print(f"[criticality] item {i} failed: {e}")
+                    continue
+                outs[i] = out
+                if self.cache is not None:
+                    self.cache.put(self.model, prompts[i], out)
+
+        return outs
@@ -0,0 +1,257 @@
+"""
+Gazetteer: every named place the pipelines know about, loaded from a file.
+
+Each entry has a name, optional aliases, a centroid (lat/long), optional
+search keywords and an optional polygon ([[lat, long], ...]). Entries marked
+"monitored" are the ones the live pipeline scrapes (MONITORED_LOCATIONS); the
+rest are only used to geotag tweets and reviews.
+
+Lookups:
+  get(name)            exact match on the normalized name or an alias
+  fuzzy(name)          best IDF-weighted trigram (Dice) match, if it clears a
+                       threshold and a margin over the next-best entry
+  resolve(name)        get(), falling back to fuzzy()
+  find_in_text(text)   longest place name mentioned in free text
+  reverse(lat, long)   containing polygon, else nearest centroid within max_km
+
+The index is a dict of normalized names, a trigram -> key-id posting list
+(numpy arrays, scored with one weighted bincount) and a fixed lat/long grid
+of entry ids, so all lookups stay well under a millisecond at 50k entries.
+Trigrams are weighted by IDF, so the ones generic words like "street" or
+"road" share with thousands of names barely count towards a match.
+
+File format: JSON array or JSONL of objects with keys name, city, lat, long,
+and optionally aliases, keywords, polygon, monitored.
+
+Config:
+  STREETSENSE_GAZETTEER_PATH  gazetteer file (default live_pipeline/gazetteer.jsonl)
+"""
+
+import json
+import math
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_GAZETTEER_PATH = Path(os.getenv(
+    "STREETSENSE_GAZETTEER_PATH",
+    str(Path(__file__).resolve().parent / "gazetteer.jsonl"),
+))
+
+# Reverse-lookup grid cell size in degrees (~1.1 km of latitude)
+GRID_DEG = 0.01
+
+# Minimum IDF-weighted Dice similarity for a fuzzy match, and how far it must
+# beat the best different entry; ambiguous names resolve to nothing
+FUZZY_MIN_SCORE = 0.6
+FUZZY_MIN_MARGIN = 0.1
+
+# Default radius for reverse lookup by nearest centroid
+REVERSE_MAX_KM = 2.0
+
+
+@dataclass
+class MonitoredLocation:
+    name: str
+    city: str
+    lat: float
+    long: float
+    keywords: List[str] | None = None
+    aliases: List[str] = field(default_factory=list)
+    polygon: List[Tuple[float, float]] | None = None
+    monitored: bool = True
+
+
+def normalize_name(name: str) -> str:
+    s = unicodedata.normalize("NFKC", name).casefold().replace("'", "").replace("’", "")
+    return " ".join(re.findall(r"\w+", s))
+
+
+def _trigrams(norm: str) -> List[str]:
+    s = f"  {norm} "
+    return list({s[i:i + 3] for i in range(len(s) - 2)})
+
+
+def _km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # equirectangular is plenty at city scale
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return math.floor(lat / GRID_DEG), math.floor(lng / GRID_DEG)
+
+
+def _in_polygon(lat: float, lng: float, poly: List[Tuple[float, float]]) -> bool:
+    inside = False
+    j = len(poly) - 1
+    for i in range(len(poly)):
+        yi, xi = poly[i]
+        yj, xj = poly[j]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Gazetteer:
+    def __init__(self, entries: List[MonitoredLocation]):
+        self.entries = entries
+
+        # exact: normalized name/alias -> entry id (first one wins)
+        self._exact: Dict[str, int] = {}
+        for i, e in enumerate(entries):
+            for n in [e.name, *e.aliases]:
+                self._exact.setdefault(normalize_name(n), i)
+        self._max_words = max((len(k.split()) for k in self._exact), default=1)
+
+        # fuzzy: trigram postings over the exact keys
+        self._keys = list(self._exact)
+        self._key_entry = np.array([self._exact[k] for k in self._keys], dtype=np.int32)
+        postings: Dict[str, List[int]] = {}
+        for kid, k in enumerate(self._keys):
+            for g in _trigrams(k):
+                postings.setdefault(g, []).append(kid)
+        self._postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+        # IDF weight per trigram, so grams every "... street" shares count for little
+        n_keys = max(1, len(self._keys))
+        self._unseen_weight = math.log(n_keys + 1)
+        self._weights = {g: math.log((n_keys + 1) / len(ids)) for g, ids in self._postings.items()}
+        self._key_weight = np.zeros(len(self._keys), dtype=np.float64)
+        for kid, k in enumerate(self._keys):
+            self._key_weight[kid] = sum(self._weights[g] for g in _trigrams(k))
+
+        # reverse: centroids by grid cell, polygons by every cell of their bbox
+        self._points: Dict[Tuple[int, int], List[int]] = {}
+        self._polys: Dict[Tuple[int, int], List[int]] = {}
+        for i, e in enumerate(entries):
+            self._points.setdefault(_cell(e.lat, e.long), []).append(i)
+            if e.polygon:
+                lats = [p[0] for p in e.polygon]
+                lngs = [p[1] for p in e.polygon]
+                (i0, j0), (i1, j1) = _cell(min(lats), min(lngs)), _cell(max(lats), max(lngs))
+                for ci in range(i0, i1 + 1):
+                    for cj in range(j0, j1 + 1):
+                        self._polys.setdefault((ci, cj), []).append(i)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "Gazetteer":
+        p = Path(path or DEFAULT_GAZETTEER_PATH)
+        text = p.read_text(encoding="utf-8")
+        if text.lstrip().startswith("["):
+            rows = json.loads(text)
+        else:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+        entries = [
+            MonitoredLocation(
+                name=r["name"],
+                city=r.get("city", ""),
+                lat=float(r["lat"]),
+                long=float(r["long"]),
+                keywords=r.get("keywords"),
+                aliases=list(r.get("aliases") or []),
+                polygon=[(float(a), float(b)) for a, b in r["polygon"]] if r.get("polygon") else None,
+                monitored=bool(r.get("monitored", False)),
+            )
+            for r in rows
+        ]
+        return cls(entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def monitored(self) -> List[MonitoredLocation]:
+        return [e for e in self.entries if e.monitored]
+
+    # --- name lookups ---
+
+    def get(self, name: str) -> Optional[MonitoredLocation]:
+        i = self._exact.get(normalize_name(name))
+        return self.entries[i] if i is not None else None
+
+    def fuzzy(
+        self, name: str, min_score: float = FUZZY_MIN_SCORE, min_margin: float = FUZZY_MIN_MARGIN,
+    ) -> Optional[Tuple[MonitoredLocation, float]]:
+        """
+        Best match by IDF-weighted trigram Dice, if it scores at least
+        min_score and beats the best other entry by min_margin.
+        """
+        grams = _trigrams(normalize_name(name))
+        known = [g for g in grams if g in self._postings]
+        if not known:
+            return None
+
+        ids = np.concatenate([self._postings[g] for g in known])
+        weights = np.repeat([self._weights[g] for g in known], [len(self._postings[g]) for g in known])
+        common = np.bincount(ids, weights=weights, minlength=len(self._keys))
+        query_weight = sum(self._weights.get(g, self._unseen_weight) for g in grams)
+        scores = 2.0 * common / (query_weight + self._key_weight)
+
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < min_score:
+            return None
+        # the runner-up must be another entry, not one of this entry's aliases
+        entry = int(self._key_entry[best])
+        scores[self._key_entry == entry] = 0.0
+        if score - float(scores.max()) < min_margin:
+            return None
+        return self.entries[entry], score
+
+    def resolve(self, name: str) -> Optional[MonitoredLocation]:
+        e = self.get(name)
+        if e is not None:
+            return e
+        hit = self.fuzzy(name)
+        return hit[0] if hit else None
+
+    def find_in_text(self, text: str) -> Optional[MonitoredLocation]:
+        """
+        Longest run of words in `text` that is exactly a known name or alias.
+        """
+        words = normalize_name(text).split()
+        for n in range(min(self._max_words, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                j = self._exact.get(" ".join(words[i:i + n]))
+                if j is not None:
+                    return self.entries[j]
+        return None
+
+    # --- reverse lookup ---
+
+    def reverse(self, lat: float, lng: float, max_km: float = REVERSE_MAX_KM) -> Optional[MonitoredLocation]:
+        ci, cj = _cell(lat, lng)
+
+        containing = [i for i in self._polys.get((ci, cj), ()) if _in_polygon(lat, lng, self.entries[i].polygon)]
+        if containing:
+            # most specific (smallest) polygon
+            def bbox_area(i: int) -> float:
+                poly = self.entries[i].polygon
+                return ((max(p[0] for p in poly) - min(p[0] for p in poly))
+                        * (max(p[1] for p in poly) - min(p[1] for p in poly)))
+            return self.entries[min(containing, key=bbox_area)]
+
+        ri = math.ceil(max_km / (111.0 * GRID_DEG))
+        rj = math.ceil(max_km / (111.0 * GRID_DEG * max(0.1, math.cos(math.radians(lat)))))
+        best, best_km = None, max_km
+        for di in range(-ri, ri + 1):
+            for dj in range(-rj, rj + 1):
+                for i in self._points.get((ci + di, cj + dj), ()):
+                    e = self.entries[i]
+                    d = _km(lat, lng, e.lat, e.long)
+                    if d <= best_km:
+                        best, best_km = e, d
+        return best
+
+
+@lru_cache(maxsize=None)
+def get_gazetteer(path: Optional[str] = None) -> Gazetteer:
+    return Gazetteer.from_file(path)
@@ -1,39 +1,9 @@
-from dataclasses import dataclass
 from typing import List
 
+from live_pipeline.gazetteer import MonitoredLocation, get_gazetteer
 
-@dataclass
-class MonitoredLocation:
-    name: str
-    city: str
-    lat: float
-    long: float
-    keywords: List[str] | None = None
+__all__ = ["MonitoredLocation", "MONITORED_LOCATIONS"]
 
 
-MONITORED_LOCATIONS: List[MonitoredLocation] = [
-    MonitoredLocation(
-        name="Oxford Street",
-        city="London",
-        lat=51.5154,
-        long=-0.1410,
-    ),
-    MonitoredLocation(
-        name="Camden Town",
-        city="London",
-        lat=51.5390,
-        long=-0.1426,
-    ),
-    MonitoredLocation(
-        name="Stratford",
-        city="London",
-        lat=51.5413,
-        long=-0.0030,
-    ),
-    MonitoredLocation(
-        name="King's Cross",
-        city="London",
-        lat=51.5308,
-        long=-0.1238,
-    ),
-]
+# Entries marked "monitored" in the gazetteer file (live_pipeline/gazetteer.jsonl)
+MONITORED_LOCATIONS: List[MonitoredLocation] = get_gazetteer().monitored()
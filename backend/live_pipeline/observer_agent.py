@@ -1,6 +1,7 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from live_pipeline.query_planner import QueryPlanner
 from live_pipeline.locations import MONITORED_LOCATIONS
+from live_pipeline.scheduler import JobScheduler
 
 class ObserverAgent:
     def __init__(self):
@@ -33,6 +34,13 @@ class ObserverAgent:
                     "location": loc,
                 })
         return all_jobs
+
+    def make_scheduler(self, db, limiter, max_jobs: Optional[int] = None) -> JobScheduler:
+        """
+        Same jobs as plan_all_queries, served by priority under the limiter's
+        request budget instead of in fixed order.
+        """
+        return JobScheduler(self.plan_all_queries(), db=db, limiter=limiter, max_jobs=max_jobs)
     
     def choose_deep_fetch(self, validated_results) -> List[str]:
         scored = []
@@ -1,82 +1,380 @@
+"""
+Live news pipeline: scrape -> validate -> classify -> write.
+
+The stages run concurrently, connected by bounded queues, so validation and
+classification of one job overlap with scraping the next ones. Scraping uses a
+pool of Stagehand sessions; every search goes through one shared TokenBucket,
+so the rate limit (not fixed sleeps) sets the pace. A sweep over all jobs takes
+about len(jobs) / SEARCHES_PER_MIN minutes. Articles already processed in this
+or an earlier run (db/url_dedupe.py) are dropped before validation, and each
+item's progress is checkpointed (db/run_state.py) so an interrupted sweep
+resumes where it stopped.
+
+With STREETSENSE_SCHEDULED=1, main() instead runs continuously on the
+ObserverAgent's JobScheduler (live_pipeline/scheduler.py): jobs come out by
+priority under the same budget, and scrape/classify results feed back into it.
+
+Config:
+  STREETSENSE_SCRAPER_SESSIONS  concurrent browser sessions (default 3)
+  STREETSENSE_SEARCHES_PER_MIN  global search rate limit (default 6)
+  STREETSENSE_SCHEDULED         "1" = priority scheduling instead of sweeps
+  STREETSENSE_SWEEP_ATTEMPTS    attempts at a sweep before its failing items are dropped (default 3)
+"""
+
 import asyncio
-from live_pipeline.scraper_agent import ScraperAgent
-from live_pipeline.validator_agent import ValidatorAgent
-from live_pipeline.criticality_agent import CriticalityAgent
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from live_pipeline.scraper_pool import ScraperPool
+from live_pipeline.validator_agent import ValidationResult, ValidatorAgent
+from live_pipeline.criticality_agent import CriticalityAgent, CriticalityOutput
 from live_pipeline.observer_agent import ObserverAgent
-from db.db_writer import DBWriter
+from live_pipeline.scheduler import JobScheduler
+from live_pipeline.gazetteer import get_gazetteer
+from db.storage import open_storage
+from db.run_state import RunState, SKIPPED
+from db.url_dedupe import SeenStore, normalize_url
+from utils import StageStats, TokenBucket
 
+SCRAPER_SESSIONS = int(os.getenv("STREETSENSE_SCRAPER_SESSIONS", "3"))
+SEARCHES_PER_MIN = float(os.getenv("STREETSENSE_SEARCHES_PER_MIN", "6"))
+SCHEDULED = os.getenv("STREETSENSE_SCHEDULED", "0") == "1"
+SWEEP_ATTEMPTS = int(os.getenv("STREETSENSE_SWEEP_ATTEMPTS", "3"))
 
-async def main():
-    scraper = ScraperAgent()
-    observer = ObserverAgent()
-    validator = ValidatorAgent()
-    crit = CriticalityAgent(model="claude-opus-4-6")
-    db = DBWriter()
+# Max jobs waiting between two stages before the earlier stage blocks
+STAGE_QUEUE_SIZE = 8
 
-    seen_urls = set()
+_DONE = object()
+
+
+def _job_ref(job: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON-safe job for run-state payloads; the location is looked up again by name
+    return {"query": job["query"], "category": job["category"], "location": job["location"].name}
+
+
+def _job_from_ref(ref: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    loc = get_gazetteer().get(ref["location"])
+    if loc is None:
+        return None
+    return {"query": ref["query"], "category": ref["category"], "location": loc}
+
+
+def _group_by_job(rows: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]]:
+    groups: Dict[str, Tuple[Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]] = {}
+    for key, payload in rows:
+        job = _job_from_ref(payload["job"])
+        if job is None:
+            continue
+        groups.setdefault(job["query"], (job, []))[1].append((key, payload))
+    return list(groups.values())
 
-    await scraper.start()
-    try:
-        observer.tune_scraper(scraper)
-        jobs = observer.plan_all_queries()
 
-        for job in jobs:
-            items = await scraper.bing_news_search(job["query"], location_hint="")
+async def run_jobs(
+    next_job: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+    *,
+    pool: ScraperPool,
+    observer: ObserverAgent,
+    validator: ValidatorAgent,
+    crit: CriticalityAgent,
+    db,
+    seen: SeenStore,
+    scheduler: Optional[JobScheduler] = None,
+    run: Optional[RunState] = None,
+    timings: Optional[Dict[str, StageStats]] = None,
+) -> Dict[str, int]:
+    """
+    Runs jobs from `next_job()` (already rate limited; None = no more) through
+    the stages until it runs dry. Results are reported to `scheduler` if given.
+    Per-stage timings and queue depths are recorded into `timings` if given
+    (keys scrape / validate / classify / write).
 
-            # attach geo + dedupe
-            new_items = []
+    With `run`, every item's stage is checkpointed (keyed by normalized URL)
+    and items a previous attempt of the run left half-way are fed back in at
+    the stage after their last completed one; DB writes carry idempotency keys.
+    """
+    validate_q: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    classify_q: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+    stats = {"jobs": 0, "scraped": 0, "validated": 0, "truth": 0, "posts": 0}
+    if timings is None:
+        timings = {}
+    for name in ("scrape", "validate", "classify", "write"):
+        timings.setdefault(name, StageStats(name))
+
+    async def put(q: asyncio.Queue, stage: str, entry: Any) -> None:
+        await q.put(entry)
+        timings[stage].queued(q.qsize())
+
+    async def mark(entries: List[Tuple[str, str, Any]]) -> None:
+        if run is not None:
+            await asyncio.to_thread(run.mark, entries)
+
+    def write_key(key: str, what: str) -> Optional[str]:
+        return run.idempotency_key(key, what) if run is not None else None
+
+    async def resume_stage() -> None:
+        # classify_q first: those items are further along
+        for job, rows in _group_by_job(run.at_stage("classified") + run.at_stage("validated")):
+            await classify_q.put((job, [
+                (key, ValidationResult.model_validate(p["validation"]),
+                 CriticalityOutput.model_validate(p["out"]) if "out" in p else None)
+                for key, p in rows
+            ]))
+        for job, rows in _group_by_job(run.at_stage("scraped")):
+            await validate_q.put((job, [(key, p["item"]) for key, p in rows]))
+
+    async def scrape_stage() -> None:
+        while True:
+            job = await next_job()
+            if job is None:
+                return
+            stats["jobs"] += 1
+
+            t0 = time.monotonic()
+            async with pool.session() as scraper:
+                try:
+                    items = await scraper.bing_news_search(job["query"], location_hint="")
+                except Exception as e:
+                    print("Scrape failed for:", job["query"], e)
+                    continue
+
+            # attach geo
             for item in items:
                 item["lat"] = job["location"].lat
                 item["long"] = job["location"].long
                 item["category"] = job["category"]
 
+            # skip anything processed before (this run or earlier ones)
+            new_items = await asyncio.to_thread(seen.filter_new, items)
+            if scheduler is not None:
+                scheduler.record_scrape(job, scraped=len(items), new=len(new_items))
 
-                u = item.get("url")
-                if not u or u in seen_urls:
-                    continue
-                seen_urls.add(u)
-                new_items.append(item)
+            # the job itself is done once its results are checkpointed
+            keyed = [(normalize_url(it["url"]), it) for it in new_items]
+            await mark([(k, "scraped", {"job": _job_ref(job), "item": it}) for k, it in keyed]
+                       + [("job:" + job["query"], "written", None)])
 
+            timings["scrape"].add(len(items), time.monotonic() - t0)
             if not new_items:
                 print("No new items for:", job["query"])
-                await asyncio.sleep(10)
                 continue
 
-            # 2) VALIDATE (only new items)
-            validated = validator.validate_batch(new_items)
-            validated = observer.filter_validated(validated)  # plausibility >= 0.5 gate
+            stats["scraped"] += len(new_items)
+            await put(validate_q, "validate", (job, keyed))
 
-            # 4) CRITICALITY/TWEET
-            for v in validated:
-                out = crit.assess(v)
+    async def validate_stage() -> None:
+        while True:
+            entry = await validate_q.get()
+            if entry is _DONE:
+                await classify_q.put(_DONE)
+                return
+            job, keyed = entry
+            t0 = time.monotonic()
+
+            # only new items
+            try:
+                results = await validator.validate_each([it for _, it in keyed])
+            except Exception as e:
+                print("Validation failed for:", job["query"], e)
+                continue
+            # plausibility >= 0.5 gate
+            kept = {id(r) for r in observer.filter_validated([r for r in results if r is not None])}
 
+            # failed validations stay "scraped" and are retried on resume
+            validated = [(k, r, None) for (k, _), r in zip(keyed, results) if id(r) in kept]
+            await mark([
+                (k, "validated", {"job": _job_ref(job), "validation": r.model_dump()}) if id(r) in kept
+                else (k, SKIPPED, None)
+                for (k, _), r in zip(keyed, results) if r is not None
+            ])
+            timings["validate"].add(len(keyed), time.monotonic() - t0)
+            if validated:
+                stats["validated"] += len(validated)
+                await put(classify_q, "classify", (job, validated))
+
+    async def classify_stage() -> None:
+        while True:
+            entry = await classify_q.get()
+            if entry is _DONE:
+                return
+            job, validated = entry
+            t0 = time.monotonic()
+
+            # CRITICALITY/TWEET (blocking client, so off the event loop);
+            # items resumed after classification already have their output
+            todo = [i for i, (_, _, out) in enumerate(validated) if out is None]
+            try:
+                fresh = await asyncio.to_thread(crit.assess_batch, [validated[i][1] for i in todo])
+            except Exception as e:
+                print("Criticality failed for:", job["query"], e)
+                continue
+            outs = [out for _, _, out in validated]
+            for i, out in zip(todo, fresh):
+                outs[i] = out
+            await mark([
+                (validated[i][0], "classified", {"job": _job_ref(job), "validation": validated[i][1].model_dump(),
+                                                 "out": outs[i].model_dump()})
+                for i in todo if outs[i] is not None
+            ])
+            timings["classify"].add(len(todo), time.monotonic() - t0)
+
+            # items the model failed on stay "validated" and are retried on resume
+            validated, outs = (
+                [v for v, out in zip(validated, outs) if out is not None],
+                [out for out in outs if out is not None],
+            )
+            if not validated:
+                continue
+
+            if scheduler is not None and outs:
+                scheduler.record_severity(job, max(float(o.final_severity) for o in outs))
+
+            truth_updates = []
+            truth_keys = []
+            posts = []
+            post_keys = []
+            for (key, v, _), out in zip(validated, outs):
                 risk = float(out.final_severity)
 
-                db.update_truth(
-                    lat=job["location"].lat,
-                    long=job["location"].long,
-                    category=job["category"],   # category enum must match truth columns
-                    severity=risk,              # store risk in truth (not raw severity)
-                    alpha=0.25,                 # tune smoothing
-                )
+                truth_updates.append((
+                    job["location"].lat,
+                    job["location"].long,
+                    job["category"],   # category enum must match truth columns
+                    risk,              # store risk in truth (not raw severity)
+                    0.25,              # tune smoothing
+                ))
+                truth_keys.append(write_key(key, "truth"))
 
                 if observer.should_write(out):
-                    db.insert_post(
-                        lat=job["location"].lat,      
-                        long=job["location"].long,
-                        severity=out.final_severity,
-                        category=job["category"],
-                        content=out.tweet,
-                        human=False,
-                    )
+                    posts.append({
+                        "lat": job["location"].lat,
+                        "long": job["location"].long,
+                        "severity": out.final_severity,
+                        "category": job["category"],
+                        "content": out.tweet,
+                        "human": False,
+                    })
+                    post_keys.append(write_key(key, "post"))
+
+            # one transaction per job
+            # (idempotency keys make a resumed item's repeat write a no-op)
+            t0 = time.monotonic()
+            try:
+                n_truth = await asyncio.to_thread(
+                    db.bulk_update_truth_ema, truth_updates, source="live_news",
+                    keys=truth_keys if run is not None else None,
+                )
+                post_ids = await asyncio.to_thread(
+                    db.bulk_insert_posts, posts, keys=post_keys if run is not None else None,
+                )
+            except Exception as e:
+                # the items stay "classified" and are written on resume
+                print("DB write failed for:", job["query"], e)
+                continue
+            await mark([(key, "written", None) for key, _, _ in validated])
+            timings["write"].add(len(validated), time.monotonic() - t0)
+            stats["truth"] += n_truth
+            stats["posts"] += len(post_ids)
+            print(f"written to db: truth={n_truth} posts={len(post_ids)}")
+
+    async def feed_stage() -> None:
+        if run is not None:
+            await resume_stage()
+        await asyncio.gather(*(scrape_stage() for _ in range(pool.size)))
+        await validate_q.put(_DONE)
+
+    tasks = [asyncio.create_task(s()) for s in (feed_stage, validate_stage, classify_stage)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # a failed stage would leave the others blocked on their queues
+        for t in tasks:
+            t.cancel()
+    return stats
+
+
+def sweep_jobs(run: RunState, observer: ObserverAgent) -> List[Dict[str, Any]]:
+    """
+    The planned jobs a sweep run hasn't scraped yet (all of them for a new run).
+    """
+    done = run.stages()
+    return [j for j in observer.plan_all_queries() if done.get("job:" + j["query"]) != "written"]
+
+
+async def run_sweep(jobs: List[Dict[str, Any]], *, limiter: TokenBucket, **stages) -> Dict[str, int]:
+    """
+    One pass over `jobs` in order, each search paced by `limiter`.
+    """
+    job_q: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        job_q.put_nowait(job)
+
+    async def next_job() -> Optional[Dict[str, Any]]:
+        try:
+            job = job_q.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        await limiter.acquire(1.0)
+        return job
+
+    return await run_jobs(next_job, **stages)
+
+
+async def main(sweeps: Optional[int] = 1, scheduled: bool = SCHEDULED):
+    """
+    Runs `sweeps` sweeps over every planned job (None = forever). Sweeps run
+    back to back; the shared limiter keeps the search rate in budget. With
+    `scheduled`, jobs are instead served by priority until interrupted.
+    """
+    pool = ScraperPool(size=SCRAPER_SESSIONS)
+    observer = ObserverAgent()
+    validator = ValidatorAgent()
+    crit = CriticalityAgent(model="claude-opus-4-6")
+    db = open_storage()
+
+    limiter = TokenBucket(rate_per_sec=SEARCHES_PER_MIN / 60.0, capacity=SCRAPER_SESSIONS)
+    seen = SeenStore()
+
+    await pool.start()
+    try:
+        observer.tune_scraper(pool)
+
+        if scheduled:
+            scheduler = observer.make_scheduler(db, limiter)
+            await scheduler.refresh()
+            print(f"Scheduling {len(scheduler.jobs)} jobs at {SEARCHES_PER_MIN:g} searches/min; top:",
+                  scheduler.snapshot(5))
+            # open-ended, so finished items are dropped from the run state
+            run = RunState("live_news", input_id="scheduled", keep_done=False)
+            stats = await run_jobs(
+                scheduler.next_job, pool=pool, observer=observer, validator=validator,
+                crit=crit, db=db, seen=seen, scheduler=scheduler, run=run,
+            )
+            print(f"Scheduler stopped: {stats}")
+            return
 
-                print("written to db")
+        n = 0
+        while sweeps is None or n < sweeps:
+            # resumes the last sweep if it didn't finish
+            run = RunState("live_news", input_id="sweep")
+            jobs = sweep_jobs(run, observer)
+            print(f"Sweep {n + 1}: {len(jobs)} jobs, ~{len(jobs) / SEARCHES_PER_MIN:.1f} min "
+                  f"at {SEARCHES_PER_MIN:g} searches/min on {pool.size} sessions")
 
-            # rate limit without blocking async loop
-            await asyncio.sleep(40)
+            t0 = time.monotonic()
+            stats = await run_sweep(
+                jobs, limiter=limiter, pool=pool, observer=observer,
+                validator=validator, crit=crit, db=db, seen=seen, run=run,
+            )
+            # items still failing after SWEEP_ATTEMPTS are dropped, so the
+            # next sweep plans every job again
+            run.complete(max_attempts=SWEEP_ATTEMPTS)
+            print(f"Sweep {n + 1} done in {time.monotonic() - t0:.0f}s: {stats}")
+            n += 1
+            seen.purge()
 
     finally:
-        await scraper.end()
+        await pool.end()
 
 
 if __name__ == "__main__":
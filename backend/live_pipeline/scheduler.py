@@ -0,0 +1,260 @@
+"""
+Priority scheduling for live scrape jobs.
+
+Every (location, query) job gets a priority p in [0, 1] from:
+  - recent severity: EMA of the highest severity its results were classified
+    at, seeded from the location's truth row
+  - novelty: EMA of the fraction of its scraped items that were new
+  - staleness: age of the location's truth.updated_at (STALE_HOURS = fully stale)
+
+A job is due again `interval(p)` after it last ran, where interval goes
+geometrically from MAX_INTERVAL_S at p = 0 to MIN_INTERVAL_S at p = 1. Jobs
+wait in a heap ordered by due time and are handed out through the shared
+TokenBucket, so the request budget is spent on the most overdue jobs first
+and busy locations come round far more often than quiet ones.
+
+Config:
+  STREETSENSE_SCHED_MIN_INTERVAL_S  shortest re-run interval (default 300)
+  STREETSENSE_SCHED_MAX_INTERVAL_S  longest re-run interval (default 21600)
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils import TokenBucket
+
+MIN_INTERVAL_S = float(os.getenv("STREETSENSE_SCHED_MIN_INTERVAL_S", "300"))
+MAX_INTERVAL_S = float(os.getenv("STREETSENSE_SCHED_MAX_INTERVAL_S", "21600"))
+
+# Weights of the priority terms (sum to 1)
+W_SEVERITY = 0.5
+W_NOVELTY = 0.3
+W_STALENESS = 0.2
+
+# Smoothing for the per-job severity / novelty EMAs
+FEEDBACK_ALPHA = 0.3
+
+# truth.updated_at older than this counts as fully stale
+STALE_HOURS = 6.0
+
+# How often truth staleness is re-read from the DB
+REFRESH_S = 300.0
+
+CATEGORIES = [
+    "crime",
+    "public_safety",
+    "transport",
+    "infrastructure",
+    "policy",
+    "protest",
+    "weather",
+    "other",
+]
+
+JobKey = Tuple[str, str]
+
+
+@dataclass
+class JobState:
+    job: Dict[str, Any]
+    severity: float = 0.0
+    novelty: float = 1.0       # unknown jobs are assumed to find new items
+    last_run: float = 0.0
+    version: int = 0
+    runs: int = 0
+
+
+def _job_key(job: Dict[str, Any]) -> JobKey:
+    return job["location"].name, job["query"]
+
+
+def _parse_ts(ts: Any) -> Optional[float]:
+    if not ts:
+        return None
+    try:
+        return datetime.strptime(str(ts)[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def interval_for(priority: float) -> float:
+    p = max(0.0, min(1.0, priority))
+    return MIN_INTERVAL_S * (MAX_INTERVAL_S / MIN_INTERVAL_S) ** (1.0 - p)
+
+
+class JobScheduler:
+    """
+    Serves jobs one at a time via `await next_job()`; the pipeline reports
+    back with record_scrape() / record_severity().
+    """
+
+    def __init__(self, jobs: List[Dict[str, Any]], *, db, limiter: TokenBucket, max_jobs: Optional[int] = None):
+        self.db = db
+        self.limiter = limiter
+        self.max_jobs = max_jobs
+
+        self.jobs: Dict[JobKey, JobState] = {}
+        self.staleness: Dict[str, float] = {}
+        self.truth_severity: Dict[str, Dict[str, float]] = {}
+        self._heap: List[Tuple[float, int, JobKey, int]] = []
+        self._seq = itertools.count()
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+        self._refreshed_at = 0.0
+        self._served = 0
+        self._stopped = False
+
+        for job in jobs:
+            self.jobs[_job_key(job)] = JobState(job=job)
+
+    # --- priority ---
+
+    def priority(self, key: JobKey) -> float:
+        st = self.jobs[key]
+        loc = st.job["location"].name
+        return (
+            W_SEVERITY * st.severity
+            + W_NOVELTY * st.novelty
+            + W_STALENESS * self.staleness.get(loc, 1.0)
+        )
+
+    def _push(self, key: JobKey, due: float) -> None:
+        st = self.jobs[key]
+        st.version += 1
+        heapq.heappush(self._heap, (due, next(self._seq), key, st.version))
+        self._changed.set()
+
+    def _reschedule(self, key: JobKey) -> None:
+        st = self.jobs[key]
+        self._push(key, st.last_run + interval_for(self.priority(key)))
+
+    def _read_truth(self) -> Dict[str, Tuple[Optional[float], Dict[str, float]]]:
+        out = {}
+        for st in self.jobs.values():
+            loc = st.job["location"]
+            if loc.name in out:
+                continue
+            row = self.db.get_truth(lat=loc.lat, long=loc.long)
+            if row is None:
+                out[loc.name] = (None, {})
+            else:
+                out[loc.name] = (_parse_ts(row.get("updated_at")),
+                                 {c: float(row.get(c) or 0.0) for c in CATEGORIES})
+        return out
+
+    async def refresh(self) -> None:
+        """
+        Re-reads truth for every location: staleness from updated_at, and the
+        truth severity as a floor for jobs that haven't reported any yet.
+        """
+        truth = await asyncio.to_thread(self._read_truth)
+        now = time.time()
+        for name, (updated, sev) in truth.items():
+            self.staleness[name] = 1.0 if updated is None else min(1.0, max(0.0, now - updated) / (STALE_HOURS * 3600))
+            self.truth_severity[name] = sev
+
+        for key, st in self.jobs.items():
+            if st.runs == 0:
+                sev = self.truth_severity.get(key[0], {})
+                cat = st.job.get("category")
+                st.severity = sev.get(cat, max(sev.values(), default=0.0))
+
+        if not self._heap:
+            # first refresh: everything is due now, highest priority first
+            for key in self.jobs:
+                self._push(key, now - self.priority(key))
+        else:
+            for key, st in self.jobs.items():
+                if st.last_run:
+                    self._reschedule(key)
+        self._refreshed_at = now
+
+    # --- serving ---
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._changed.set()
+
+    def _peek(self) -> Optional[Tuple[float, JobKey]]:
+        while self._heap:
+            due, _, key, version = self._heap[0]
+            if version == self.jobs[key].version:
+                return due, key
+            heapq.heappop(self._heap)
+        return None
+
+    async def next_job(self) -> Optional[Dict[str, Any]]:
+        """
+        Waits until the most overdue job is due and the request budget allows
+        it, then returns it (None once stopped or max_jobs were served).
+        """
+        async with self._lock:
+            while True:
+                if self._stopped or (self.max_jobs is not None and self._served >= self.max_jobs):
+                    return None
+
+                if time.time() - self._refreshed_at >= REFRESH_S:
+                    await self.refresh()
+
+                top = self._peek()
+                wait_s = REFRESH_S if top is None else top[0] - time.time()
+                if wait_s > 0:
+                    # feedback may move a job earlier, so wake up on changes
+                    self._changed.clear()
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=min(wait_s, REFRESH_S))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self.limiter.acquire(1.0)
+
+                # priorities may have moved while waiting for the budget
+                top = self._peek()
+                if top is None or top[0] > time.time():
+                    continue
+                key = top[1]
+                heapq.heappop(self._heap)
+
+                st = self.jobs[key]
+                st.last_run = time.time()
+                st.runs += 1
+                self._served += 1
+                self._reschedule(key)
+                return st.job
+
+    # --- feedback ---
+
+    def record_scrape(self, job: Dict[str, Any], *, scraped: int, new: int) -> None:
+        st = self.jobs.get(_job_key(job))
+        if st is None:
+            return
+        frac = new / scraped if scraped else 0.0
+        st.novelty = (1 - FEEDBACK_ALPHA) * st.novelty + FEEDBACK_ALPHA * frac
+        self._reschedule(_job_key(job))
+
+    def record_severity(self, job: Dict[str, Any], severity: float) -> None:
+        st = self.jobs.get(_job_key(job))
+        if st is None:
+            return
+        st.severity = (1 - FEEDBACK_ALPHA) * st.severity + FEEDBACK_ALPHA * max(0.0, min(1.0, severity))
+        self._reschedule(_job_key(job))
+
+    def snapshot(self, top: int = 10) -> List[Dict[str, Any]]:
+        ranked = sorted(self.jobs, key=self.priority, reverse=True)[:top]
+        return [
+            {
+                "location": k[0],
+                "query": k[1],
+                "priority": round(self.priority(k), 3),
+                "interval_s": round(interval_for(self.priority(k))),
+                "runs": self.jobs[k].runs,
+            }
+            for k in ranked
+        ]
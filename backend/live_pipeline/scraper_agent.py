@@ -1,13 +1,10 @@
 import os
 import asyncio
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from urllib.parse import quote_plus
-import asyncio
-from stagehand import UnprocessableEntityError
-
-from stagehand import AsyncStagehand
 
+from live_pipeline.clients import extract_errors, stagehand_client
 from live_pipeline.pipeline_models import ScrapedItem
 
 
@@ -20,9 +17,11 @@ class ScraperAgent:
     Owns the browser session and exposes functions the Observer can call.
     """
 
-    def __init__(self, model_name: str = "openai/gpt-4o-mini"):
+    def __init__(self, model_name: str = "openai/gpt-4o-mini", client_factory: Optional[Callable[[], Any]] = None):
         self.model_name = model_name
-        self.client: Optional[AsyncStagehand] = None
+        # Builds an AsyncStagehand-like client per start(), e.g. clients.FakeStagehand offline
+        self.client_factory = client_factory or stagehand_client
+        self.client = None
         self.session = None
         self.state: Dict[str, Any] = {
             "max_items": 5,
@@ -31,11 +30,7 @@ class ScraperAgent:
         }
 
     async def start(self) -> str:
-        self.client = AsyncStagehand(
-            browserbase_api_key="",
-            browserbase_project_id="",
-            model_api_key="",
-        )
+        self.client = self.client_factory()
         await self.client.__aenter__()  # enter async context manually
 
         self.session = await self.client.sessions.start(model_name=self.model_name)
@@ -110,7 +105,7 @@ class ScraperAgent:
         try:
             resp = await self.session.extract(instruction=instruction, schema=schema)
             articles = (resp.data.result or {}).get("articles", [])
-        except UnprocessableEntityError:
+        except extract_errors(self.client):
             # ✅ Fallback path: ask for minimal (title,url) only with an even simpler schema
             fallback_schema = {
                 "type": "object",
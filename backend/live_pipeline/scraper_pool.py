@@ -0,0 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+from live_pipeline.scraper_agent import ScraperAgent
+
+
+class ScraperPool:
+    """
+    Several ScraperAgent sessions, handed out one job at a time. Each session
+    is a separate browser, so jobs on different sessions run concurrently.
+    """
+
+    def __init__(
+        self,
+        size: int = 3,
+        model_name: str = "openai/gpt-4o-mini",
+        client_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self.size = size
+        self.agents: List[ScraperAgent] = [
+            ScraperAgent(model_name=model_name, client_factory=client_factory) for _ in range(size)
+        ]
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def start(self) -> List[str]:
+        session_ids = await asyncio.gather(*(a.start() for a in self.agents))
+        for a in self.agents:
+            self._idle.put_nowait(a)
+        return list(session_ids)
+
+    async def end(self) -> None:
+        await asyncio.gather(*(a.end() for a in self.agents), return_exceptions=True)
+
+    def set_params(self, **kwargs) -> None:
+        for a in self.agents:
+            a.set_params(**kwargs)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[ScraperAgent]:
+        agent = await self._idle.get()
+        try:
+            yield agent
+        finally:
+            self._idle.put_nowait(agent)
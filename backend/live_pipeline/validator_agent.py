@@ -1,7 +1,20 @@
 from __future__ import annotations
+import asyncio
+import os
+import random
+import weakref
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
-from perplexity import Perplexity
+
+from live_pipeline.clients import perplexity_clients
+from utils import TokenBucket
+
+# validate_batch defaults
+VALIDATOR_CONCURRENCY = int(os.getenv("STREETSENSE_VALIDATOR_CONCURRENCY", "8"))
+VALIDATOR_RATE_PER_SEC = float(os.getenv("STREETSENSE_VALIDATOR_RATE_PER_SEC", "5"))
+VALIDATOR_TIMEOUT_S = float(os.getenv("STREETSENSE_VALIDATOR_TIMEOUT_S", "60"))
+VALIDATOR_MAX_RETRIES = int(os.getenv("STREETSENSE_VALIDATOR_MAX_RETRIES", "3"))
+RETRY_BASE_S = 1.0
 
 
 # -----------------------------
@@ -33,10 +46,42 @@ class ValidatorAgent:
     Perplexity-backed validation layer.
     """
 
-    def __init__(self, model: str = "sonar-pro"):
-        self.client = Perplexity(api_key="")
+    def __init__(
+        self,
+        model: str = "sonar-pro",
+        concurrency: int = VALIDATOR_CONCURRENCY,
+        rate_per_sec: float = VALIDATOR_RATE_PER_SEC,
+        timeout_s: float = VALIDATOR_TIMEOUT_S,
+        max_retries: int = VALIDATOR_MAX_RETRIES,
+        client=None,
+        async_client=None,
+    ):
+        # Anything with chat.completions.create, e.g. clients.FakePerplexity offline
+        if client is None or async_client is None:
+            default, default_async = perplexity_clients()
+            client = client or default
+            async_client = async_client or default_async
+        self.client = client
+        self.async_client = async_client
         self.model = model
 
+        self.concurrency = concurrency
+        self.rate_per_sec = rate_per_sec
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        # Shared by every validate_batch call on this agent within one event
+        # loop; a bucket's lock can't be awaited from another loop, so each
+        # loop (e.g. each asyncio.run) gets its own
+        self._limiters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _limiter(self) -> TokenBucket:
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = TokenBucket(rate_per_sec=self.rate_per_sec, capacity=max(1, self.concurrency))
+            self._limiters[loop] = limiter
+        return limiter
+
     def _build_prompt(self, item: Dict[str, Any]) -> str:
         return f"""
 You are a fact-validation and risk-assessment system.
@@ -72,8 +117,8 @@ TASK:
 Return only structured JSON matching the schema.
 """
 
-    def validate_item(self, item: Dict[str, Any]) -> ValidationResult:
-        completion = self.client.chat.completions.create(
+    def _request(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(
             model=self.model,
             messages=[
                 {
@@ -89,16 +134,53 @@ Return only structured JSON matching the schema.
             }
         )
 
+    def validate_item(self, item: Dict[str, Any]) -> ValidationResult:
+        completion = self.client.chat.completions.create(**self._request(item))
+
+        return ValidationResult.model_validate_json(
+            completion.choices[0].message.content
+        )
+
+    async def validate_item_async(self, item: Dict[str, Any]) -> ValidationResult:
+        """
+        One rate-limited attempt with a timeout; raises on failure.
+        """
+        await self._limiter().acquire(1.0)
+        completion = await asyncio.wait_for(
+            self.async_client.chat.completions.create(**self._request(item)),
+            timeout=self.timeout_s,
+        )
+
         return ValidationResult.model_validate_json(
             completion.choices[0].message.content
         )
 
-    def validate_batch(self, items: List[Dict[str, Any]]) -> List[ValidationResult]:
-        results = []
-        for item in items:
+    async def _validate_with_retries(self, item: Dict[str, Any], sem: asyncio.Semaphore) -> Optional[ValidationResult]:
+        for attempt in range(self.max_retries + 1):
             try:
-                res = self.validate_item(item)
-                results.append(res)
+                async with sem:
+                    return await self.validate_item_async(item)
             except Exception as e:
-                print(f"Validation failed for {item.get('url')}: {e}")
-        return results
+                if attempt == self.max_retries:
+                    print(f"Validation failed for {item.get('url')}: {e!r}")
+                    return None
+                # Exponential backoff with full jitter, outside the semaphore
+                await asyncio.sleep(random.uniform(0, RETRY_BASE_S * (2 ** attempt)))
+        return None
+
+    async def validate_each(self, items: List[Dict[str, Any]]) -> List[Optional[ValidationResult]]:
+        """
+        Validates items concurrently: at most `concurrency` requests in
+        flight, `rate_per_sec` requests started per second, `timeout_s` per
+        attempt and up to `max_retries` retries. One result per item, in
+        input order; None for items that still fail.
+        """
+        sem = asyncio.Semaphore(self.concurrency)
+
+        return list(await asyncio.gather(*(self._validate_with_retries(item, sem) for item in items)))
+
+    async def validate_batch(self, items: List[Dict[str, Any]]) -> List[ValidationResult]:
+        """
+        validate_each, with the items that failed logged and left out.
+        """
+        return [r for r in await self.validate_each(items) if r is not None]
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import routing, social, heatmap, location_summary
+from db.post_retention import start_retention_worker
+from post_worker import get_post_workers
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -17,3 +19,16 @@ app.include_router(routing.router)
 app.include_router(social.router)
 app.include_router(heatmap.router)
 app.include_router(location_summary.router)
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    # Moves cold posts out of the hot `posts` partition (SQLite only)
+    start_retention_worker()
+    # Classifies queued user posts
+    await get_post_workers().start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    await get_post_workers().stop()
@@ -0,0 +1,162 @@
+"""
+Background classification of user posts.
+
+POST /post only stores the raw post as 'pending' plus a row in the durable
+post_queue table and returns 202. A pool of async workers claims due jobs in
+micro-batches, classifies them with the CriticalityAgent on a dedicated
+thread pool, and writes each batch's results back in one transaction.
+
+Failed classifications are retried with exponential backoff and jitter;
+after MAX_ATTEMPTS the post is marked 'failed'. Claimed jobs are leased, so
+jobs held by a worker that dies (or a server restart) run again once their
+lease expires; nothing in the queue is lost.
+
+Config:
+  STREETSENSE_POST_WORKERS       concurrent worker loops (default 4)
+  STREETSENSE_POST_BATCH         jobs claimed per batch (default 8)
+  STREETSENSE_POST_MAX_ATTEMPTS  attempts before a post is marked failed (default 5)
+  STREETSENSE_POST_QUEUE_MAX     queue depth at which /post returns 503 (default 1000)
+"""
+
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from db.async_db import AsyncDBWriter, get_async_db
+
+POST_WORKERS = int(os.getenv("STREETSENSE_POST_WORKERS", "4"))
+POST_BATCH = int(os.getenv("STREETSENSE_POST_BATCH", "8"))
+MAX_ATTEMPTS = int(os.getenv("STREETSENSE_POST_MAX_ATTEMPTS", "5"))
+QUEUE_MAX = int(os.getenv("STREETSENSE_POST_QUEUE_MAX", "1000"))
+
+LEASE_S = 120.0  # must comfortably exceed one batch's LLM round trips
+POLL_INTERVAL_S = 1.0
+RETRY_BASE_S = 2.0
+RETRY_MAX_S = 300.0
+DEPTH_CACHE_S = 1.0
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with +-50% jitter, capped at RETRY_MAX_S.
+    """
+    return min(RETRY_BASE_S * (2 ** attempts), RETRY_MAX_S) * random.uniform(0.5, 1.5)
+
+
+class PostWorkerPool:
+    def __init__(
+        self,
+        agent=None,
+        adb: Optional[AsyncDBWriter] = None,
+        workers: int = POST_WORKERS,
+        batch_size: int = POST_BATCH,
+    ):
+        if agent is None:
+            from static_analysis_pipeline.criticality_analysis_agent import CriticalityAgent
+            agent = CriticalityAgent()
+        self.agent = agent
+        self.adb = adb or get_async_db()
+        self.workers = workers
+        self.batch_size = batch_size
+
+        # LLM calls block; keep them off both FastAPI's and the DB's pools
+        self._executor = ThreadPoolExecutor(max_workers=workers * batch_size, thread_name_prefix="classify")
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._depth = 0
+        self._depth_at = 0.0
+
+    # --- producer side ---
+
+    async def queue_depth(self) -> int:
+        """
+        Approximate queue depth for backpressure, re-counted at most every
+        DEPTH_CACHE_S.
+        """
+        now = time.monotonic()
+        if now - self._depth_at >= DEPTH_CACHE_S:
+            self._depth = await self.adb.run(self.adb.db.count_post_queue)
+            self._depth_at = now
+        return self._depth
+
+    async def submit(self, **post) -> Dict[str, Any]:
+        out = await self.adb.run(self.adb.db.enqueue_post, **post)
+        self._depth += 1
+        if self._wake is not None:
+            self._wake.set()
+        return out
+
+    # --- workers ---
+
+    async def start(self) -> None:
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"[post-worker] started {self.workers} workers, batch {self.batch_size}")
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    async def _worker(self, i: int) -> None:
+        while True:
+            try:
+                jobs = await self.adb.run(
+                    self.adb.db.claim_post_jobs, limit=self.batch_size, lease_s=LEASE_S
+                )
+            except Exception as e:
+                print(f"[post-worker {i}] claim failed: {e}")
+                jobs = []
+
+            if not jobs:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(jobs)
+            except Exception as e:
+                # the batch stays leased and runs again once the lease expires
+                print(f"[post-worker {i}] batch of {len(jobs)} failed: {e}")
+
+    async def _process(self, jobs: List[Dict[str, Any]]) -> None:
+        loop = asyncio.get_running_loop()
+        outs = await asyncio.gather(
+            *[loop.run_in_executor(self._executor, self.agent.assess, job["content"]) for job in jobs],
+            return_exceptions=True,
+        )
+
+        done = []
+        for job, out in zip(jobs, outs):
+            if isinstance(out, BaseException):
+                attempts = job["attempts"] + 1
+                give_up = attempts >= MAX_ATTEMPTS
+                print(f"[post-worker] {job['id']} attempt {attempts} failed: {out}"
+                      + (" (giving up)" if give_up else ""))
+                await self.adb.run(
+                    self.adb.db.retry_post_job, job["id"],
+                    error=str(out), delay_s=None if give_up else retry_delay(attempts),
+                )
+            else:
+                done.append((job["id"], out.final_severity, out.category))
+
+        if done:
+            await self.adb.run(self.adb.db.complete_post_jobs, done)
+
+
+_pool: Optional[PostWorkerPool] = None
+
+
+def get_post_workers() -> PostWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = PostWorkerPool()
+    return _pool
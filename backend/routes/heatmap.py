@@ -1,19 +1,25 @@
 from fastapi import APIRouter
 from fastapi.responses import Response
+import asyncio
 import math
 import io
-import sqlite3
 import numpy as np
 from PIL import Image
-from db.db_writer import DBWriter
+from db import geohash
+from db.truth_snapshot import current_bucket, decay_factors, get_snapshot
+from db.async_db import get_async_db
 from scipy.ndimage import gaussian_filter
 
 
 router = APIRouter()
-db = DBWriter()
+adb = get_async_db()
 
 TILE_SIZE = 256
 
+# At or below this zoom, tiles render pre-aggregated truth_rollup cells
+# instead of individual truth rows.
+ROLLUP_MAX_ZOOM = 11
+
 CATEGORIES = [
     "crime",
     "public_safety",
@@ -71,7 +77,7 @@ def meters_per_pixel(lat: float, z: int) -> float:
     return (EARTH_CIRCUM_M * math.cos(math.radians(lat))) / (2.0 ** z * TILE_SIZE)
 
 # ----------------------------
-# DB query
+# Truth points (shared in-memory snapshot)
 # ----------------------------
 def fetch_truth_points_in_bounds(
     west: float,
@@ -81,29 +87,28 @@ def fetch_truth_points_in_bounds(
     *,
     padding_deg: float,
     limit: int = 12000,
+    snap=None,
 ):
-    conn = sqlite3.connect(db.path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    w = west - padding_deg
-    e = east + padding_deg
-    s = south - padding_deg
-    n = north + padding_deg
-
-    cur.execute(
-        f"""
-        SELECT lat, long, {", ".join(CATEGORIES)}
-        FROM truth
-        WHERE long BETWEEN ? AND ?
-          AND lat BETWEEN ? AND ?
-        LIMIT ?
-        """,
-        (w, e, s, n, limit),
+    """
+    Returns (lats, lngs, risks) float32 arrays for truth rows in the padded bbox.
+    """
+    snap = snap if snap is not None else get_snapshot()
+    idx = snap.bbox(
+        south - padding_deg, west - padding_deg,
+        north + padding_deg, east + padding_deg,
+        limit=limit,
     )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return snap.lat[idx], snap.lng[idx], snap.scores().max_risk[idx]
+
+def rollup_level_for_zoom(z: int) -> int:
+    """
+    Coarsest rollup level whose cells are still a few pixels apart at z.
+    """
+    if z <= 6:
+        return geohash.ROLLUP_LEVELS[0]
+    if z <= 8:
+        return geohash.ROLLUP_LEVELS[1]
+    return geohash.ROLLUP_LEVELS[2]
 
 # ----------------------------
 # Risk (DB already 0..1)
@@ -138,8 +143,6 @@ def render_heatmap_tile(
     """
     Returns heat array in [0..1] (after scaling).
     """
-    heat = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float32)
-
     # Use tile center latitude to compute meters-per-pixel
     west, south, east, north = tile_bounds_wsen(x, y, z)
     center_lat = (south + north) * 0.5
@@ -154,10 +157,9 @@ def render_heatmap_tile(
     tile_origin_x = x * TILE_SIZE
     tile_origin_y = y * TILE_SIZE
 
-    for r in points:
-        lat = float(r["lat"])
-        lng = float(r["long"])
-        risk = truth_to_risk01(r) * strength
+    lats, lngs, risks = points
+    for lat, lng, risk01 in zip(lats.tolist(), lngs.tolist(), risks.tolist()):
+        risk = risk01 * strength
         if risk <= 0:
             continue
 
@@ -228,11 +230,21 @@ def heat_to_image(heat: np.ndarray) -> Image.Image:
     return Image.fromarray(img, mode="RGBA")
 
 
+def render_tile_png(z: int, x: int, y: int, points, sigma_m: float) -> bytes:
+    heat = render_heatmap_tile(z, x, y, points, sigma_m=sigma_m, strength=1.0)
+
+    image = heat_to_image(heat)
+
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
 # ----------------------------
 # Tile endpoint
 # ----------------------------
 @router.get("/tiles/{z}/{x}/{y}.png")
-def heatmap_tile(z: int, x: int, y: int):
+async def heatmap_tile(z: int, x: int, y: int):
     west, south, east, north = tile_bounds_wsen(x, y, z)
 
     # Padding should roughly match sigma_m "bleed".
@@ -242,17 +254,33 @@ def heatmap_tile(z: int, x: int, y: int):
     bleed_m = 3.0 * sigma_m
     padding_deg = max(0.002, bleed_m / 111_000.0)  # ~deg lat
 
-    points = fetch_truth_points_in_bounds(
-        west, south, east, north,
-        padding_deg=padding_deg,
-        limit=50000
-    )
-
-    heat = render_heatmap_tile(z, x, y, points, sigma_m=sigma_m, strength=1.0)
-    
-    image = heat_to_image(heat)
-
-    buf = io.BytesIO()
-    image.save(buf, format="PNG")
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+    if z <= ROLLUP_MAX_ZOOM:
+        level = rollup_level_for_zoom(z)
+        dlat, dlng = geohash.cell_size_deg(level)
+        cells = await adb.get_truth_rollup(
+            level=level,
+            south=south - dlat, west=west - dlng,
+            north=north + dlat, east=east + dlng,
+        )
+        # Rollups only keep the cell's latest updated_at, so the whole cell
+        # decays from its most recent write.
+        updated = np.array([c["updated_at"] for c in cells], dtype="datetime64[s]").astype(np.int64)
+        points = (
+            np.array([c["lat"] for c in cells], dtype=np.float32),
+            np.array([c["long"] for c in cells], dtype=np.float32),
+            np.array([truth_to_risk01(c) for c in cells], dtype=np.float32)
+            * decay_factors(updated, current_bucket()),
+        )
+        # Spread each cell over roughly its own footprint so neighbours blend
+        sigma_m = max(sigma_m, 0.6 * dlat * 111_000.0)
+    else:
+        points = fetch_truth_points_in_bounds(
+            west, south, east, north,
+            padding_deg=padding_deg,
+            limit=50000,
+            snap=await adb.snapshot(),
+        )
+
+    # Rendering is CPU-bound; keep it off the event loop
+    png = await asyncio.to_thread(render_tile_png, z, x, y, points, sigma_m)
+    return Response(content=png, media_type="image/png")
@@ -1,12 +1,12 @@
 from fastapi import APIRouter
 from typing import Dict, List
-import math
 import time
-from db.db_writer import DBWriter
+from db.truth_snapshot import get_snapshot
+from db.async_db import get_async_db
 
 
 router = APIRouter()
-db = DBWriter()
+adb = get_async_db()
 
 CATEGORIES = [
     "crime",
@@ -19,15 +19,17 @@ CATEGORIES = [
     "other",
 ]
 
-def haversine(lat1, lng1, lat2, lng2):
-    R = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lng2 - lng1)
-
-    a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+def area_truth(lat: float, lng: float, radius: float, snap=None) -> Dict[str, float]:
+    """
+    Mean time-decayed truth over the truth cells within the radius, from the
+    shared snapshot.
+    """
+    snap = snap if snap is not None else get_snapshot()
+    idx = snap.within(lat, lng, radius)
+    if not len(idx):
+        return {c: 0.0 for c in CATEGORIES}
+    means = snap.scores().values[idx].mean(axis=0)
+    return {c: float(v) for c, v in zip(CATEGORIES, means)}
 
 def label_from_score(score_0_100: float) -> str:
     if score_0_100 >= 70: return "High"
@@ -35,19 +37,10 @@ def label_from_score(score_0_100: float) -> str:
     return "Low"
 
 @router.get("/location-summary")
-def location_summary(lat: float, lng: float, radius: float = 500):
-    posts = db.get_feed(lat=lat, lng=lng, radius=radius)  # should return dicts
-
-    # filter precisely by haversine (in case DB radius is coarse)
-    in_radius = []
-    for p in posts:
-        plat = p.get("lat")
-        plng = p.get("lng", p.get("long"))
-        if plat is None or plng is None:
-            continue
-        d = haversine(lat, lng, plat, plng)
-        if d <= radius:
-            in_radius.append((p, d))
+async def location_summary(lat: float, lng: float, radius: float = 500):
+    # get_feed already filters by exact haversine distance in the DB
+    posts = await adb.get_feed(lat=lat, lng=lng, radius=radius)
+    in_radius = [(p, p["distance"]) for p in posts]
 
     nearby_posts = len(in_radius)
 
@@ -56,6 +49,9 @@ def location_summary(lat: float, lng: float, radius: float = 500):
     counts: Dict[str, int] = {c: 0 for c in CATEGORIES}
 
     for p, _d in in_radius:
+        # pending/failed posts have no model severity yet
+        if p.get("status") != "classified":
+            continue
         cat = p.get("category", "other")
         sev = float(p.get("severity", 0.0))
         if cat not in sums:
@@ -63,9 +59,11 @@ def location_summary(lat: float, lng: float, radius: float = 500):
         sums[cat] += sev
         counts[cat] += 1
 
+    # Post averages where people reported something, area truth elsewhere
+    area = area_truth(lat, lng, radius, await adb.snapshot())
     truth = {}
     for c in CATEGORIES:
-        truth[c] = (sums[c] / counts[c]) if counts[c] else 0.0
+        truth[c] = (sums[c] / counts[c]) if counts[c] else area[c]
 
     # overall risk: simplest working definition
     overall_risk01 = max(truth.values()) if truth else 0.0
@@ -3,12 +3,12 @@ from pydantic import BaseModel
 import osmnx as ox
 import networkx as nx
 import os
-from db.db_writer import DBWriter
+from db.storage import open_storage
+from db.truth_snapshot import get_snapshot
 import math
-import sqlite3
 
 router = APIRouter()
-db = DBWriter()
+db = open_storage()
 
 if os.path.exists("london_walk.graphml"):
     print("Loading cached London graph...")
@@ -22,7 +22,6 @@ print("loaded")
 
 
 SEARCH_RADIUS_M = 150  # tune (100–250m)
-MAX_CANDIDATES = 50
 
 def haversine_m(lat1, lon1, lat2, lon2):
     R = 6371000.0
@@ -40,50 +39,19 @@ CATEGORIES = [
     "policy","protest","weather","other"
 ]
 
-def row_to_risk01(row) -> float:
-    # DB already 0..1
-    vals = [float(row[c]) for c in CATEGORIES]
-    return clamp01(max(vals) if vals else 0.0)
-
-def risk_at_point(lat: float, lng: float) -> float:
+def risk_at_point(lat: float, lng: float, snap=None, scores=None) -> float:
     """
     Nearest-neighbour risk within SEARCH_RADIUS_M; else 0.
-    Uses a quick bbox filter, then haversine refine.
+    Uses the shared truth snapshot's KD-tree and time-decayed max risk.
     """
-    # rough deg window
-    pad_deg = SEARCH_RADIUS_M / 111_000.0
-    w, e = lng - pad_deg, lng + pad_deg
-    s, n = lat - pad_deg, lat + pad_deg
-
-    conn = sqlite3.connect(db.path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(
-        f"""
-        SELECT lat, long, {", ".join(CATEGORIES)}
-        FROM truth
-        WHERE long BETWEEN ? AND ?
-          AND lat BETWEEN ? AND ?
-        LIMIT ?
-        """,
-        (w, e, s, n, MAX_CANDIDATES),
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    best = None
-    best_d = 1e18
-    for r in rows:
-        d = haversine_m(lat, lng, float(r["lat"]), float(r["long"]))
-        if d < best_d:
-            best_d = d
-            best = r
-
-    if best is None or best_d > SEARCH_RADIUS_M:
+    snap = snap if snap is not None else get_snapshot()
+    scores = scores if scores is not None else snap.scores()
+    idx, best_d = snap.nearest(lat, lng, SEARCH_RADIUS_M)
+    if idx < 0:
         return 0.0
 
     # Optional: decay with distance so it’s smoother
-    base = row_to_risk01(best)
+    base = float(scores.max_risk[idx])
     decay = math.exp(-(best_d / (SEARCH_RADIUS_M * 0.6))**2)  # gaussian-ish
     return clamp01(base * decay)
 
@@ -121,6 +89,10 @@ def compute_route(request: RouteRequest):
 
     lam = max(0.0, min(1.0, float(request.lambda_val)))  # clamp 0..1
 
+    # One snapshot for the whole search so every edge sees the same truth
+    snap = get_snapshot()
+    scores = snap.scores()
+
     def weight(u, v, d):
         length_m = float(d.get("length", 1.0))
 
@@ -130,7 +102,7 @@ def compute_route(request: RouteRequest):
         mid_lng = (x1 + x2) * 0.5
         mid_lat = (y1 + y2) * 0.5
 
-        risk01 = risk_at_point(mid_lat, mid_lng)  # 0..1
+        risk01 = risk_at_point(mid_lat, mid_lng, snap, scores)  # 0..1
 
         # normalize length to ~O(1)
         length_norm = length_m / max(LENGTH_SCALE, 1e-6)
@@ -1,68 +1,60 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from static_analysis_pipeline.criticality_analysis_agent  import CriticalityAgent
-from db.db_writer import DBWriter
-import math
+from typing import Optional
+from db.async_db import get_async_db
+from post_worker import QUEUE_MAX, get_post_workers
 
 router = APIRouter()
-agent = CriticalityAgent()
-db = DBWriter()
+adb = get_async_db()
+workers = get_post_workers()
 
 class CreatePostRequest(BaseModel):
     lat: float
     lng: float
     content: str
-    severity: float = 1.0
 
-def haversine(lat1, lng1, lat2, lng2):
-    R = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lng2 - lng1)
+@router.post("/post", status_code=202)
+async def create_post(data: CreatePostRequest):
+    # Classification happens in the background (post_worker.py); the post
+    # shows up in the feed right away with status "pending" and severity 0.
+    if await workers.queue_depth() >= QUEUE_MAX:
+        raise HTTPException(status_code=503, detail="post queue full", headers={"Retry-After": "5"})
 
-    a = math.sin(dphi/2)**2 + \
-        math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
-@router.post("/post")
-def create_post(data: CreatePostRequest):
-    out = agent.assess(data.content)
-
-    db.insert_post(
+    out = await workers.submit(
         lat=data.lat,
         long=data.lng,
-        severity=out.final_severity,
-        category=out.category,
         content=data.content,   # ← unchanged
-        human=True,
     )
 
-    return {"status": "created"}
+    return {"status": "pending", "id": out["id"]}
 
 
 @router.get("/feed")
-def get_feed(lat: float, lng: float, radius: float = 500):
-    posts = db.get_feed(lat=lat, lng=lng, radius=radius)
-
-    nearby = []
-
-    for post in posts:
-        distance = haversine(lat, lng, post["lat"], post["lng"])
-
-        if distance <= radius:
-            nearby.append({
-                "id": post["id"],
-                "content": post["content"],
-                "severity": post["severity"],
-                "distance": distance,
-                "timestamp": post["timestamp"],
-                "lat": post["lat"],
-                "lng": post["lng"],
-            })
-
-    nearby.sort(key=lambda x: x["timestamp"], reverse=True)
+async def get_feed(
+    lat: float,
+    lng: float,
+    radius: float = 500,
+    limit: int = 500,
+    before: Optional[str] = None,
+    before_id: Optional[str] = None,
+):
+    # Radius filtering, distance and newest-first ordering all happen in the DB.
+    # For the next page pass the last post's timestamp/id as before/before_id.
+    posts = await adb.get_feed(
+        lat=lat, lng=lng, radius=radius,
+        limit=limit, before=before, before_id=before_id,
+    )
 
-    return nearby
+    return [
+        {
+            "id": post["id"],
+            "content": post["content"],
+            "severity": post["severity"],
+            "status": post["status"],
+            "distance": post["distance"],
+            "timestamp": post["timestamp"],
+            "lat": post["lat"],
+            "lng": post["lng"],
+        }
+        for post in posts
+    ]
@@ -1,8 +1,10 @@
-from typing import Literal
-from pydantic import BaseModel, Field
-from anthropic import Anthropic
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError
 import os
 
+from db.classification_cache import ClassificationCache
+from live_pipeline.clients import anthropic_client
+
 Category = Literal[
     "crime",
     "public_safety",
@@ -18,14 +20,28 @@ class CriticalityOutput(BaseModel):
     final_severity: float = Field(ge=0.0, le=1.0)
     category: Category
 
-class CriticalityAgent:
-    def __init__(self, model: str = "claude-opus-4-6"):
-        api_key = ""
-        if not api_key:
-            raise RuntimeError("ANTHROPIC_API_KEY not set")
+class CriticalityBatchItem(CriticalityOutput):
+    index: int = Field(ge=0)
+
+class CriticalityBatchOutput(BaseModel):
+    results: List[CriticalityBatchItem]
+
+# Reports per request in assess_batch
+DEFAULT_BATCH_SIZE = 10
+
+SYSTEM = (
+    "You classify short human incident reports. "
+    "Severity is impact-if-true from 0 (negligible) to 1 (critical). "
+    "Return only structured tool output."
+)
 
-        self.client = Anthropic(api_key=api_key)
+class CriticalityAgent:
+    def __init__(self, model: str = "claude-opus-4-6", use_cache: bool = True, client=None):
+        # Anything with messages.create, e.g. clients.FakeAnthropic offline
+        self.client = client or anthropic_client()
         self.model = model
+        # Identical (normalized) reports are only classified once per model
+        self.cache = ClassificationCache("human_report") if use_cache else None
 
         self.tool_name = "emit_criticality"
         self.tool_schema = {
@@ -34,13 +50,33 @@ class CriticalityAgent:
             "input_schema": CriticalityOutput.model_json_schema(),
         }
 
+        self.batch_tool_name = "emit_criticality_batch"
+        self.batch_tool_schema = {
+            "name": self.batch_tool_name,
+            "description": "Classify several numbered reports; one result per report, keyed by its index.",
+            "input_schema": CriticalityBatchOutput.model_json_schema(),
+        }
+
+    def _tool_input(self, resp, tool_name: str) -> Dict[str, Any]:
+        tool_calls = [
+            c for c in resp.content
+            if getattr(c, "type", None) == "tool_use"
+            and getattr(c, "name", None) == tool_name
+        ]
+
+        if not tool_calls:
+            raise RuntimeError("Claude did not return structured output")
+
+        return tool_calls[0].input
+
     def assess(self, content: str) -> CriticalityOutput:
-        system = (
-            "You classify short human incident reports. "
-            "Severity is impact-if-true from 0 (negligible) to 1 (critical). "
-            "Return only structured tool output."
-        )
+        if self.cache is not None:
+            cached = self.cache.get(self.model, content, CriticalityOutput)
+            if cached is not None:
+                return cached
+        return self._assess_one(content)
 
+    def _assess_one(self, content: str) -> CriticalityOutput:
         user = f"""
 Report:
 {content}
@@ -52,7 +88,7 @@ Return:
 
         resp = self.client.messages.create(
             model=self.model,
-            system=system,
+            system=SYSTEM,
             max_tokens=200,
             temperature=0.1,
             messages=[{"role": "user", "content": user}],
@@ -60,14 +96,85 @@ Return:
             tool_choice={"type": "tool", "name": self.tool_name},
         )
 
-        tool_calls = [
-            c for c in resp.content
-            if getattr(c, "type", None) == "tool_use"
-            and getattr(c, "name", None) == self.tool_name
-        ]
+        out = CriticalityOutput.model_validate(self._tool_input(resp, self.tool_name))
+        if self.cache is not None:
+            self.cache.put(self.model, content, out)
+        return out
 
-        if not tool_calls:
-            raise RuntimeError("Claude did not return structured output")
+    def _assess_chunk(self, contents: List[str]) -> List[Optional[CriticalityOutput]]:
+        """
+        One request for all of `contents`. Entries the model left out or got
+        wrong come back as None.
+        """
+        reports = "\n\n".join(f"[{i}]\n{c}" for i, c in enumerate(contents))
+        user = f"""
+Reports ({len(contents)}):
+
+{reports}
+
+Return one result per report in `results`, each with:
+- index (the report's number in brackets)
+- final_severity (0-1)
+- category (enum)
+"""
+
+        resp = self.client.messages.create(
+            model=self.model,
+            system=SYSTEM,
+            max_tokens=100 + 60 * len(contents),
+            temperature=0.1,
+            messages=[{"role": "user", "content": user}],
+            tools=[self.batch_tool_schema],
+            tool_choice={"type": "tool", "name": self.batch_tool_name},
+        )
+
+        outs: List[Optional[CriticalityOutput]] = [None] * len(contents)
+        results = self._tool_input(resp, self.batch_tool_name).get("results") or []
+        for r in results:
+            try:
+                item = CriticalityBatchItem.model_validate(r)
+            except ValidationError:
+                continue
+            if item.index < len(contents) and outs[item.index] is None:
+                outs[item.index] = CriticalityOutput(
+                    final_severity=item.final_severity, category=item.category,
+                )
+        return outs
+
+    def assess_batch(self, contents: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> List[Optional[CriticalityOutput]]:
+        """
+        Same results as [assess(c) for c in contents], in order, but cache
+        misses are sent batch_size at a time in one request each. Items a
+        batch fails to classify are retried one by one; those that fail again
+        come back as None.
+        """
+        outs: List[Optional[CriticalityOutput]] = [None] * len(contents)
+
+        todo = []
+        for i, content in enumerate(contents):
+            cached = self.cache.get(self.model, content, CriticalityOutput) if self.cache is not None else None
+            if cached is not None:
+                outs[i] = cached
+            else:
+                todo.append(i)
+
+        for start in range(0, len(todo), batch_size):
+            idx = todo[start:start + batch_size]
+            try:
+                chunk = self._assess_chunk([contents[i] for i in idx])
+            except Exception as e:
+                print(f"[criticality] batch of {len(idx)} failed, falling back to single calls: {e}")
+                chunk = [None] * len(idx)
 
-        return CriticalityOutput.model_validate(tool_calls[0].input)
+            for i, out in zip(idx, chunk):
+                if out is None:
+                    try:
+                        outs[i] = self._assess_one(contents[i])
+                    except Exception as e:
+                        print(f"[criticality] item {i} failed: {e}")
+                    continue
+                outs[i] = out
+                if self.cache is not None:
+                    self.cache.put(self.model, contents[i], out)
 
+        return outs
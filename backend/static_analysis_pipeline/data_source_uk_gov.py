@@ -1,49 +1,76 @@
 # data_source_police_api.py
+"""
+Ground-truth crime from the UK Police street-level crime API.
+
+By default only the observer's "crime" jobs are queried. In sweep mode a
+bounding box is tiled with overlapping query circles instead (each
+all-crime call covers a 1 mile radius), crimes seen by several circles are
+deduped by id, and each crime counts towards its nearest centre only.
+
+Raw responses go through db/police_cache.py, so re-runs and backfills of a
+month that was fetched before never hit the network; pass `month` to skip
+the latest-month lookup as well.
+
+Scoring turns each cell's crimes into truth risk:
+  llm     a text report per cell, classified by CriticalityAgent and blended
+          with a count-based intensity
+  vector  category risks computed directly from the records (crime_scoring.py),
+          no model calls
+  hybrid  vector, plus the model for the few anomalous cells only
+
+Config:
+  STREETSENSE_POLICE_SWEEP    "1" = sweep the bbox instead of the crime jobs
+  STREETSENSE_POLICE_BBOX     min_lat,min_lng,max_lat,max_lng (default Greater London)
+  STREETSENSE_POLICE_SCORING  llm | vector | hybrid (default llm)
+"""
 import asyncio
 import math
+import os
 from collections import Counter
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import aiohttp
+import numpy as np
 
 from live_pipeline.observer_agent import ObserverAgent
-from live_pipeline.criticality_agent import CriticalityAgent
-from db.db_writer import DBWriter
+from static_analysis_pipeline.criticality_analysis_agent import CriticalityAgent, CriticalityOutput
+from static_analysis_pipeline.crime_scoring import SCORE_CATEGORIES, anomalous_cells, score_cells
+from db.police_cache import PoliceCache
+from db.storage import open_storage
+from utils import TokenBucket
 
 
 POLICE_API_BASE = "https://data.police.uk/api"
 
-class TokenBucket:
-    def __init__(self, rate_per_sec: float, capacity: int):
-        self.rate = rate_per_sec
-        self.capacity = capacity
-        self.tokens = float(capacity)
-        self.updated = asyncio.get_event_loop().time()
-        self._lock = asyncio.Lock()
+SWEEP = os.getenv("STREETSENSE_POLICE_SWEEP", "0") == "1"
+SWEEP_BBOX = tuple(float(x) for x in os.getenv("STREETSENSE_POLICE_BBOX", "51.28,-0.51,51.70,0.33").split(","))
+SCORING = os.getenv("STREETSENSE_POLICE_SCORING", "llm")
 
-    async def acquire(self, amount: float = 1.0) -> None:
-        async with self._lock:
-            while True:
-                now = asyncio.get_event_loop().time()
-                elapsed = now - self.updated
-                self.updated = now
+# Most anomalous cells per run that get a report (and, in hybrid, a model call)
+MAX_LLM_CELLS = 25
 
-                # refill
-                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+# Radius the all-crime endpoint covers around lat/lng (1 mile)
+POLICE_RADIUS_KM = 1.609
 
-                if self.tokens >= amount:
-                    self.tokens -= amount
-                    return
+# Sweep centres are this much closer than full coverage strictly needs
+SWEEP_OVERLAP = 0.1
+
+# The API answers 503 when an area has over 10k crimes; such a circle is
+# re-queried as quadrant polygons, split at most this many times
+MAX_SPLIT_DEPTH = 3
+
+# Retries per sweep point for rate limits and transient errors
+FETCH_RETRIES = 3
+
+KM_PER_DEG_LAT = 111.32
 
-                needed = amount - self.tokens
-                wait_s = needed / self.rate if self.rate > 0 else 0.1
-                await asyncio.sleep(max(0.01, wait_s))
 
 @dataclass
 class PoliceAPIClient:
     session: aiohttp.ClientSession
     limiter: TokenBucket
+    cache: Optional[PoliceCache] = None
 
     async def _get_json(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
         await self.limiter.acquire(1.0)
@@ -74,9 +101,178 @@ class PoliceAPIClient:
             raise RuntimeError("Could not parse latest YYYY-MM date from crimes-street-dates")
         return date
 
+    async def _crimes_in_poly(self, poly: List[Tuple[float, float]], date_yyyymm: str, depth: int) -> List[Dict[str, Any]]:
+        params = {"poly": ":".join(f"{a:.5f},{b:.5f}" for a, b in poly), "date": date_yyyymm}
+        try:
+            return await self._get_json("/crimes-street/all-crime", params=params)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 503 or depth >= MAX_SPLIT_DEPTH:
+                raise
+        (lat0, lng0), (lat1, lng1) = poly[0], poly[2]
+        crimes: List[Dict[str, Any]] = []
+        for q in _quadrants(lat0, lng0, lat1, lng1):
+            crimes.extend(await self._crimes_in_poly(q, date_yyyymm, depth + 1))
+        return crimes
+
     async def crimes_all(self, *, lat: float, lng: float, date_yyyymm: str) -> List[Dict[str, Any]]:
+        """
+        Street crimes within 1 mile of lat/lng, from the cache if this point
+        and month were fetched before.
+        """
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, lat, lng, date_yyyymm)
+            if cached is not None:
+                return cached
+
         params = {"lat": lat, "lng": lng, "date": date_yyyymm}
-        return await self._get_json("/crimes-street/all-crime", params=params)
+        try:
+            crimes = await self._get_json("/crimes-street/all-crime", params=params)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 503:
+                raise
+            # too many crimes for one call: cover the circle's bounding square in parts
+            dlat = POLICE_RADIUS_KM / KM_PER_DEG_LAT
+            dlng = dlat / math.cos(math.radians(lat))
+            parts: List[Dict[str, Any]] = []
+            for q in _quadrants(lat - dlat, lng - dlng, lat + dlat, lng + dlng):
+                parts.extend(await self._crimes_in_poly(q, date_yyyymm, 1))
+            crimes = [c for c in _dedupe(parts).values() if _within(c, lat, lng, POLICE_RADIUS_KM)]
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, lat, lng, date_yyyymm, crimes)
+        return crimes
+
+
+def _quadrants(lat0: float, lng0: float, lat1: float, lng1: float) -> List[List[Tuple[float, float]]]:
+    # four rectangles (as closed-order corner lists) splitting the box
+    mlat, mlng = (lat0 + lat1) / 2, (lng0 + lng1) / 2
+    return [
+        [(a, b), (a, d), (c, d), (c, b)]
+        for a, c in ((lat0, mlat), (mlat, lat1))
+        for b, d in ((lng0, mlng), (mlng, lng1))
+    ]
+
+
+def _crime_latlng(crime: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    loc = crime.get("location") or {}
+    try:
+        return float(loc["latitude"]), float(loc["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _within(crime: Dict[str, Any], lat: float, lng: float, radius_km: float) -> bool:
+    p = _crime_latlng(crime)
+    if p is None:
+        return False
+    x = math.radians(p[1] - lng) * math.cos(math.radians(lat))
+    y = math.radians(p[0] - lat)
+    return 6371.0 * math.hypot(x, y) <= radius_km
+
+
+def _crime_id(crime: Dict[str, Any]) -> str:
+    if crime.get("id") is not None:
+        return str(crime["id"])
+    if crime.get("persistent_id"):
+        return crime["persistent_id"]
+    p = _crime_latlng(crime)
+    return f"{crime.get('category')}|{crime.get('month')}|{p}"
+
+
+def _dedupe(crimes: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for c in crimes:
+        out.setdefault(_crime_id(c), c)
+    return out
+
+
+def sweep_centres(
+    bbox: Tuple[float, float, float, float],
+    radius_km: float = POLICE_RADIUS_KM,
+    overlap: float = SWEEP_OVERLAP,
+) -> List[Tuple[float, float]]:
+    """
+    Centres of a hexagonal grid whose radius_km circles cover bbox
+    (min_lat, min_lng, max_lat, max_lng). Rows are 1.5 r apart and centres
+    sqrt(3) r apart within a row, offset by half on alternate rows, with r
+    shrunk by `overlap` as a margin.
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    r = radius_km * (1.0 - overlap)
+    dlat = 1.5 * r / KM_PER_DEG_LAT
+
+    centres = []
+    n_rows = math.ceil((max_lat - min_lat) / dlat) + 1
+    for i in range(n_rows):
+        lat = min_lat + i * dlat
+        dlng = math.sqrt(3) * r / (KM_PER_DEG_LAT * math.cos(math.radians(lat)))
+        start = min_lng - (dlng / 2 if i % 2 else 0.0)
+        n_cols = math.ceil((max_lng - start) / dlng) + 1
+        centres.extend((round(lat, 5), round(start + j * dlng, 5)) for j in range(n_cols))
+    return centres
+
+
+def assign_to_centres(crimes: List[Dict[str, Any]], centres: List[Tuple[float, float]]) -> List[List[Dict[str, Any]]]:
+    """
+    Crimes grouped by nearest centre (one list per centre, same order), so
+    overlapping circles don't count a crime twice.
+    """
+    groups: List[List[Dict[str, Any]]] = [[] for _ in centres]
+    located = [(c, p) for c in crimes if (p := _crime_latlng(c)) is not None]
+    if not located or not centres:
+        return groups
+
+    c_arr = np.array(centres, dtype=np.float64)
+    scale = math.cos(math.radians(float(c_arr[:, 0].mean())))
+    c_xy = np.column_stack([c_arr[:, 1] * scale, c_arr[:, 0]])
+
+    pts = np.array([p for _, p in located], dtype=np.float64)
+    p_xy = np.column_stack([pts[:, 1] * scale, pts[:, 0]])
+
+    # chunked so the distance matrix stays small
+    nearest = np.empty(len(p_xy), dtype=np.int64)
+    for start in range(0, len(p_xy), 4096):
+        d = ((p_xy[start:start + 4096, None, :] - c_xy[None, :, :]) ** 2).sum(axis=2)
+        nearest[start:start + 4096] = d.argmin(axis=1)
+
+    for (crime, _), i in zip(located, nearest):
+        groups[i].append(crime)
+    return groups
+
+
+async def sweep_crimes(
+    api: PoliceAPIClient,
+    centres: List[Tuple[float, float]],
+    month: str,
+    max_concurrency: int = 6,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Queries every centre (cached ones are free) and returns the crimes
+    deduped by id across the overlapping circles.
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+    failed = 0
+
+    async def fetch(lat: float, lng: float) -> List[Dict[str, Any]]:
+        nonlocal failed
+        async with sem:
+            for attempt in range(FETCH_RETRIES + 1):
+                try:
+                    return await api.crimes_all(lat=lat, lng=lng, date_yyyymm=month)
+                except Exception as e:
+                    if attempt == FETCH_RETRIES:
+                        print(f"Police API sweep point ({lat:.5f},{lng:.5f}) failed: {e}")
+                        failed += 1
+                        return []
+                    await asyncio.sleep(2.0 * (2 ** attempt))
+        return []
+
+    results = await asyncio.gather(*(fetch(lat, lng) for lat, lng in centres))
+    raw = sum(len(r) for r in results)
+    crimes = _dedupe(c for r in results for c in r)
+    print(f"[crime] sweep {month}: {len(centres)} points ({failed} failed), "
+          f"{raw} crimes returned, {len(crimes)} unique")
+    return crimes
 
 
 def _crime_summary_report(
@@ -129,69 +325,197 @@ async def main(
     model: str = "claude-opus-4-6",
     alpha: float = 0.25,
     max_concurrency: int = 6,
+    sweep: bool = SWEEP,
+    bbox: Tuple[float, float, float, float] = SWEEP_BBOX,
+    month: Optional[str] = None,
+    cache: Optional[PoliceCache] = None,
+    scoring: str = SCORING,
 ):
+    """
+    Scores police crime data into truth. With `sweep`, the whole bbox is
+    covered instead of just the crime jobs; `month` (YYYY-MM) backfills a past
+    month, and a month already in the cache needs no network at all.
+    `scoring` is "llm", "vector" or "hybrid" (see Config above).
+    """
+    if scoring not in ("llm", "vector", "hybrid"):
+        raise ValueError(f"Unknown police scoring mode: {scoring}")
+
     observer = ObserverAgent()
-    crit = CriticalityAgent(model=model)
-    db = DBWriter()
+    crit = CriticalityAgent(model=model) if scoring != "vector" else None
+    db = open_storage()
+    cache = cache or PoliceCache()
 
     limiter = TokenBucket(rate_per_sec=15.0, capacity=30)
 
     connector = aiohttp.TCPConnector(limit=50, ssl=False)
     async with aiohttp.ClientSession(connector=connector) as session:
-        api = PoliceAPIClient(session=session, limiter=limiter)
-
-        month = await api.latest_month()
-        print("Police API latest available month:", month)
-
-        jobs = observer.plan_all_queries()
-
-        crime_jobs = [j for j in jobs if j.get("category") == "crime"]
-        if not crime_jobs:
-            print("No 'crime' jobs found from observer.plan_all_queries().")
-            return
-
-        sem = asyncio.Semaphore(max_concurrency)
-
-        async def process_job(job: Dict[str, Any]) -> None:
-            async with sem:
-                loc = job["location"]
-                lat = float(loc.lat)
-                lng = float(loc.long)
+        api = PoliceAPIClient(session=session, limiter=limiter, cache=cache)
+
+        if month is None:
+            month = await api.latest_month()
+            print("Police API latest available month:", month)
+
+        # (lat, lng, crimes) per cell, each crime in exactly one cell
+        if sweep:
+            centres = sweep_centres(bbox)
+            crimes = list((await sweep_crimes(api, centres, month, max_concurrency)).values())
+            cells = [
+                (lat, lng, group)
+                for (lat, lng), group in zip(centres, assign_to_centres(crimes, centres))
+                if group
+            ]
+            r = POLICE_RADIUS_KM * (1.0 - SWEEP_OVERLAP)
+            cell_area_km2 = 1.5 * math.sqrt(3) * r * r   # one hex grid cell
+        else:
+            crime_jobs = [j for j in observer.plan_all_queries() if j.get("category") == "crime"]
+            if not crime_jobs:
+                print("No 'crime' jobs found from observer.plan_all_queries().")
+                return
+            cells = await _fetch_jobs(api, crime_jobs, month, max_concurrency)
+            crimes = list(_dedupe(c for _, _, group in cells for c in group).values())
+            cell_area_km2 = math.pi * POLICE_RADIUS_KM ** 2
+
+    if scoring == "llm":
+        fetched = []
+        for lat, lng, group in cells:
+            report, intensity = _crime_summary_report(lat=lat, lng=lng, month=month, crimes=group)
+            fetched.append((lat, lng, report, intensity, len(group)))
+        await _score_and_write(fetched, crit=crit, observer=observer, db=db, alpha=alpha)
+    else:
+        _score_vectorized(
+            cells, crimes, cell_area_km2, month=month, crit=crit, observer=observer, db=db, alpha=alpha,
+        )
 
-                try:
-                    crimes = await api.crimes_all(lat=lat, lng=lng, date_yyyymm=month)
-                except Exception as e:
-                    print("Police API fetch failed:", job.get("query"), e)
-                    return
+    print("Police cache:", cache.stats())
+    if crit is not None and crit.cache is not None:
+        print("Classification cache:", crit.cache.stats())
 
-                report, intensity = _crime_summary_report(lat=lat, lng=lng, month=month, crimes=crimes)
 
-                out = crit.assess(report)
+async def _fetch_jobs(
+    api: PoliceAPIClient,
+    jobs: List[Dict[str, Any]],
+    month: str,
+    max_concurrency: int,
+) -> List[Tuple[float, float, List[Dict[str, Any]]]]:
+    sem = asyncio.Semaphore(max_concurrency)
 
-                risk = float(out.final_severity)
-                risk = max(0.0, min(1.0, 0.65 * risk + 0.35 * intensity))
+    async def fetch_job(job: Dict[str, Any]) -> Optional[Tuple[float, float, List[Dict[str, Any]]]]:
+        async with sem:
+            loc = job["location"]
+            lat = float(loc.lat)
+            lng = float(loc.long)
 
-                db.update_truth(
-                    lat=lat,
-                    long=lng,
-                    category="crime",   
-                    severity=risk,
-                    alpha=alpha,
-                )
+            try:
+                crimes = await api.crimes_all(lat=lat, lng=lng, date_yyyymm=month)
+            except Exception as e:
+                print("Police API fetch failed:", job.get("query"), e)
+                return None
+            return lat, lng, crimes
 
-                if observer.should_write(out):
-                    db.insert_post(
-                        lat=lat,
-                        long=lng,
-                        severity=risk,
-                        category="crime",
-                        content=report,
-                        human=False,
-                    )
+    return [r for r in await asyncio.gather(*(fetch_job(j) for j in jobs)) if r is not None]
 
-                print(f"[crime] wrote truth/post at ({lat:.4f},{lng:.4f}) risk={risk:.2f} crimes={len(crimes)}")
 
-        await asyncio.gather(*(process_job(j) for j in crime_jobs))
+def _score_vectorized(
+    cells: List[Tuple[float, float, List[Dict[str, Any]]]],
+    crimes: List[Dict[str, Any]],
+    cell_area_km2: float,
+    *,
+    month: str,
+    crit: Optional[CriticalityAgent],
+    observer: ObserverAgent,
+    db,
+    alpha: float,
+) -> None:
+    """
+    Category risks straight from the crime records (crime_scoring.py). Only
+    anomalous cells get a report; with `crit` those reports are also
+    classified and the model severity is blended into their crime risk.
+    """
+    scores = score_cells(crimes, [(lat, lng) for lat, lng, _ in cells], cell_area_km2)
+    flagged = anomalous_cells(scores, limit=MAX_LLM_CELLS)
+
+    reports = {
+        i: _crime_summary_report(lat=cells[i][0], lng=cells[i][1], month=month, crimes=cells[i][2])[0]
+        for i in flagged
+    }
+    outs: Dict[int, CriticalityOutput] = {}
+    if crit is not None and flagged:
+        outs = {
+            i: out for i, out in zip(flagged, crit.assess_batch([reports[i] for i in flagged]))
+            if out is not None
+        }
+
+    truth_updates: List[Tuple[float, float, str, float, float]] = []
+    posts: List[Dict[str, Any]] = []
+    for i, (lat, lng, group) in enumerate(cells):
+        risks = dict(zip(SCORE_CATEGORIES, scores["risk"][i].tolist()))
+        if i in outs:
+            risks["crime"] = max(0.0, min(1.0, 0.65 * float(outs[i].final_severity) + 0.35 * risks["crime"]))
+
+        for category, risk in risks.items():
+            truth_updates.append((lat, lng, category, risk, alpha))
+
+        if i in reports:
+            top = max(risks, key=risks.get)
+            out = outs.get(i) or CriticalityOutput(final_severity=risks[top], category=top)
+            if observer.should_write(out):
+                posts.append({
+                    "lat": lat,
+                    "long": lng,
+                    "severity": risks[top],
+                    "category": top,
+                    "content": reports[i],
+                    "human": False,
+                })
+            print(f"[crime] anomalous ({lat:.4f},{lng:.4f}) z={scores['z'][i]:.1f} "
+                  f"risk={risks[top]:.2f} crimes={len(group)}")
+
+    db.bulk_update_truth_ema(truth_updates, source="police_api")
+    db.bulk_insert_posts(posts)
+    print(f"[crime] scored {len(cells)} cells ({len(flagged)} anomalous, {len(outs)} classified by the model), "
+          f"wrote truth={len(truth_updates)} posts={len(posts)}")
+
+
+async def _score_and_write(
+    fetched: List[Tuple[float, float, str, float, int]],
+    *,
+    crit: CriticalityAgent,
+    observer: ObserverAgent,
+    db,
+    alpha: float,
+) -> None:
+    truth_updates: List[Tuple[float, float, str, float, float]] = []
+    posts: List[Dict[str, Any]] = []
+
+    # All reports are classified together, several per model request
+    outs = crit.assess_batch([report for _, _, report, _, _ in fetched])
+
+    for (lat, lng, report, intensity, n_crimes), out in zip(fetched, outs):
+        if out is None:
+            # the model failed on this report; the other cells are still written
+            print(f"[crime] skipped ({lat:.4f},{lng:.4f}): not classified")
+            continue
+        risk = float(out.final_severity)
+        risk = max(0.0, min(1.0, 0.65 * risk + 0.35 * intensity))
+
+        truth_updates.append((lat, lng, "crime", risk, alpha))
+
+        if observer.should_write(out):
+            posts.append({
+                "lat": lat,
+                "long": lng,
+                "severity": risk,
+                "category": "crime",
+                "content": report,
+                "human": False,
+            })
+
+        print(f"[crime] scored ({lat:.4f},{lng:.4f}) risk={risk:.2f} crimes={n_crimes}")
+
+    # All cells land in one write transaction
+    db.bulk_update_truth_ema(truth_updates, source="police_api")
+    db.bulk_insert_posts(posts)
+    print(f"[crime] wrote truth={len(truth_updates)} posts={len(posts)}")
 
 
 if __name__ == "__main__":
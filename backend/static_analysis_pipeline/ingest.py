@@ -0,0 +1,463 @@
+"""
+Shared ingestion for the static (mock dump) data sources.
+
+A source only supplies a SourceAdapter describing its records; ingest() does
+the rest as a chain of stages joined by bounded queues:
+
+  read -> dedupe -> validate -> classify -> write
+
+Records are parsed incrementally from JSON arrays or JSONL (optionally
+gzipped) and move through the stages in batches of `batch_size`. At most
+STAGE_QUEUE_SIZE batches wait between two stages, so memory stays flat no
+matter how large the dump is.
+
+Dedupe and resume go through db/run_state.py: each batch's ids are claimed
+from the run state, which drops duplicates and items a previous attempt
+already finished and tells the next stages where a half-done item stopped.
+Writes carry idempotency keys. Per-stage throughput is printed every
+REPORT_EVERY batches and at the end.
+
+Config:
+  STREETSENSE_INGEST_ATTEMPTS  attempts at an input before its failing items are dropped (default 3)
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from live_pipeline.validator_agent import ValidationResult, ValidatorAgent
+from live_pipeline.observer_agent import ObserverAgent
+from live_pipeline.criticality_agent import CriticalityAgent, CriticalityOutput
+from live_pipeline.gazetteer import get_gazetteer
+from db.storage import open_storage
+from db.run_state import RunState, SKIPPED
+from utils import StageStats
+
+INGEST_ATTEMPTS = int(os.getenv("STREETSENSE_INGEST_ATTEMPTS", "3"))
+
+# Max batches waiting between two stages before the earlier stage blocks
+STAGE_QUEUE_SIZE = 4
+
+# Characters read per step while streaming a JSON array
+READ_CHUNK_CHARS = 1 << 20
+
+# Print stage throughput every this many batches
+REPORT_EVERY = 20
+
+_DONE = object()
+
+
+# -----------------------------
+# Streaming readers
+# -----------------------------
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _iter_json_array(f, buf: str) -> Iterator[Dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    pos = buf.index("[") + 1
+    eof = False
+
+    while True:
+        # skip separators
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos = f.read(READ_CHUNK_CHARS), 0
+            eof = not buf
+
+        if pos >= len(buf):
+            raise ValueError("Unterminated top-level JSON array")
+        if buf[pos] == "]":
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+            # a value ending exactly at the buffer edge may continue (numbers)
+            complete = end < len(buf) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+
+        if not complete:
+            more = f.read(READ_CHUNK_CHARS)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+
+        yield obj
+        pos = end
+        if pos > READ_CHUNK_CHARS:
+            buf, pos = buf[pos:], 0
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the records of a top-level JSON array or a JSONL file (".gz" is
+    decompressed on the fly) without loading the whole file.
+    """
+    with _open_text(path) as f:
+        head = f.read(READ_CHUNK_CHARS)
+        stripped = head.lstrip()
+        if not stripped:
+            return
+
+        if stripped.startswith("["):
+            yield from _iter_json_array(f, head)
+            return
+
+        if not stripped.startswith("{"):
+            raise ValueError("Expected a top-level JSON array or JSONL objects")
+
+        pending = head
+        while True:
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            more = f.read(READ_CHUNK_CHARS)
+            if not more:
+                break
+            pending += more
+        if pending.strip():
+            yield json.loads(pending)
+
+
+# -----------------------------
+# Source adapters
+# -----------------------------
+
+class SourceAdapter:
+    """
+    Maps one source's records onto validator items. `name` is also the
+    truth_events source label; override the accessors for other layouts.
+    """
+
+    name = "unknown"
+    label = "records"
+
+    def stable_id(self, record: Dict[str, Any]) -> str:
+        """
+        For dedupe: prefer record['id'], otherwise hash text+created_at.
+        """
+        rid = record.get("id")
+        if rid is not None:
+            return str(rid)
+
+        text = self.text(record)
+        created_at = str(record.get("created_at", ""))
+        return hashlib.sha1(f"{text}|{created_at}".encode("utf-8")).hexdigest()
+
+    def text(self, record: Dict[str, Any]) -> str:
+        return str(record.get("text", ""))
+
+    def location_name(self, record: Dict[str, Any]) -> Optional[str]:
+        loc = record.get("location")
+        return loc if isinstance(loc, str) and loc else None
+
+    def attach_geo(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ensure record has lat/long. If not present, infer from the location
+        name (exact or fuzzy gazetteer match) or from a place named in the text.
+        """
+        if "lat" in record and "long" in record:
+            return record
+
+        gaz = get_gazetteer()
+        loc = self.location_name(record)
+        place = gaz.resolve(loc) if loc else None
+        if place is None:
+            place = gaz.find_in_text(self.text(record))
+
+        if place is not None:
+            record["lat"] = place.lat
+            record["long"] = place.long
+        else:
+            # last resort default; you can also choose to skip instead
+            record["lat"] = record.get("lat", 0.0)
+            record["long"] = record.get("long", 0.0)
+        return record
+
+    def to_item(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validator expects 'items' similar to the bing pipeline: a minimal
+        dict with a 'url' for dedupe.
+        """
+        rid = self.stable_id(record)
+        return {
+            "url": record.get("url") or f"mock://{self.name}/{rid}",
+            "content": self.text(record),
+            "title": None,
+            "snippet": self.text(record),
+            "source": f"{self.name}_mock",
+            "created_at": record.get("created_at"),
+            "location_hint": self.location_name(record),
+            "lat": record.get("lat"),
+            "long": record.get("long"),
+            "_raw": record,
+        }
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+
+@dataclass
+class _Entry:
+    key: str
+    item: Dict[str, Any]
+    stage: str
+    validation: Optional[ValidationResult] = None
+    out: Optional[CriticalityOutput] = None
+
+
+def _unvalidated(item: Dict[str, Any]) -> ValidationResult:
+    # stand-in for use_validator=False, so classification sees the same shape
+    content = str(item.get("content") or "")
+    return ValidationResult(
+        title=content[:80],
+        source_url=item["url"],
+        cleaned_content=content,
+        summary=content,
+        plausibility=0.5,
+        severity_hint=0.0,
+        flags=["unverifiable"],
+        evidence=[],
+    )
+
+
+def _report(source: str, stats: Dict[str, StageStats], wall_s: float) -> None:
+    parts = []
+    for s in stats.values():
+        rate = f"{s.items / s.busy_s:.0f}/s" if s.busy_s > 0 else "-"
+        parts.append(f"{s.name} {s.items} ({rate}, q<={s.max_queue})")
+    print(f"[ingest:{source}] {wall_s:.0f}s | " + " | ".join(parts))
+
+
+async def ingest(
+    path: str,
+    adapter: SourceAdapter,
+    *,
+    model: str = "claude-opus-4-6",
+    alpha: float = 0.25,
+    rate_limit_s: float = 0.0,
+    use_validator: bool = True,
+    batch_size: int = 100,
+    resume: bool = True,
+    validator: Optional[ValidatorAgent] = None,
+    observer: Optional[ObserverAgent] = None,
+    crit: Optional[CriticalityAgent] = None,
+    db=None,
+    run: Optional[RunState] = None,
+    timings: Optional[Dict[str, StageStats]] = None,
+) -> Dict[str, Any]:
+    """
+    Streams `path` through dedupe -> validate -> classify -> write and
+    returns per-stage stats. Agents, storage and run state are created from
+    the defaults unless passed in; stage stats are also recorded into
+    `timings` if given.
+    """
+    validator = validator or ValidatorAgent()
+    observer = observer or ObserverAgent()
+    crit = crit or CriticalityAgent(model=model)
+    db = db or open_storage()
+    run = run or RunState(adapter.name, input_id=str(Path(path).resolve()), resume=resume)
+
+    names = ["read", "dedupe", "validate", "classify", "write"]
+    stats = timings if timings is not None else {}
+    for n in names:
+        stats.setdefault(n, StageStats(n))
+    queues = {n: asyncio.Queue(maxsize=STAGE_QUEUE_SIZE) for n in names[1:]}
+    totals = {"truth": 0, "posts": 0}
+    t_start = time.monotonic()
+
+    async def put(stage: str, batch: Any) -> None:
+        q = queues[stage]
+        await q.put(batch)
+        stats[stage].queued(q.qsize())
+
+    def read_batch(records: Iterator[Dict[str, Any]]) -> List[_Entry]:
+        out = []
+        for r in islice(records, batch_size):
+            r = adapter.attach_geo(r)
+            out.append(_Entry(key=adapter.stable_id(r), item=adapter.to_item(r), stage="scraped"))
+        return out
+
+    async def read_stage() -> None:
+        records = iter_records(str(path))
+        while True:
+            t0 = time.monotonic()
+            batch = await asyncio.to_thread(read_batch, records)
+            if not batch:
+                break
+            stats["read"].add(len(batch), time.monotonic() - t0)
+            await put("dedupe", batch)
+        await put("dedupe", _DONE)
+
+    async def dedupe_stage() -> None:
+        while (batch := await queues["dedupe"].get()) is not _DONE:
+            t0 = time.monotonic()
+            claimed = await asyncio.to_thread(run.claim, [e.key for e in batch])
+
+            keep, empty = [], []
+            for e in batch:
+                if e.key not in claimed:
+                    continue
+                e.stage, payload = claimed.pop(e.key)
+                if e.stage == "classified" and payload is not None:
+                    e.out = CriticalityOutput.model_validate(payload)
+                elif e.stage == "validated" and payload is not None:
+                    e.validation = ValidationResult.model_validate(payload["validation"])
+                elif e.stage == "validated":
+                    e.stage = "scraped"
+                if not str(e.item.get("content") or "").strip():
+                    empty.append((e.key, SKIPPED, None))
+                    continue
+                keep.append(e)
+            await asyncio.to_thread(run.mark, empty)
+
+            stats["dedupe"].add(len(batch), time.monotonic() - t0)
+            if keep:
+                await put("validate", keep)
+        await put("validate", _DONE)
+
+    async def validate_stage() -> None:
+        while (batch := await queues["validate"].get()) is not _DONE:
+            t0 = time.monotonic()
+            todo = [e for e in batch if e.stage == "scraped"]
+            if todo and use_validator:
+                results = await validator.validate_each([e.item for e in todo])
+                kept = {id(r) for r in observer.filter_validated([r for r in results if r is not None])}
+                # failed validations stay "scraped" and are retried on resume
+                for e, r in zip(todo, results):
+                    if r is not None:
+                        e.stage = "validated" if id(r) in kept else SKIPPED
+                        e.validation = r
+            else:
+                for e in todo:
+                    e.stage = "validated"
+                    e.validation = _unvalidated(e.item)
+            await asyncio.to_thread(run.mark, [
+                (e.key, e.stage, {"validation": e.validation.model_dump()} if e.stage == "validated" else None)
+                for e in todo if e.stage != "scraped"
+            ])
+
+            stats["validate"].add(len(todo), time.monotonic() - t0)
+            passed = [e for e in batch if e.stage in ("validated", "classified")]
+            if passed:
+                await put("classify", passed)
+        await put("classify", _DONE)
+
+    async def classify_stage() -> None:
+        while (batch := await queues["classify"].get()) is not _DONE:
+            t0 = time.monotonic()
+            todo = [e for e in batch if e.out is None]
+            if todo:
+                # blocking client, so off the event loop
+                try:
+                    outs = await asyncio.to_thread(crit.assess_batch, [e.validation for e in todo])
+                except Exception as e:
+                    print(f"[ingest:{adapter.name}] criticality failed for {len(todo)} items: {e}")
+                    outs = []
+                # items without an output stay "validated" and are retried on resume
+                for e, out in zip(todo, outs):
+                    if out is None:
+                        continue
+                    e.out = out
+                    e.stage = "classified"
+                await asyncio.to_thread(run.mark, [(e.key, "classified", e.out.model_dump()) for e in todo
+                                                   if e.out is not None])
+
+            stats["classify"].add(len(todo), time.monotonic() - t0)
+            ready = [e for e in batch if e.out is not None]
+            if ready:
+                await put("write", ready)
+
+            if todo and rate_limit_s > 0:
+                await asyncio.sleep(rate_limit_s)
+        await put("write", _DONE)
+
+    async def write_stage() -> None:
+        while (batch := await queues["write"].get()) is not _DONE:
+            t0 = time.monotonic()
+            truth_updates, truth_keys, posts, post_keys = [], [], [], []
+            for e in batch:
+                raw = e.item.get("_raw", {})
+                lat = float(e.item.get("lat") or raw.get("lat") or 0.0)
+                long = float(e.item.get("long") or raw.get("long") or 0.0)
+                out = e.out
+
+                truth_updates.append((lat, long, out.category, float(out.final_severity), alpha))
+                truth_keys.append(run.idempotency_key(e.key, "truth"))
+
+                if observer.should_write(out):
+                    posts.append({
+                        "lat": lat,
+                        "long": long,
+                        "severity": out.final_severity,
+                        "category": out.category,
+                        "content": e.item["content"],
+                        "human": False,
+                    })
+                    post_keys.append(run.idempotency_key(e.key, "post"))
+
+            try:
+                n_truth = await asyncio.to_thread(
+                    db.bulk_update_truth_ema, truth_updates, source=adapter.name, keys=truth_keys,
+                )
+                post_ids = await asyncio.to_thread(db.bulk_insert_posts, posts, keys=post_keys)
+            except Exception as e:
+                # the items stay "classified" and are written on resume
+                print(f"[ingest:{adapter.name}] DB write failed for {len(batch)} items: {e}")
+                continue
+            await asyncio.to_thread(run.mark, [(e.key, "written", None) for e in batch])
+            totals["truth"] += n_truth
+            totals["posts"] += len(post_ids)
+
+            stats["write"].add(len(batch), time.monotonic() - t0)
+            if stats["write"].batches % REPORT_EVERY == 0:
+                _report(adapter.name, stats, time.monotonic() - t_start)
+
+    if not Path(path).exists():
+        raise FileNotFoundError(f"JSON file not found: {path}")
+    print(f"Streaming {adapter.label} from {path}")
+    tasks = [asyncio.create_task(s()) for s in (read_stage, dedupe_stage, validate_stage, classify_stage, write_stage)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # a failed stage would leave the others blocked on their queues
+        for t in tasks:
+            t.cancel()
+
+    wall_s = time.monotonic() - t_start
+    _report(adapter.name, stats, wall_s)
+    # items still failing after INGEST_ATTEMPTS are dropped, so the next
+    # ingest of this input starts over
+    run.complete(max_attempts=INGEST_ATTEMPTS)
+    print(f"Done. updated_truth={totals['truth']} inserted_posts={totals['posts']}")
+    if crit.cache is not None:
+        print("Classification cache:", crit.cache.stats())
+
+    return {
+        "source": adapter.name,
+        "wall_s": round(wall_s, 3),
+        "items_per_s": round(stats["read"].items / wall_s, 1) if wall_s > 0 else None,
+        "truth": totals["truth"],
+        "posts": totals["posts"],
+        "stages": {n: s.as_dict() for n, s in stats.items()},
+    }
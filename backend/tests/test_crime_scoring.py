@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+from static_analysis_pipeline.crime_scoring import (
+    ANOMALY_Z, DENSITY_SCALE, KDE_BANDWIDTH_KM, anomalous_cells, score_cells,
+)
+
+# ~5.6 km apart, so kernels of neighbouring cells don't overlap
+SPACING_DEG = 0.05
+
+
+def _crime(lat, lng, category="violent-crime"):
+    return {"category": category, "location": {"latitude": str(lat), "longitude": str(lng)}}
+
+
+def _grid(n):
+    return [(51.3 + SPACING_DEG * (i // 5), -0.3 + SPACING_DEG * (i % 5)) for i in range(n)]
+
+
+def test_area_and_kernel_density_per_category():
+    a, b = (51.50, -0.10), (51.60, -0.10)
+    crimes = [_crime(*a), _crime(*a), _crime(*a, "public-order"), {"category": "robbery", "location": None}]
+
+    s = score_cells(crimes, [a, b], cell_area_km2=1.0)
+    assert s["counts"].tolist() == [3, 0]
+
+    # half area density, half a Gaussian kernel evaluated at the crimes' own spot
+    kernel = 1.0 / (2 * math.pi * KDE_BANDWIDTH_KM ** 2)
+    crime = 0.5 * 2.0 + 0.5 * 2.0 * kernel
+    public_safety = 0.5 * 0.6 + 0.5 * 0.6 * kernel
+    assert s["density"][0] == pytest.approx([crime, public_safety])
+    assert s["density"][1] == pytest.approx([0.0, 0.0], abs=1e-9)
+    assert s["risk"][0] == pytest.approx(1.0 - np.exp(-np.array([crime, public_safety]) / DENSITY_SCALE))
+
+
+def test_hot_cell_is_flagged_when_the_rest_are_identical():
+    # every cell but one has the same density, so the MAD is 0
+    centres = _grid(20)
+    crimes = [_crime(*c) for c in centres] + [_crime(*centres[7])] * 30
+
+    s = score_cells(crimes, centres, cell_area_km2=1.0)
+    assert anomalous_cells(s) == [7]
+    # scaled by the mean deviation, not blown up by a zero MAD
+    assert ANOMALY_Z < s["z"][7] < 50
+    assert np.delete(s["z"], 7) == pytest.approx(0.0, abs=1e-3)
+
+
+def test_uniform_cells_flag_nothing():
+    centres = _grid(10)
+    s = score_cells([_crime(*c) for c in centres], centres, cell_area_km2=1.0)
+    assert s["z"] == pytest.approx(0.0, abs=1e-3)
+    assert anomalous_cells(s) == []
+
+
+def test_flagging_orders_by_z_and_ignores_empty_cells():
+    centres = _grid(15)
+    crimes = []
+    for i, c in enumerate(centres[:12]):
+        crimes += [_crime(*c)] * (2 + i % 3)      # ordinary spread
+    crimes += [_crime(*centres[3])] * 40 + [_crime(*centres[9])] * 80
+
+    s = score_cells(crimes, centres, cell_area_km2=1.0)
+    assert anomalous_cells(s) == [9, 3]
+    assert anomalous_cells(s, limit=1) == [9]
+    assert all(s["z"][i] <= ANOMALY_Z for i in range(15) if i not in (3, 9) and s["counts"][i])
+    assert s["counts"][12:].tolist() == [0, 0, 0]
+
+
+def test_no_crimes_or_no_cells():
+    assert score_cells([], [(51.5, -0.1)], 1.0)["counts"].tolist() == [0]
+    assert score_cells([_crime(51.5, -0.1)], [], 1.0)["risk"].shape == (0, 2)
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from live_pipeline.clients import FakeAnthropic, FakeProfile
+from live_pipeline.criticality_agent import CriticalityAgent as LiveAgent
+from live_pipeline.validator_agent import ValidationResult
+from static_analysis_pipeline.criticality_analysis_agent import CriticalityAgent as StaticAgent
+
+
+def _client():
+    return FakeAnthropic(FakeProfile(latency_ms=0, error_rate=0.0))
+
+
+def _break_batches(monkeypatch, agent, bad: str):
+    # every batch request fails, and so does the single call for `bad`
+    def chunk(items):
+        raise TimeoutError("batch timed out")
+
+    one = agent._assess_one
+
+    def assess_one(prompt):
+        if bad in prompt:
+            raise TimeoutError("item timed out")
+        return one(prompt)
+
+    monkeypatch.setattr(agent, "_assess_chunk", chunk)
+    monkeypatch.setattr(agent, "_assess_one", assess_one)
+
+
+@pytest.mark.parametrize("make", [
+    lambda: (StaticAgent(use_cache=False, client=_client()), ["robbery on the high street", "bad report", "bus delay"]),
+    lambda: (LiveAgent(use_cache=False, client=_client()), [
+        ValidationResult(title=t, source_url="https://example.com/" + t.replace(" ", "-"), cleaned_content=t,
+                         summary=t, plausibility=0.9, severity_hint=0.5, flags=[], evidence=[])
+        for t in ["robbery on the high street", "bad report", "bus delay"]
+    ]),
+])
+def test_one_failed_fallback_keeps_the_rest_of_the_batch(monkeypatch, make):
+    agent, items = make()
+    _break_batches(monkeypatch, agent, "bad report")
+
+    outs = agent.assess_batch(items)
+    assert len(outs) == 3
+    assert outs[1] is None
+    assert outs[0] is not None and outs[2] is not None
+
+
+def test_police_scoring_writes_the_reports_that_were_classified(monkeypatch):
+    pytest.importorskip("aiohttp")
+    from live_pipeline.observer_agent import ObserverAgent
+    from static_analysis_pipeline.data_source_uk_gov import _score_and_write
+
+    class _DB:
+        def __init__(self):
+            self.truth = []
+
+        def bulk_update_truth_ema(self, updates, source):
+            self.truth.extend(updates)
+            return len(updates)
+
+        def bulk_insert_posts(self, posts):
+            return []
+
+    agent = StaticAgent(use_cache=False, client=_client())
+    _break_batches(monkeypatch, agent, "bad report")
+    fetched = [(51.5, -0.1, "robbery on the high street", 0.5, 3), (51.6, -0.2, "bad report", 0.5, 1)]
+
+    db = _DB()
+    asyncio.run(_score_and_write(fetched, crit=agent, observer=ObserverAgent(), db=db, alpha=0.25))
+    assert [(lat, lng) for lat, lng, *_ in db.truth] == [(51.5, -0.1)]
@@ -0,0 +1,99 @@
+import random
+import string
+import time
+
+import pytest
+
+from live_pipeline.gazetteer import Gazetteer, MonitoredLocation
+
+SUFFIXES = ["Street", "Road", "Park", "Lane", "Avenue", "Square", "Hill", "Green"]
+
+
+def _place(name, lat, lng, **kw):
+    return MonitoredLocation(name=name, city="London", lat=lat, long=lng, monitored=False, **kw)
+
+
+@pytest.fixture
+def gaz():
+    return Gazetteer([
+        _place("Oxford Street", 51.5154, -0.1410, aliases=["Oxford St"]),
+        _place("Camden Town", 51.5390, -0.1426),
+        _place("Camden", 51.5450, -0.1600),
+        _place("King's Cross", 51.5308, -0.1238),
+        _place("Hyde Park", 51.5073, -0.1657,
+               polygon=[(51.500, -0.190), (51.500, -0.150), (51.515, -0.150), (51.515, -0.190)]),
+        _place("Serpentine", 51.5050, -0.1700,
+               polygon=[(51.503, -0.175), (51.503, -0.165), (51.507, -0.165), (51.507, -0.175)]),
+    ])
+
+
+@pytest.fixture(scope="module")
+def big():
+    # 50k made-up names, most ending in a handful of generic words
+    r = random.Random(0)
+    entries = []
+    for _ in range(50_000):
+        word = "".join(r.choice(string.ascii_lowercase) for _ in range(r.randint(4, 9))).title()
+        entries.append(_place(f"{word} {r.choice(SUFFIXES)}", 51 + r.random(), -1 + r.random()))
+    return Gazetteer(entries)
+
+
+def test_get_normalizes_and_knows_aliases(gaz):
+    assert gaz.get("  oxford   STREET ").name == "Oxford Street"
+    assert gaz.get("Oxford St").name == "Oxford Street"
+    assert gaz.get("Kings Cross").name == "King's Cross"
+    assert gaz.get("Oxford") is None
+
+
+def test_fuzzy_matches_typos_but_not_lookalikes(gaz):
+    assert gaz.fuzzy("Oxfrd Street")[0].name == "Oxford Street"
+    assert gaz.resolve("Camdn Town").name == "Camden Town"
+    assert gaz.fuzzy("Baker Street") is None
+    assert gaz.resolve("Totally Elsewhere") is None
+
+
+def test_fuzzy_ignores_shared_generic_suffixes(big):
+    gz = big
+    # nothing here is Oxford Street; sharing "street" mustn't make a match
+    assert gz.fuzzy("Oxfrd Stret") is None
+    assert gz.fuzzy("Baker Street") is None
+
+
+def test_fuzzy_finds_typos_among_50k(big):
+    gz, r = big, random.Random(1)
+    picked = [e for e in r.sample(gz.entries, 400) if len(e.name.split()[0]) >= 7][:50]
+    hits = [gz.fuzzy(e.name[:2] + e.name[3:]) for e in picked]   # one letter dropped
+
+    assert not [h for h, e in zip(hits, picked) if h is not None and h[0] is not e]
+    assert sum(h is not None for h in hits) >= 0.8 * len(picked)
+
+
+def test_find_in_text_prefers_the_longest_name(gaz):
+    assert gaz.find_in_text("Huge queues at camden town station tonight").name == "Camden Town"
+    assert gaz.find_in_text("Market in Camden today").name == "Camden"
+    assert gaz.find_in_text("nothing to see") is None
+
+
+def test_reverse_prefers_the_smallest_polygon_then_nearest_centroid(gaz):
+    assert gaz.reverse(51.505, -0.170).name == "Serpentine"
+    assert gaz.reverse(51.512, -0.185).name == "Hyde Park"
+    assert gaz.reverse(51.5155, -0.1405).name == "Oxford Street"
+    assert gaz.reverse(51.7, -0.5) is None
+
+
+def test_lookups_stay_under_a_millisecond_at_50k(big):
+    gz, r = big, random.Random(1)
+    queries = [e.name for e in r.sample(gz.entries, 200)]
+    typos = [q[:3] + q[4:] for q in queries]
+
+    def per_call_ms(fn, args):
+        fn(args[0])   # warm up
+        t0 = time.perf_counter()
+        for a in args:
+            fn(a)
+        return (time.perf_counter() - t0) * 1000 / len(args)
+
+    assert per_call_ms(gz.get, queries) < 1.0
+    assert per_call_ms(gz.fuzzy, typos) < 1.0
+    assert per_call_ms(gz.find_in_text, [f"Crash on {q} this morning" for q in queries]) < 1.0
+    assert per_call_ms(lambda e: gz.reverse(e.lat, e.long), r.sample(gz.entries, 200)) < 1.0
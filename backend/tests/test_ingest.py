@@ -0,0 +1,132 @@
+import asyncio
+import json
+import random
+
+from db.run_state import RunState
+from live_pipeline.observer_agent import ObserverAgent
+from static_analysis_pipeline.data_generators import twitter_gen
+from static_analysis_pipeline.data_source_twitter import TwitterAdapter
+from static_analysis_pipeline.ingest import INGEST_ATTEMPTS, ingest
+
+
+def _dump(tmp_path, n, seed):
+    random.seed(seed)
+    path = tmp_path / "twitter.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i, r in enumerate(twitter_gen.generate_batch(n)):
+            r["id"] = i
+            f.write(json.dumps(r) + "\n")
+    return path
+
+
+def _ingest(tmp_path, path, validator, crit, db):
+    run = RunState("twitter", input_id=str(path), path=str(tmp_path / "run_state.db"))
+    out = asyncio.run(ingest(str(path), TwitterAdapter(), validator=validator, observer=ObserverAgent(),
+                             crit=crit, db=db, run=run, batch_size=20))
+    return run, out
+
+
+class _FlakyCrit:
+    # the fake-backed agent, except that the first batch fails
+    def __init__(self, crit):
+        self.crit = crit
+        self.failed = False
+
+    def assess_batch(self, validation_results):
+        if not self.failed:
+            self.failed = True
+            raise TimeoutError("fake client timed out")
+        return self.crit.assess_batch(validation_results)
+
+    def __getattr__(self, name):
+        return getattr(self.crit, name)
+
+
+def test_failed_classify_batch_is_left_for_resume(tmp_path, fake_agents, sqlite_db):
+    path = _dump(tmp_path, 60, seed=0)
+    validator, crit = fake_agents
+    flaky = _FlakyCrit(crit)
+
+    run, first = _ingest(tmp_path, path, validator, flaky, sqlite_db)
+    assert flaky.failed and first["truth"] > 0
+    assert run.counts().get("validated", 0) > 0
+
+    # the resumed run classifies and writes what the failed batch left behind
+    run, second = _ingest(tmp_path, path, validator, crit, sqlite_db)
+    assert run.attempt == 2 and second["truth"] > 0
+    assert run.stages() == {}
+
+
+def test_items_the_model_failed_on_stay_validated(tmp_path, fake_agents, sqlite_db):
+    path = _dump(tmp_path, 20, seed=1)
+    validator, crit = fake_agents
+
+    class _OneMissing:
+        # the first item of the first call comes back unclassified
+        def __init__(self):
+            self.calls = 0
+
+        def assess_batch(self, validation_results):
+            outs = crit.assess_batch(validation_results)
+            self.calls += 1
+            return [None] + outs[1:] if self.calls == 1 else outs
+
+        def __getattr__(self, name):
+            return getattr(crit, name)
+
+    run, out = _ingest(tmp_path, path, validator, _OneMissing(), sqlite_db)
+    assert run.counts().get("validated") == 1
+    assert out["truth"] == run.counts()["written"]
+
+
+class _FlakyDB:
+    # the real storage, except that the first truth write fails
+    def __init__(self, db):
+        self.db = db
+        self.failed = False
+
+    def bulk_update_truth_ema(self, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("database is locked")
+        return self.db.bulk_update_truth_ema(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def test_failed_write_is_left_for_resume(tmp_path, fake_agents, sqlite_db):
+    path = _dump(tmp_path, 60, seed=2)
+    validator, crit = fake_agents
+    db = _FlakyDB(sqlite_db)
+
+    # the other batches still get written
+    run, first = _ingest(tmp_path, path, validator, crit, db)
+    assert db.failed and first["truth"] > 0
+    assert run.counts().get("classified", 0) > 0
+
+    run, second = _ingest(tmp_path, path, validator, crit, db)
+    assert run.attempt == 2 and second["truth"] > 0
+    assert run.stages() == {}
+
+
+def test_run_closes_after_its_attempts_run_out(tmp_path, fake_agents, sqlite_db):
+    path = _dump(tmp_path, 20, seed=3)
+    validator, crit = fake_agents
+
+    class _Down:
+        # the model never answers
+        def assess_batch(self, validation_results):
+            raise TimeoutError("fake client timed out")
+
+        def __getattr__(self, name):
+            return getattr(crit, name)
+
+    for attempt in range(1, INGEST_ATTEMPTS + 1):
+        run, _ = _ingest(tmp_path, path, validator, _Down(), sqlite_db)
+        assert run.attempt == attempt
+        assert bool(run.stages()) == (attempt < INGEST_ATTEMPTS)
+
+    # the next ingest starts over
+    run = RunState("twitter", input_id=str(path), path=str(tmp_path / "run_state.db"))
+    assert not run.resumed
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from db.run_state import RunState
+from db.url_dedupe import SeenStore
+from live_pipeline.clients import FakeAnthropic, FakeProfile, FakeStagehand
+from live_pipeline.criticality_agent import CriticalityAgent
+from live_pipeline.observer_agent import ObserverAgent
+from live_pipeline.pipeline import SWEEP_ATTEMPTS, run_sweep, sweep_jobs
+from live_pipeline.scraper_pool import ScraperPool
+from utils import TokenBucket
+
+
+class _FlakyDB:
+    # the real storage, except that the first truth write fails
+    def __init__(self, db):
+        self.db = db
+        self.failed = False
+
+    def bulk_update_truth_ema(self, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("database is locked")
+        return self.db.bulk_update_truth_ema(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def _sweep(tmp_path, agents, jobs, run, db, crit=None):
+    validator, ok_crit = agents
+    crit = crit or ok_crit
+    browser = FakeStagehand(FakeProfile(latency_ms=1, error_rate=0.0))
+    pool = ScraperPool(size=2, client_factory=lambda: browser)
+
+    async def main():
+        await pool.start()
+        try:
+            pool.set_params(max_items=5, dom_settle_seconds=0)
+            return await asyncio.wait_for(run_sweep(
+                jobs, limiter=TokenBucket(rate_per_sec=1e9, capacity=2), pool=pool,
+                observer=ObserverAgent(), validator=validator, crit=crit, db=db,
+                seen=SeenStore(path=str(tmp_path / "seen.db")), run=run,
+            ), timeout=10)
+        finally:
+            await pool.end()
+
+    return asyncio.run(main())
+
+
+def test_failed_write_leaves_items_classified_for_resume(tmp_path, fake_agents, sqlite_db, live_jobs):
+    run = RunState("live_news", input_id="test", path=str(tmp_path / "run_state.db"))
+    db = _FlakyDB(sqlite_db)
+
+    stats = _sweep(tmp_path, fake_agents, live_jobs(6), run, db)
+    assert db.failed and stats["truth"] > 0
+    assert run.counts().get("classified", 0) > 0
+    assert not run.complete()
+
+
+def test_a_crashing_stage_fails_the_sweep(tmp_path, monkeypatch, fake_agents, sqlite_db, live_jobs):
+    run = RunState("live_news", input_id="test", path=str(tmp_path / "run_state.db"))
+    mark = run.mark
+
+    def broken_mark(entries):
+        entries = list(entries)
+        if any(stage == "classified" for _, stage, _ in entries):
+            raise RuntimeError("disk full")
+        mark(entries)
+
+    monkeypatch.setattr(run, "mark", broken_mark)
+    with pytest.raises(RuntimeError, match="disk full"):
+        # enough jobs to fill the stage queues behind the dead stage
+        _sweep(tmp_path, fake_agents, live_jobs(80), run, sqlite_db)
+
+
+def test_sweep_run_closes_after_its_attempts_run_out(tmp_path, fake_agents, sqlite_db):
+    # the model is down, so classification never succeeds
+    crit = CriticalityAgent(use_cache=False, client=FakeAnthropic(
+        FakeProfile(latency_ms=1, error_rate=1.0, timeout_share=0.0)))
+    observer = ObserverAgent()
+    planned = len(observer.plan_all_queries())
+
+    for attempt in range(1, SWEEP_ATTEMPTS + 1):
+        run = RunState("live_news", input_id="sweep", path=str(tmp_path / "run_state.db"))
+        assert run.attempt == attempt
+        jobs = sweep_jobs(run, observer)
+        assert len(jobs) == (planned if attempt == 1 else 0)
+        _sweep(tmp_path, fake_agents, jobs, run, sqlite_db, crit=crit)
+        assert run.counts().get("validated", 0) > 0
+        assert run.complete(max_attempts=SWEEP_ATTEMPTS) == (attempt == SWEEP_ATTEMPTS)
+
+    # the next sweep starts over with every job
+    run = RunState("live_news", input_id="sweep", path=str(tmp_path / "run_state.db"))
+    assert not run.resumed and len(sweep_jobs(run, observer)) == planned
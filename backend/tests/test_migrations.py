@@ -0,0 +1,108 @@
+import random
+import sqlite3
+
+import pytest
+
+from db import geohash, migrations
+
+CATS = migrations.CATEGORIES
+
+
+def _old_truth(path, n, seed):
+    # a pre-m003 database with unkeyed truth rows, many in the same cells
+    r = random.Random(seed)
+    conn = migrations.connect(path)
+    migrations.migrate(conn, target=2)
+    rows = [(51.5 + r.random() * 0.01, -0.1 + r.random() * 0.01, f"2024-01-{r.randint(1, 28):02d} 00:00:00",
+             *[r.random() for _ in CATS]) for _ in range(n)]
+    rows.append((*geohash.snap(*rows[0][:2])[:2], "2024-02-01 00:00:00", *[1.0] * len(CATS)))   # at a centre
+    conn.executemany(f"INSERT INTO truth (lat, long, updated_at, {', '.join(CATS)}) "
+                     f"VALUES (?, ?, ?, {', '.join('?' * len(CATS))})", rows)
+    return conn, rows
+
+
+def _merged(rows):
+    # what m003 used to do in one statement
+    out = {}
+    for lat, lng, updated_at, *vals in rows:
+        lat, lng, cell = geohash.snap(lat, lng)
+        acc = out.setdefault(cell, [lat, lng, updated_at, []])
+        acc[2] = max(acc[2], updated_at)
+        acc[3].append(vals)
+    return {cell: (lat, lng, ts, [sum(v) / len(vals) for v in zip(*vals)])
+            for cell, (lat, lng, ts, vals) in out.items()}
+
+
+def _truth(conn):
+    return {cell: (lat, lng, ts, list(vals)) for cell, lat, lng, ts, *vals in conn.execute(
+        f"SELECT geohash, lat, long, updated_at, {', '.join(CATS)} FROM truth")}
+
+
+def _assert_rollup_matches_truth(conn):
+    for lvl in geohash.ROLLUP_LEVELS:
+        want = conn.execute(
+            f"SELECT substr(geohash, 1, {lvl}), COUNT(*), {', '.join(f'SUM({c})' for c in CATS)} "
+            f"FROM truth GROUP BY 1 ORDER BY 1").fetchall()
+        got = conn.execute(
+            f"SELECT geohash, n, {', '.join(CATS)} FROM truth_rollup WHERE level = ? AND n > 0 ORDER BY 1",
+            (lvl,)).fetchall()
+        assert [g[:2] for g in got] == [w[:2] for w in want]
+        assert [g[2:] for g in got] == [pytest.approx(w[2:]) for w in want]
+
+
+def test_truth_cells_are_merged_chunk_by_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "BACKFILL_CHUNK_SIZE", 7)
+    conn, rows = _old_truth(tmp_path / "app.db", 300, seed=0)
+    migrations.migrate(conn, target=3)
+
+    want, got = _merged(rows), _truth(conn)
+    assert len(want) < len(rows)
+    assert got.keys() == want.keys()
+    for cell, (lat, lng, ts, vals) in want.items():
+        assert got[cell][:3] == (lat, lng, ts)
+        assert got[cell][3] == pytest.approx(vals)
+    _assert_rollup_matches_truth(conn)
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name LIKE 'm003_%'").fetchall()
+
+
+def test_interrupted_backfill_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "BACKFILL_CHUNK_SIZE", 7)
+    conn, rows = _old_truth(tmp_path / "app.db", 200, seed=1)
+
+    snap, calls = geohash.snap, [0]
+
+    def crash_midway(lat, lng):
+        calls[0] += 1
+        if calls[0] == 100:
+            raise RuntimeError("killed")
+        return snap(lat, lng)
+
+    monkeypatch.setattr(geohash, "snap", crash_midway)
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn, target=3)
+    assert migrations.current_version(conn) == 2
+
+    monkeypatch.setattr(geohash, "snap", snap)
+    migrations.migrate(conn, target=3)
+    got = _truth(conn)
+    for cell, (_, _, _, vals) in _merged(rows).items():
+        assert got[cell][3] == pytest.approx(vals)
+    _assert_rollup_matches_truth(conn)
+
+
+def test_rollup_is_built_for_cells_keyed_before_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "BACKFILL_CHUNK_SIZE", 3)
+    conn = migrations.connect(tmp_path / "app.db")
+    migrations.migrate(conn, target=2)
+    conn.execute("ALTER TABLE truth ADD COLUMN geohash TEXT")
+    r = random.Random(2)
+    cells = {geohash.snap(51 + r.random(), -1 + r.random()) for _ in range(50)}
+    conn.executemany("INSERT INTO truth (lat, long, geohash, crime, weather) VALUES (?, ?, ?, ?, ?)",
+                     [(lat, lng, cell, r.random(), r.random()) for lat, lng, cell in cells])
+
+    migrations.migrate(conn, target=3)
+    assert conn.execute("SELECT COUNT(*) FROM truth").fetchone()[0] == len(cells)
+    _assert_rollup_matches_truth(conn)
+    with pytest.raises(sqlite3.IntegrityError):
+        lat, lng, cell = next(iter(cells))
+        conn.execute("INSERT INTO truth (lat, long, geohash) VALUES (?, ?, ?)", (lat + 1, lng, cell))
@@ -0,0 +1,72 @@
+import gzip
+import json
+
+from db import migrations, post_retention
+from db.db_writer import DBWriter
+
+
+def test_only_one_process_runs_a_pass_per_interval(sqlite_path, monkeypatch):
+    monkeypatch.setattr(post_retention, "run_retention", lambda db: {"moved": 0, "archived": []})
+    a, b = DBWriter(sqlite_path), DBWriter(sqlite_path)   # two API workers on one file
+
+    assert post_retention.run_retention_exclusive(a, interval_s=3600) is not None
+    assert post_retention.run_retention_exclusive(b, interval_s=3600) is None
+
+    assert post_retention.run_retention_exclusive(a, interval_s=3600) is None
+
+    # once the interval has passed, whoever comes first runs the next pass
+    conn = b._connect()
+    with conn:
+        conn.execute("UPDATE meta SET value = 0 WHERE key = ?", (post_retention.RETENTION_LEASE_KEY,))
+    conn.close()
+    assert post_retention.run_retention_exclusive(b, interval_s=3600) is not None
+
+
+def test_lease_is_held_for_the_whole_pass(sqlite_path, monkeypatch):
+    a, b = DBWriter(sqlite_path), DBWriter(sqlite_path)
+    seen = []
+
+    def slow_pass(db):
+        seen.append(post_retention.run_retention_exclusive(b))
+        return {"moved": 0, "archived": []}
+
+    monkeypatch.setattr(post_retention, "run_retention", slow_pass)
+    post_retention.run_retention_exclusive(a)
+    assert seen == [None]
+
+
+def test_rolled_and_archived_posts_keep_their_status(sqlite_path, tmp_path):
+    db = DBWriter(sqlite_path)
+    failed = db.enqueue_post(lat=51.5, long=-0.1, content="x")["id"]
+    db.retry_post_job(failed, error="boom", delay_s=None)
+    db.insert_post(lat=51.5, long=-0.1, severity=0.4, category="crime", content="y", human=True)
+
+    conn = db._connect()
+    with conn:
+        conn.execute("UPDATE posts SET created_at = datetime('now', '-400 days')")
+    conn.close()
+
+    assert post_retention.roll_cold_posts(db, hot_days=30) == 2
+    conn = db._connect()
+    assert sorted(s for (s,) in conn.execute("SELECT status FROM posts_all")) == ["classified", "failed"]
+    conn.close()
+
+    (path,) = post_retention.archive_partitions(db, older_than_months=1, archive_dir=tmp_path)
+    with gzip.open(path, "rt") as f:
+        assert sorted(json.loads(line)["status"] for line in f) == ["classified", "failed"]
+
+
+def test_migration_adds_status_to_existing_partitions(tmp_path):
+    conn = migrations.connect(tmp_path / "app.db")
+    migrations.migrate(conn, target=9)
+    conn.execute("INSERT INTO post_partitions (name, month) VALUES ('posts_2024_05', '2024-05')")
+    conn.execute(
+        "CREATE TABLE posts_2024_05 (id TEXT PRIMARY KEY, lat REAL NOT NULL, long REAL NOT NULL, geohash TEXT,"
+        " severity REAL NOT NULL, category TEXT NOT NULL, human INTEGER NOT NULL, content TEXT NOT NULL,"
+        " created_at TEXT NOT NULL)"
+    )
+    conn.execute("INSERT INTO posts_2024_05 VALUES ('a', 51.5, -0.1, NULL, 0.3, 'crime', 1, 'x', '2024-05-01')")
+
+    migrations.migrate(conn)
+    assert conn.execute("SELECT id, status FROM posts_all").fetchall() == [("a", "classified")]
+    conn.close()
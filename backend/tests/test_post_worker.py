@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+from db.async_db import AsyncDBWriter
+from db.db_writer import DBWriter
+from post_worker import PostWorkerPool
+
+LONDON = (51.5074, -0.1278)
+
+
+class _Agent:
+    def assess(self, content):
+        return SimpleNamespace(final_severity=0.5, category="crime")
+
+
+def test_worker_survives_a_failed_batch_write(sqlite_path, monkeypatch):
+    db = DBWriter(sqlite_path)
+    complete = db.complete_post_jobs
+    calls = []
+
+    def flaky_complete(results):
+        calls.append(results)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return complete(results)
+
+    monkeypatch.setattr(db, "complete_post_jobs", flaky_complete)
+
+    async def main():
+        pool = PostWorkerPool(agent=_Agent(), adb=AsyncDBWriter(db), workers=1, batch_size=1)
+        await pool.start()
+        try:
+            first = await pool.submit(lat=LONDON[0], long=LONDON[1], content="a")
+            while not calls:
+                await asyncio.sleep(0.01)
+            second = await pool.submit(lat=LONDON[0], long=LONDON[1], content="b")
+            for _ in range(300):
+                if len(calls) > 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert not any(t.done() for t in pool._tasks)
+            return first["id"], second["id"]
+        finally:
+            await pool.stop()
+
+    first, second = asyncio.run(main())
+    status = {p["id"]: p["status"] for p in db.get_feed(lat=LONDON[0], lng=LONDON[1])}
+    assert status == {first: "pending", second: "classified"}
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from live_pipeline import scheduler
+from live_pipeline.gazetteer import MonitoredLocation
+from live_pipeline.scheduler import JobScheduler, interval_for
+from utils import TokenBucket
+
+
+class _TruthDB:
+    # a fresh truth row per (location, crime severity) pair
+    def __init__(self, severity):
+        self.severity = severity
+        self.now = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+    def get_truth(self, lat, long):
+        for loc, sev in self.severity:
+            if (loc.lat, loc.long) == (lat, long):
+                return {"updated_at": self.now, "crime": sev}
+        return None
+
+
+def _loc(name, lat):
+    return MonitoredLocation(name=name, city="London", lat=lat, long=-0.1)
+
+
+def _scheduler(severity, **kw):
+    jobs = [{"location": loc, "query": f"{loc.name} crime", "category": "crime"} for loc, _ in severity]
+    return jobs, JobScheduler(jobs, db=_TruthDB(severity), limiter=TokenBucket(rate_per_sec=1e9, capacity=10), **kw)
+
+
+def _due(sched, job):
+    key = (job["location"].name, job["query"])
+    return min(due for due, _, k, v in sched._heap if k == key and v == sched.jobs[key].version)
+
+
+def test_interval_shrinks_geometrically_with_priority():
+    assert interval_for(0.0) == pytest.approx(scheduler.MAX_INTERVAL_S)
+    assert interval_for(1.0) == pytest.approx(scheduler.MIN_INTERVAL_S)
+    assert interval_for(0.5) == pytest.approx((scheduler.MIN_INTERVAL_S * scheduler.MAX_INTERVAL_S) ** 0.5)
+    assert interval_for(-1) == interval_for(0.0) and interval_for(2) == interval_for(1.0)
+
+
+def test_highest_priority_job_is_served_first():
+    quiet, busy, mid = _loc("Quiet", 51.40), _loc("Busy", 51.50), _loc("Mid", 51.60)
+    jobs, sched = _scheduler([(quiet, 0.1), (busy, 0.9), (mid, 0.5)], max_jobs=3)
+
+    async def main():
+        return [await sched.next_job() for _ in range(4)]
+
+    served = asyncio.run(main())
+    assert [j["location"].name for j in served[:3]] == ["Busy", "Mid", "Quiet"]
+    assert served[3] is None
+
+    # each is next due one interval after it ran, busier jobs sooner
+    assert _due(sched, jobs[1]) < _due(sched, jobs[2]) < _due(sched, jobs[0])
+
+
+def test_feedback_moves_a_job_earlier(monkeypatch):
+    monkeypatch.setattr(scheduler, "MIN_INTERVAL_S", 0.01)
+    monkeypatch.setattr(scheduler, "MAX_INTERVAL_S", 60.0)
+    quiet, busy = _loc("Quiet", 51.40), _loc("Busy", 51.50)
+    (quiet_job, busy_job), sched = _scheduler([(quiet, 0.1), (busy, 0.9)])
+
+    async def main():
+        first = [await sched.next_job(), await sched.next_job()]
+        quiet_due = _due(sched, quiet_job)
+
+        # the quiet job starts turning up severe, new items; the busy one goes quiet
+        for _ in range(5):
+            sched.record_severity(quiet_job, 1.0)
+            sched.record_scrape(quiet_job, scraped=10, new=10)
+            sched.record_severity(busy_job, 0.0)
+            sched.record_scrape(busy_job, scraped=10, new=0)
+        assert _due(sched, quiet_job) < quiet_due
+        assert _due(sched, quiet_job) < _due(sched, busy_job)
+
+        return first, await asyncio.wait_for(sched.next_job(), timeout=5)
+
+    first, after = asyncio.run(main())
+    assert [j["location"].name for j in first] == ["Busy", "Quiet"]
+    assert after is quiet_job
@@ -0,0 +1,146 @@
+"""
+Behaviour every Storage backend must share (db/storage.py). Each test runs
+against DBWriter and, when configured, PostGISWriter (see conftest.py).
+"""
+
+import pytest
+
+from db import geohash
+from db.db_writer import CATEGORIES
+
+LONDON = (51.5074, -0.1278)
+
+
+def _post(lat=LONDON[0], long=LONDON[1], **kw):
+    p = {"lat": lat, "long": long, "severity": 0.5, "category": "crime", "content": "x", "human": False}
+    p.update(kw)
+    return p
+
+
+# --- posts ---
+
+def test_feed_filters_by_radius_and_orders_newest_first(storage):
+    near = storage.insert_post(lat=LONDON[0], long=LONDON[1], severity=0.7, category="crime",
+                               content="near", human=True)
+    storage.insert_post(lat=LONDON[0] + 0.1, long=LONDON[1], severity=0.7, category="crime",
+                        content="far", human=True)
+
+    feed = storage.get_feed(lat=LONDON[0], lng=LONDON[1], radius=500)
+    assert [p["id"] for p in feed] == [near["id"]]
+    p = feed[0]
+    assert p["content"] == "near" and p["human"] is True and p["status"] == "classified"
+    assert p["distance"] == pytest.approx(0.0, abs=1.0)
+    assert set(p) >= {"id", "lat", "lng", "severity", "category", "timestamp"}
+
+
+def test_feed_keyset_pagination(storage):
+    ids = storage.bulk_insert_posts([_post(content=str(i)) for i in range(5)])
+    assert len(ids) == 5
+
+    first = storage.get_feed(lat=LONDON[0], lng=LONDON[1], limit=2)
+    rest = storage.get_feed(lat=LONDON[0], lng=LONDON[1], limit=10,
+                            before=first[-1]["timestamp"], before_id=first[-1]["id"])
+    seen = [p["id"] for p in first + rest]
+    assert sorted(seen) == sorted(ids) and len(set(seen)) == 5
+
+
+def test_bulk_insert_posts_skips_applied_keys_and_maps_unknown_category(storage):
+    ids = storage.bulk_insert_posts([_post(category="nonsense"), _post()], keys=["k1", "k2"])
+    assert len(ids) == 2
+    assert len(storage.bulk_insert_posts([_post(), _post()], keys=["k1", "k3"])) == 1
+    assert len(storage.get_feed(lat=LONDON[0], lng=LONDON[1])) == 3
+    assert {p["category"] for p in storage.get_feed(lat=LONDON[0], lng=LONDON[1])} == {"crime", "other"}
+
+
+# --- post queue ---
+
+def test_post_queue_claim_complete_retry(storage):
+    a = storage.enqueue_post(lat=LONDON[0], long=LONDON[1], content="a")["id"]
+    b = storage.enqueue_post(lat=LONDON[0], long=LONDON[1], content="b")["id"]
+    assert storage.count_post_queue() == 2
+    # nothing is scored until the classifier has run
+    assert {(p["status"], p["severity"]) for p in storage.get_feed(lat=LONDON[0], lng=LONDON[1])} == {("pending", 0.0)}
+
+    jobs = storage.claim_post_jobs(limit=10, lease_s=60)
+    assert {j["id"]: (j["content"], j["attempts"]) for j in jobs} == {a: ("a", 0), b: ("b", 0)}
+    # leased jobs aren't handed out twice
+    assert storage.claim_post_jobs(limit=10, lease_s=60) == []
+
+    assert storage.complete_post_jobs([(a, 0.9, "crime")]) == 1
+    storage.retry_post_job(b, error="boom", delay_s=0)
+    (retried,) = storage.claim_post_jobs(limit=10, lease_s=60)
+    assert retried["id"] == b and retried["attempts"] == 1
+
+    storage.retry_post_job(b, error="boom", delay_s=None)
+    assert storage.count_post_queue() == 0
+
+    status = {p["id"]: (p["status"], p["severity"], p["category"])
+              for p in storage.get_feed(lat=LONDON[0], lng=LONDON[1])}
+    assert status[a] == ("classified", 0.9, "crime")
+    assert status[b][0] == "failed"
+
+
+# --- truth ---
+
+def test_update_truth_is_an_ema_and_idempotent_by_key(storage):
+    v0 = storage.get_truth_version()
+    storage.update_truth(lat=LONDON[0], long=LONDON[1], category="crime", severity=1.0, alpha=0.5, key="t1")
+    storage.update_truth(lat=LONDON[0], long=LONDON[1], category="crime", severity=1.0, alpha=0.5, key="t1")
+    storage.update_truth(lat=LONDON[0], long=LONDON[1], category="crime", severity=1.0, alpha=0.5)
+
+    row = storage.get_truth(lat=LONDON[0], long=LONDON[1])
+    assert row["crime"] == pytest.approx(0.75)
+    assert row["transport"] == 0.0
+    assert storage.get_truth_version() > v0
+    assert storage.count_truth_rows() == 1
+
+
+def test_truth_snaps_to_cells(storage):
+    clat, clng, _ = geohash.snap(*LONDON)
+    storage.update_truth(lat=LONDON[0] + 1e-5, long=LONDON[1], category="crime", severity=1.0, alpha=1.0)
+    row = storage.get_truth(lat=LONDON[0], long=LONDON[1])
+    assert (row["lat"], row["long"]) == pytest.approx((clat, clng))
+
+
+def test_bulk_ema_applies_in_order_and_skips_applied_keys(storage):
+    ups = [(LONDON[0], LONDON[1], "crime", 1.0, 0.5), (LONDON[0], LONDON[1], "crime", 0.0, 0.5),
+           (LONDON[0], LONDON[1], "unknown", 1.0, 1.0)]
+    assert storage.bulk_update_truth_ema(ups, source="test", keys=["a", "b", "c"]) == 3
+    assert storage.bulk_update_truth_ema(ups, source="test", keys=["a", "b", "c"]) == 0
+
+    row = storage.get_truth(lat=LONDON[0], long=LONDON[1])
+    # 0 -> 0.5 -> 0.25; the unknown category lands in "other"
+    assert row["crime"] == pytest.approx(0.25)
+    assert row["other"] == pytest.approx(1.0)
+
+
+def test_bulk_upsert_overwrites_and_reads_back(storage):
+    rows = [(51.50, -0.10, {"crime": 0.2}), (51.51, -0.11, {"transport": 0.4}), (40.0, -74.0, {"crime": 1.0})]
+    assert storage.bulk_upsert_truth(rows) == 3
+    storage.bulk_upsert_truth([(51.50, -0.10, {"crime": 0.6})])
+    assert storage.count_truth_rows() == 3
+
+    row = storage.get_truth(lat=51.50, long=-0.10)
+    assert row["crime"] == pytest.approx(0.6)
+
+    box = storage.get_truth_in_bbox(south=51.4, west=-0.2, north=51.6, east=0.0)
+    assert len(box) == 2 and all(set(CATEGORIES) <= set(r) for r in box)
+
+    near = storage.get_truth_nearest(lat=51.511, lng=-0.111)
+    assert near["transport"] == pytest.approx(0.4)
+
+    cols = storage.fetch_truth_columns()
+    assert len(cols) == 3 and all(len(r) == 3 + len(CATEGORIES) for r in cols)
+
+
+def test_rollup_means_per_cell(storage):
+    a, b = (51.501, -0.101), (51.502, -0.102)   # same level-5 cell
+    storage.bulk_upsert_truth([(*a, {"crime": 0.2}), (*b, {"crime": 0.6}), (40.0, -74.0, {"crime": 1.0})])
+
+    cells = storage.get_truth_rollup(level=5, south=51.4, west=-0.2, north=51.6, east=0.0)
+    (cell,) = [c for c in cells if c["geohash"] == geohash.encode(*a, 5)]
+    assert cell["n"] == 2 and cell["crime"] == pytest.approx(0.4)
+    assert all(c["geohash"] != geohash.encode(40.0, -74.0, 5) for c in cells)
+
+    world = storage.get_truth_rollup(level=4, south=-90, west=-180, north=90, east=180)
+    assert sum(c["n"] for c in world) == 3
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from db import geohash, migrations
+from db.db_writer import DBWriter
+from db.truth_history import compact, rebuild
+
+A = (51.5074, -0.1278)
+B = (51.5155, -0.0922)
+
+
+def _truth(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT geohash, crime, transport FROM truth ORDER BY geohash").fetchall()
+    conn.close()
+    return {cell: (pytest.approx(crime), pytest.approx(transport)) for cell, crime, transport in rows}
+
+
+def test_rebuild_keeps_truth_written_before_the_log(tmp_path):
+    path = str(tmp_path / "app.db")
+    conn = migrations.connect(path)
+    migrations.migrate(conn, target=4)   # before truth_events existed
+    for (lat, lng), crime in ((A, 0.8), (B, 0.3)):
+        lat, lng, cell = geohash.snap(lat, lng)
+        conn.execute("INSERT INTO truth (lat, long, geohash, crime) VALUES (?, ?, ?, ?)", (lat, lng, cell, crime))
+    migrations.migrate(conn, target=8)
+
+    db = DBWriter(path)
+    db.update_truth(lat=A[0], long=A[1], category="crime", severity=0.0, alpha=0.5)
+    db.update_truth(lat=A[0], long=A[1], category="transport", severity=1.0, alpha=0.5)
+
+    migrations.migrate(conn)
+    conn.close()
+
+    before = _truth(path)
+    assert before[geohash.snap(*A)[2]] == (0.4, 0.5)
+    assert rebuild(db) == 2
+    assert _truth(path) == before
+
+
+def test_seeding_writes_one_snapshot_per_row_and_rebuilds(sqlite_path):
+    db = DBWriter(sqlite_path)
+    db.bulk_upsert_truth([(*A, {"crime": 0.6, "transport": 0.2}), (*B, {"crime": 0.1})], source="seed")
+    db.update_truth(lat=A[0], long=A[1], category="crime", severity=0.0, alpha=0.5)
+
+    conn = sqlite3.connect(sqlite_path)
+    assert conn.execute("SELECT COUNT(*) FROM truth_snapshots").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM truth_events").fetchone()[0] == 1
+    conn.close()
+
+    before = _truth(sqlite_path)
+    rebuild(db)
+    assert _truth(sqlite_path) == before
+
+    # a later overwrite supersedes everything logged before it
+    db.bulk_upsert_truth([(*A, {"crime": 0.9})])
+    rebuild(db)
+    assert _truth(sqlite_path)[geohash.snap(*A)[2]] == (0.9, 0.0)
+
+
+def test_compaction_drops_events_a_snapshot_overwrote(sqlite_path):
+    db = DBWriter(sqlite_path)
+    db.update_truth(lat=A[0], long=A[1], category="crime", severity=1.0, alpha=0.5)
+    conn = sqlite3.connect(sqlite_path)
+    with conn:
+        conn.execute("UPDATE truth_events SET created_at = datetime('now', '-40 days')")
+    db.bulk_upsert_truth([(*A, {"crime": 0.2})])
+
+    assert compact(db, older_than_days=30) == 0
+    assert conn.execute("SELECT COUNT(*) FROM truth_events").fetchone()[0] == 0
+    conn.close()
+
+    rebuild(db)
+    assert _truth(sqlite_path)[geohash.snap(*A)[2]] == (0.2, 0.0)
+
+
+def test_rebuild_refuses_to_drop_unlogged_rows(sqlite_path):
+    lat, lng, cell = geohash.snap(*A)
+    conn = sqlite3.connect(sqlite_path)
+    with conn:
+        conn.execute("INSERT INTO truth (lat, long, geohash, crime) VALUES (?, ?, ?, 0.5)", (lat, lng, cell))
+    conn.close()
+
+    db = DBWriter(sqlite_path)
+    with pytest.raises(RuntimeError):
+        rebuild(db)
+    assert _truth(sqlite_path) == {cell: (0.5, 0.0)}
+    assert rebuild(db, force=True) == 0
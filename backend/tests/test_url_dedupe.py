@@ -0,0 +1,69 @@
+import sqlite3
+import time
+
+import pytest
+
+from db.url_dedupe import BloomFilter, SeenStore, normalize_url
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("HTTP://WWW.Example.com/News/", "https://example.com/News"),
+    ("https://example.com:443/a?b=2&a=1#comments", "https://example.com/a?a=1&b=2"),
+    ("http://example.com:8080/a", "https://example.com:8080/a"),
+    ("https://example.com/a?utm_source=x&UTM_Medium=y&fbclid=z&id=7", "https://example.com/a?id=7"),
+    ("https://example.com", "https://example.com/"),
+    ("  https://m.example.com/a?q=  ", "https://m.example.com/a?q="),
+])
+def test_normalize_url(raw, expected):
+    assert normalize_url(raw) == expected
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, fp_rate=0.01)
+    keys = [f"url:https://example.com/{i}" for i in range(1000)]
+    for k in keys:
+        bloom.add(k)
+
+    assert all(k in bloom for k in keys)
+    false_hits = sum(f"url:https://other.org/{i}" in bloom for i in range(10_000))
+    assert false_hits < 300
+
+
+def _item(url, title="", snippet=""):
+    return {"url": url, "title": title, "snippet": snippet}
+
+
+def test_filter_new_dedupes_by_url_and_content(tmp_path):
+    seen = SeenStore(path=str(tmp_path / "seen.db"))
+    batch = [
+        _item("https://example.com/a?utm_source=x", "Road closed", "A40 shut"),
+        _item("http://www.example.com/a/"),                                  # same URL
+        _item("https://mirror.org/story", "ROAD  closed", "a40 shut"),       # same content
+        _item("https://example.com/b", "Fire in Camden"),
+        {"title": ""},                                                       # no keys at all
+    ]
+    assert [it["url"] for it in seen.filter_new(batch)] == ["https://example.com/a?utm_source=x",
+                                                            "https://example.com/b"]
+
+    # a restart keeps what was seen
+    again = SeenStore(path=str(tmp_path / "seen.db"))
+    assert again.filter_new([_item("https://example.com/b"), _item("https://example.com/c")]) == [
+        _item("https://example.com/c")]
+
+
+def test_keys_expire_after_the_ttl(tmp_path):
+    path = str(tmp_path / "seen.db")
+    seen = SeenStore(path=path, ttl_days=1)
+    assert len(seen.filter_new([_item("https://example.com/a"), _item("https://example.com/b")])) == 2
+
+    # age /a past the TTL
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE seen_items SET seen_at = ? WHERE key LIKE 'url:%/a'", (time.time() - 2 * 86400,))
+
+    assert seen.filter_new([_item("https://example.com/a"), _item("https://example.com/b")]) == [
+        _item("https://example.com/a")]
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE seen_items SET seen_at = ?", (time.time() - 2 * 86400,))
+    assert seen.purge() == 2
+    assert "url:https://example.com/a" not in seen.bloom
@@ -0,0 +1,34 @@
+import asyncio
+
+from live_pipeline.clients import FakeAsyncPerplexity, FakePerplexity, FakeProfile
+from live_pipeline.validator_agent import ValidatorAgent
+from utils import TokenBucket
+
+
+def _items(n):
+    return [{"title": f"Road closed #{i}", "url": f"https://example.com/{i}", "snippet": "Police closed the road."}
+            for i in range(n)]
+
+
+def test_validator_works_across_event_loops():
+    profile = FakeProfile(latency_ms=1, error_rate=0.0)
+    # a burst of 4 at 200/s, so later requests queue on the limiter's lock
+    agent = ValidatorAgent(client=FakePerplexity(profile), async_client=FakeAsyncPerplexity(profile),
+                           concurrency=4, rate_per_sec=200, max_retries=0)
+    for _ in range(2):
+        results = asyncio.run(agent.validate_each(_items(12)))
+        assert all(r is not None for r in results)
+
+
+def test_token_bucket_paces_after_its_burst():
+    bucket = TokenBucket(rate_per_sec=100, capacity=2)   # no running loop needed
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        for _ in range(6):
+            await bucket.acquire()
+        return loop.time() - t0
+
+    # 2 free, then 4 more at 10 ms each
+    assert 0.03 <= asyncio.run(main()) < 0.5
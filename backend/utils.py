@@ -0,0 +1,136 @@
+import asyncio
+import math
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Async rate limiter: `rate_per_sec` tokens refill continuously up to
+    `capacity`; acquire() waits until enough are available. Waiters are
+    served in arrival order. Like any asyncio lock-holder, a bucket belongs
+    to the event loop that first waits on it.
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        # set on the first acquire(), which has a running loop to read time from
+        self.updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                now = asyncio.get_running_loop().time()
+                elapsed = now - self.updated if self.updated is not None else 0.0
+                self.updated = now
+
+                # refill
+                self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+
+                needed = amount - self.tokens
+                wait_s = needed / self.rate if self.rate > 0 else 0.1
+                await asyncio.sleep(max(0.01, wait_s))
+
+
+class LatencyHistogram:
+    """
+    Durations counted in log-spaced buckets (BUCKETS_PER_DECADE per 10x,
+    from 0.1 ms to ~1000 s), so memory is fixed however many are observed.
+    Percentiles are bucket upper bounds, capped at the largest value seen.
+    """
+
+    BUCKETS_PER_DECADE = 4
+    MIN_MS = 0.1
+    N_BUCKETS = 28
+
+    def __init__(self):
+        self.counts = [0] * (self.N_BUCKETS + 1)   # last one is overflow
+        self.n = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def _bound_ms(self, i: int) -> float:
+        return self.MIN_MS * 10 ** (i / self.BUCKETS_PER_DECADE)
+
+    def observe(self, seconds: float) -> None:
+        ms = max(seconds * 1000, self.MIN_MS)
+        i = math.ceil(round(math.log10(ms / self.MIN_MS) * self.BUCKETS_PER_DECADE, 9))
+        self.counts[min(i, self.N_BUCKETS)] += 1
+        self.n += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound (ms) of the bucket holding the q-quantile, 0 <= q <= 1.
+        """
+        if not self.n:
+            return 0.0
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(self._bound_ms(i), self.max_s * 1000) if i < self.N_BUCKETS else self.max_s * 1000
+        return self.max_s * 1000
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.n,
+            "mean_ms": round(1000 * self.total_s / self.n, 2) if self.n else None,
+            "p50_ms": round(self.percentile(0.5), 2),
+            "p90_ms": round(self.percentile(0.9), 2),
+            "p99_ms": round(self.percentile(0.99), 2),
+            "max_ms": round(self.max_s * 1000, 2),
+            # upper bound (ms) -> count, non-empty buckets only
+            "buckets": {
+                (f"{self._bound_ms(i):g}" if i < self.N_BUCKETS else "inf"): c
+                for i, c in enumerate(self.counts) if c
+            },
+        }
+
+
+class StageStats:
+    """
+    Throughput of one pipeline stage: items and batches handled, time spent
+    on them (with a per-batch latency histogram) and the depth of its input
+    queue, sampled whenever something is put on it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.busy_s = 0.0
+        self.latency = LatencyHistogram()
+        self.max_queue = 0
+        self._queue_total = 0
+        self._queue_samples = 0
+
+    def add(self, items: int, busy_s: float) -> None:
+        self.batches += 1
+        self.items += items
+        self.busy_s += busy_s
+        self.latency.observe(busy_s)
+
+    def queued(self, depth: int) -> None:
+        self.max_queue = max(self.max_queue, depth)
+        self._queue_total += depth
+        self._queue_samples += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "items_per_s": round(self.items / self.busy_s, 1) if self.busy_s > 0 else None,
+            "max_queue": self.max_queue,
+            "mean_queue": round(self._queue_total / self._queue_samples, 2) if self._queue_samples else None,
+            "batch_latency": self.latency.as_dict(),
+        }
@@ -5,6 +5,7 @@ type Post = {
   id: number;
   content: string;
   severity: number;
+  status: "pending" | "classified" | "failed";
   distance: number;
   timestamp: number;
 };
@@ -40,7 +41,6 @@ export default function LocationPage() {
         lat,
         lng,
         content: newPost,
-        severity: 1.0,
       }),
     });
 
@@ -111,9 +111,11 @@ export default function LocationPage() {
 }
 
 function computeRisk(posts: Post[]) {
-  if (posts.length === 0) return "Low";
+  // only classified posts carry a model severity
+  const scored = posts.filter(p => p.status === "classified");
+  if (scored.length === 0) return "Low";
 
-  const totalSeverity = posts.reduce(
+  const totalSeverity = scored.reduce(
     (sum, p) => sum + p.severity,
     0
   );
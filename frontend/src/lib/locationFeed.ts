@@ -2,14 +2,17 @@ export type Post = {
   id: number;
   content: string;
   severity: number;
+  status: "pending" | "classified" | "failed";
   distance: number;
   timestamp: number;
 };
 
 export function computeRisk(posts: Post[]) {
-  if (posts.length === 0) return "Low";
+  // only classified posts carry a model severity
+  const scored = posts.filter(p => p.status === "classified");
+  if (scored.length === 0) return "Low";
 
-  const totalSeverity = posts.reduce((sum, p) => sum + p.severity, 0);
+  const totalSeverity = scored.reduce((sum, p) => sum + p.severity, 0);
   if (totalSeverity > 5) return "High";
   if (totalSeverity > 2) return "Moderate";
   return "Low";
@@ -47,7 +47,6 @@ export default function LocationFeedPage() {
           lat,
           lng,
           content: newPost.trim(),
-          severity: 1.0,
         }),
       });
       setNewPost("");
@@ -109,7 +108,9 @@ export default function LocationFeedPage() {
                       <div style={ui.meta}>
                         <span>{Math.round(post.distance)}m away</span>
                         <span style={ui.dot}>•</span>
-                        <span>severity {post.severity.toFixed(1)}</span>
+                        <span>
+                          {post.status === "classified" ? `severity ${post.severity.toFixed(1)}` : post.status}
+                        </span>
                         <span style={ui.dot}>•</span>
                         <span>{post.timestamp ? timeAgo(post.timestamp) : "now"}</span>
                       </div>